@@ -159,3 +159,88 @@ DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
 AUTH_USER_MODEL = 'core.User'
 LOGIN_URL = '/login/'
 LOGOUT_REDIRECT_URL = '/'
+
+# -------------------
+# FACE RECOGNITION
+# -------------------
+# Seconds between each worker's check for gallery changes made by other workers
+FACE_GALLERY_SYNC_INTERVAL = int(os.getenv("FACE_GALLERY_SYNC_INTERVAL", "5"))
+# Seconds to keep gallery change log entries; idle workers reload fully after this
+FACE_GALLERY_CHANGE_RETENTION = int(os.getenv("FACE_GALLERY_CHANGE_RETENTION", str(24 * 60 * 60)))
+# Consolidated gallery file memory-mapped read-only by every worker
+FACE_GALLERY_FILE = os.getenv("FACE_GALLERY_FILE", str(BASE_DIR / "encodings" / "gallery.bin"))
+# Minimum seconds between rewrites of the gallery file after changes
+FACE_GALLERY_FILE_REBUILD_INTERVAL = int(os.getenv("FACE_GALLERY_FILE_REBUILD_INTERVAL", "30"))
+# Recognition worker processes per web process (0 runs recognition inline)
+FACE_RECOGNITION_WORKERS = int(os.getenv("FACE_RECOGNITION_WORKERS", "2"))
+# Frames allowed to wait for a free worker before answering "busy"
+FACE_RECOGNITION_QUEUE_SIZE = int(os.getenv("FACE_RECOGNITION_QUEUE_SIZE", "4"))
+# Seconds a request waits for its recognition result
+FACE_RECOGNITION_TIMEOUT = float(os.getenv("FACE_RECOGNITION_TIMEOUT", "5"))
+# Mean grayscale difference (0-255) below which a camera's scene counts as unchanged
+FRAME_GATE_DIFF_THRESHOLD = float(os.getenv("FRAME_GATE_DIFF_THRESHOLD", "4"))
+# Seconds a recognition result is replayed for an unchanged scene
+FRAME_GATE_RESULT_TTL = float(os.getenv("FRAME_GATE_RESULT_TTL", "3"))
+# Seconds a kiosk check-in answer is reused for repeat recognitions of a student
+CHECKIN_CACHE_TTL = int(os.getenv("CHECKIN_CACHE_TTL", "300"))
+# Cache holding those answers; it must be shared by all web workers so that
+# manual marking invalidates them everywhere: Redis when REDIS_URL is set,
+# otherwise the database cache table (`python manage.py createcachetable`)
+CHECKIN_CACHE_ALIAS = "checkins"
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    CHECKIN_CACHE_ALIAS: {
+        "BACKEND": "django.core.cache.backends.redis.RedisCache",
+        "LOCATION": os.getenv("REDIS_URL"),
+        "KEY_PREFIX": "attendance",
+    } if os.getenv("REDIS_URL") else {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "core_checkin_cache",
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+}
+# Seconds a tracked face survives without being detected
+FACE_TRACK_MAX_AGE = float(os.getenv("FACE_TRACK_MAX_AGE", "1.5"))
+# Seconds a tracked face reuses its identity before it is encoded again
+FACE_TRACK_REFRESH_INTERVAL = float(os.getenv("FACE_TRACK_REFRESH_INTERVAL", "3"))
+# Nearest-neighbour search: 'auto' (IVF index from FACE_INDEX_MIN_SIZE encodings), 'ivf' or 'brute'
+FACE_INDEX = os.getenv("FACE_INDEX", "auto")
+FACE_INDEX_MIN_SIZE = int(os.getenv("FACE_INDEX_MIN_SIZE", "20000"))
+# IVF clusters (0 = about sqrt(N)) and clusters searched per face; see benchmark_face_index
+FACE_INDEX_LISTS = int(os.getenv("FACE_INDEX_LISTS", "0"))
+FACE_INDEX_PROBES = int(os.getenv("FACE_INDEX_PROBES", "8"))
+# Worker processes used to encode photos by the import_students command (0 = CPU count)
+BULK_IMPORT_WORKERS = int(os.getenv("BULK_IMPORT_WORKERS", "0"))
+# Worker processes per web process for background photo encoding (admin bulk imports, re-encoding jobs)
+BACKGROUND_ENCODING_WORKERS = int(os.getenv("BACKGROUND_ENCODING_WORKERS", "1"))
+# Seconds a background re-encoding job waits for a free background encoding worker before retrying
+ENCODING_JOB_RETRY_DELAY = float(os.getenv("ENCODING_JOB_RETRY_DELAY", "2"))
+# Extra face encodings kept per student besides the profile photo (enrollment photos, kiosk captures)
+FACE_ENCODINGS_PER_STUDENT = int(os.getenv("FACE_ENCODINGS_PER_STUDENT", "5"))
+# Keep confident kiosk matches as extra 'kiosk' encodings so the gallery follows appearance changes
+FACE_ENRICHMENT_ENABLED = os.getenv("FACE_ENRICHMENT_ENABLED", "False").lower() == "true"
+# Maximum match distance of a face sampled for enrichment (well below the 0.45 kiosk tolerance)
+FACE_ENRICHMENT_DISTANCE = float(os.getenv("FACE_ENRICHMENT_DISTANCE", "0.3"))
+# Minimum distance from all of a student's encodings for a sample to be kept
+FACE_ENRICHMENT_MIN_DIVERSITY = float(os.getenv("FACE_ENRICHMENT_MIN_DIVERSITY", "0.15"))
+# Kiosk samples kept per student (oldest replaced first), and seconds between samples of a student
+FACE_ENRICHMENT_MAX_SAMPLES = int(os.getenv("FACE_ENRICHMENT_MAX_SAMPLES", "3"))
+FACE_ENRICHMENT_INTERVAL = int(os.getenv("FACE_ENRICHMENT_INTERVAL", "3600"))
+# Server-side camera ingestion (manage.py ingest_cameras): frames buffered per camera, and reconnect delay in seconds
+CAMERA_INGEST_BUFFER_SIZE = int(os.getenv("CAMERA_INGEST_BUFFER_SIZE", "2"))
+CAMERA_RECONNECT_DELAY = float(os.getenv("CAMERA_RECONNECT_DELAY", "5"))
+# Seconds between "camera open" heartbeats from ingest_cameras (read by the health prober)
+CAMERA_INGEST_HEARTBEAT = float(os.getenv("CAMERA_INGEST_HEARTBEAT", "15"))
+# Seconds between camera health probe rounds of `manage.py probe_cameras --watch`, and per-camera probe timeout
+CAMERA_PROBE_INTERVAL = int(os.getenv("CAMERA_PROBE_INTERVAL", "60"))
+CAMERA_PROBE_TIMEOUT = float(os.getenv("CAMERA_PROBE_TIMEOUT", "5"))
+# Per-camera recognition queue: frames waiting per camera, and seconds before a waiting frame is dropped as stale
+FACE_SCHEDULER_QUEUE_SIZE = int(os.getenv("FACE_SCHEDULER_QUEUE_SIZE", "2"))
+FACE_SCHEDULER_DEADLINE = float(os.getenv("FACE_SCHEDULER_DEADLINE", "2"))
+# Micro-batching: frames encoded together in one dlib call, and seconds the scheduler waits for a batch to fill (0 = no wait)
+FACE_ENCODE_BATCH_SIZE = int(os.getenv("FACE_ENCODE_BATCH_SIZE", "4"))
+FACE_ENCODE_BATCH_WINDOW = float(os.getenv("FACE_ENCODE_BATCH_WINDOW", "0.005"))
+# Point the kiosk at the async recognition endpoints (enable when serving with an ASGI server, e.g. uvicorn attendance_system.asgi:application)
+ASYNC_RECOGNITION_API = os.getenv("ASYNC_RECOGNITION_API", "False").lower() == "true"
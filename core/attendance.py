@@ -0,0 +1,173 @@
+"""
+Check-in marking shared by the kiosk views and the headless camera ingest.
+
+The recognition engine only answers "which student is this face"; the
+functions here turn those matches into AttendanceRecords using the cutoff
+times in AttendanceSettings, and keep the check-in cache (checkin_cache.py) in
+step so repeat recognitions of the same student skip the database.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .checkin_cache import recent_checkins
+from .models import AttendanceRecord, AttendanceSettings, User
+
+
+def session_mismatch_payload(student):
+    """JSON fields reported when a recognized student is outside the selected course/semester."""
+    return {
+        'status': 'session_mismatch',
+        'name': student.name,
+        'user_id': student.id,
+        'message': f'Choose correct session – student not in selected course/semester. Student is in {student.course.name} - {student.semester.name}.',
+        'student_course': student.course.name if student.course else 'N/A',
+        'student_semester': student.semester.name if student.semester else 'N/A'
+    }
+
+
+def is_in_selected_session(student, selected_course_id, selected_semester_id):
+    """Checks if a student belongs to the course and semester of the attendance session."""
+    return str(student.course_id) == str(selected_course_id) and str(student.semester_id) == str(selected_semester_id)
+
+
+def check_in_status(now_time, time_settings):
+    """Attendance status for a check-in at now_time, from the cutoff times."""
+    if now_time <= time_settings.present_cutoff:
+        return 'present'
+    if now_time <= time_settings.late_cutoff:
+        return 'late'
+    return 'absent'
+
+
+def mark_check_in(student, today, now_time, time_settings):
+    """
+    Marks check-in for a recognized student using the attendance cutoff times.
+    Only the first recognition of the day creates the record.
+    Returns (attendance status text shown on the kiosk, record status).
+    """
+    status = check_in_status(now_time, time_settings)
+
+    # Use get_or_create: marks attendance only on the *first* recognition of the day
+    record, created = AttendanceRecord.objects.get_or_create(
+        student=student,
+        date=today,
+        defaults={
+            'status': status,
+            'check_in_time': now_time,
+            'manually_marked': False
+        }
+    )
+
+    # If record exists but no check-in time, update it
+    if not created and not record.check_in_time:
+        record.check_in_time = now_time
+        record.status = status
+        record.save()
+
+    if created:
+        return f"Marked {status.title()}", record.status
+    # If already marked, don't change the status
+    return f"Already marked {record.status.title()}", record.status
+
+
+async def amark_check_in(student, today, now_time, time_settings):
+    """Async ORM version of mark_check_in for the async kiosk endpoint."""
+    status = check_in_status(now_time, time_settings)
+    record, created = await AttendanceRecord.objects.aget_or_create(
+        student=student,
+        date=today,
+        defaults={
+            'status': status,
+            'check_in_time': now_time,
+            'manually_marked': False
+        }
+    )
+    if not created and not record.check_in_time:
+        await AttendanceRecord.objects.filter(pk=record.pk).aupdate(check_in_time=now_time, status=status)
+        record.status = status
+
+    if created:
+        return f"Marked {status.title()}", record.status
+    return f"Already marked {record.status.title()}", record.status
+
+
+def cached_check_in_payload(payload, record_status=None):
+    """The kiosk answer replayed for repeat recognitions: successful check-ins become "Already marked"."""
+    payload = {k: v for k, v in payload.items() if k not in ('box', 'distance')}
+    if record_status is not None:
+        payload['attendance_status'] = f"Already marked {record_status.title()}"
+    return payload
+
+
+def remember_check_in(selected_course_id, selected_semester_id, today, payload, record_status=None):
+    """Caches the kiosk answer for a student so repeat recognitions skip the DB."""
+    payload = cached_check_in_payload(payload, record_status)
+    recent_checkins.put(selected_course_id, selected_semester_id, payload['user_id'], today, payload)
+
+
+async def aremember_check_in(selected_course_id, selected_semester_id, today, payload, record_status=None):
+    """remember_check_in for async views."""
+    payload = cached_check_in_payload(payload, record_status)
+    await recent_checkins.aput(selected_course_id, selected_semester_id, payload['user_id'], today, payload)
+
+
+def recognize_all_faces(face_locations, matches, selected_course_id, selected_semester_id):
+    """
+    Multi-face mode: every face in the frame was matched in one batched
+    distance computation; marks attendance for all recognized students in a
+    single transaction. Returns the JSON payload with a per-face result list.
+    """
+    current_datetime = timezone.localtime()
+    today = current_datetime.date()
+    now_time = current_datetime.time()
+
+    # Students answered recently need no DB work at all
+    cached = {}
+    for student_id, _, _ in matches:
+        if student_id is not None and student_id not in cached:
+            payload = recent_checkins.get(selected_course_id, selected_semester_id, student_id, today)
+            if payload is not None:
+                cached[student_id] = payload
+    uncached_ids = {student_id for student_id, _, _ in matches if student_id is not None and student_id not in cached}
+    students = User.objects.select_related('course', 'semester').in_bulk(uncached_ids) if uncached_ids else {}
+    time_settings = AttendanceSettings.get_instance() if uncached_ids else None
+
+    faces = []
+    with transaction.atomic():
+        for (top, right, bottom, left), (student_id, distance, in_scope) in zip(face_locations, matches):
+            face = {
+                'box': {'top': top, 'right': right, 'bottom': bottom, 'left': left},
+                'distance': round(distance, 4) if distance is not None else None,
+            }
+            student = students.get(student_id) if student_id is not None else None
+            if student_id in cached:
+                face.update(cached[student_id])
+            elif student is None:
+                face.update({'status': 'not_recognized', 'message': 'Face detected, but not recognized.'})
+            elif not is_in_selected_session(student, selected_course_id, selected_semester_id):
+                face.update(session_mismatch_payload(student))
+                remember_check_in(selected_course_id, selected_semester_id, today, face)
+            else:
+                attendance_status, record_status = mark_check_in(student, today, now_time, time_settings)
+                face.update({
+                    'status': 'success',
+                    'name': student.name,
+                    'user_id': student.id,
+                    'attendance_status': attendance_status
+                })
+                remember_check_in(selected_course_id, selected_semester_id, today, face, record_status)
+                # Don't mark the same student twice if they appear twice in the frame
+                cached[student_id] = {k: v for k, v in face.items() if k not in ('box', 'distance')}
+            faces.append(face)
+
+    print(f"[Face Match Debug] Multi-face frame: {len(faces)} face(s), {sum(f['status'] == 'success' for f in faces)} recognized")
+
+    # Top-level fields mirror the first notable face so single-face clients keep working
+    payload = {'faces': faces, 'recognized_count': sum(f['status'] == 'success' for f in faces)}
+    primary = next((f for f in faces if f['status'] == 'success'), None) or \
+        next((f for f in faces if f['status'] == 'session_mismatch'), None)
+    if primary:
+        payload.update({k: v for k, v in primary.items() if k not in ('box', 'distance')})
+    else:
+        payload.update({'status': 'not_recognized', 'message': 'Face detected, but not recognized.'})
+    return payload
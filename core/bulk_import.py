@@ -0,0 +1,477 @@
+"""
+Bulk student registration from a roster (CSV or XLSX) and a ZIP of photos.
+
+Used by the `import_students` management command and the admin upload page.
+Rows are validated up front, photos are decoded and encoded through the
+encoding cache in a process pool (together with the password hashing, which is
+just as CPU-bound), and every new face is checked against the enrolled students
+and the rest of the batch with matrix distance computations. Valid rows are then
+created with a single bulk_create, with face_image_hash set so generate_encodings
+skips them. Every row gets a result line in the returned report.
+
+Roster columns (header row, case-insensitive):
+    username, name, roll_no, department, course, session, semester  (required)
+    email, contact, password, photo                                 (optional)
+
+department/course/semester are matched by name or id, session by year or id.
+`photo` names a file inside the ZIP; without it the importer looks for
+<roll_no>.<ext> and then <username>.<ext>.
+
+The admin page does not import inside the request: it stores the upload as a
+StudentImport and import_jobs runs it in a background thread, encoding on the
+shared background engine (BACKGROUND_ENCODING_WORKERS) instead of starting a
+pool per upload. Like encoding jobs, queued imports are kept in memory only.
+"""
+import csv
+import functools
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+REQUIRED_COLUMNS = ('username', 'name', 'roll_no', 'department', 'course', 'session', 'semester')
+OPTIONAL_COLUMNS = ('email', 'contact', 'password', 'photo')
+PHOTO_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.heic')
+BULK_CREATE_BATCH_SIZE = 200
+
+# Result statuses reported per row
+CREATED = 'created'
+WOULD_CREATE = 'would_create'
+INVALID = 'invalid'
+NO_FACE = 'no_face'
+DUPLICATE = 'duplicate'
+ERROR = 'error'
+
+
+def import_workers():
+    """Worker processes used for encoding by the command (BULK_IMPORT_WORKERS setting, default: CPU count)."""
+    return getattr(settings, 'BULK_IMPORT_WORKERS', None) or os.cpu_count() or 1
+
+
+# --- Reading the upload ---
+def read_roster(roster_file, filename):
+    """Parses a CSV or XLSX roster into a list of dicts keyed by lower-case column name."""
+    if filename.lower().endswith(('.xlsx', '.xlsm')):
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(roster_file, read_only=True, data_only=True)
+        rows = workbook.active.iter_rows(values_only=True)
+        header = next(rows, None) or ()
+        columns = [str(value or '').strip().lower() for value in header]
+        roster = []
+        for values in rows:
+            if not any(value not in (None, '') for value in values):
+                continue
+            roster.append({
+                column: '' if value is None else str(value).strip()
+                for column, value in zip(columns, values) if column
+            })
+        workbook.close()
+        return roster
+
+    content = roster_file.read()
+    if isinstance(content, bytes):
+        content = content.decode('utf-8-sig')
+    reader = csv.DictReader(io.StringIO(content))
+    return [
+        {(column or '').strip().lower(): (value or '').strip() for column, value in row.items()}
+        for row in reader
+        if any((value or '').strip() for value in row.values() if isinstance(value, str))
+    ]
+
+
+def read_photos(zip_source):
+    """Returns {lower-case file name: bytes} for the images in a ZIP archive (folders ignored)."""
+    photos = {}
+    with zipfile.ZipFile(zip_source) as archive:
+        for info in archive.infolist():
+            name = os.path.basename(info.filename)
+            if info.is_dir() or name.startswith('.') or not name.lower().endswith(PHOTO_EXTENSIONS):
+                continue
+            photos[name.lower()] = archive.read(info)
+    return photos
+
+
+def find_photo(row, photos):
+    """Picks the ZIP entry for a roster row. Returns (file name, bytes) or (None, None)."""
+    if row.get('photo'):
+        name = os.path.basename(row['photo']).lower()
+        return (name, photos[name]) if name in photos else (None, None)
+    for stem in (row.get('roll_no'), row.get('username')):
+        if not stem:
+            continue
+        for extension in PHOTO_EXTENSIONS:
+            name = f"{stem}{extension}".lower()
+            if name in photos:
+                return name, photos[name]
+    return None, None
+
+
+# --- Pool work ---
+@functools.lru_cache(maxsize=None)
+def register_heic_opener():
+    """Lets Pillow read .heic photos when pillow_heif is installed."""
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
+def _init_worker():
+    """Sets up Django (for the encoding cache) in spawned pool workers."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+    import django
+    django.setup()
+
+
+def prepare_student(photo, password):
+    """
+    Runs in a pool worker: encodes the face in a photo through the encoding
+    cache and hashes the password.
+    Returns (encoding or None, error message or None, password hash, photo hash).
+    """
+    from django.contrib.auth.hashers import make_password
+    from .encoding_cache import encode_photo_cached
+    from .face_pipeline import photo_hash
+
+    register_heic_opener()
+    password_hash = make_password(password)
+    image_hash = photo_hash(photo)
+    try:
+        _, encoding, _ = encode_photo_cached(photo)
+    except Exception as e:
+        return None, f"Could not read image: {e}", password_hash, image_hash
+    if encoding is None:
+        return None, "No face detected in the photo.", password_hash, image_hash
+    return encoding, None, password_hash, image_hash
+
+
+def prepare_students(jobs, workers, engine=None):
+    """
+    Runs prepare_student for every (photo, password) job: on the pool of a
+    shared RecognitionEngine when one is given, otherwise in a pool of its own
+    when workers > 1.
+    """
+    if engine is not None and jobs:
+        return engine.map(prepare_student, *zip(*jobs))
+    if workers <= 1 or len(jobs) <= 1:
+        return [prepare_student(photo, password) for photo, password in jobs]
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(
+        max_workers=min(workers, len(jobs)), mp_context=context, initializer=_init_worker
+    ) as executor:
+        return list(executor.map(prepare_student, *zip(*jobs), chunksize=4))
+
+
+# --- Duplicate detection ---
+def find_duplicate_faces(encodings, tolerance):
+    """
+    Checks a batch of new encodings (B, 128) against the recognition gallery,
+    students awaiting authorization and each other. Each comparison set is one
+    distance matrix. Returns, per encoding, None or (kind, student_id or batch
+    index, distance) for its closest conflict, where kind is 'enrolled' or 'batch'.
+    Within the batch, the later of two matching rows is the duplicate.
+    """
+    from .face_gallery import FaceGallery, get_gallery, pending_gallery
+
+    conflicts = [None] * len(encodings)
+    if not len(encodings):
+        return conflicts
+
+    for gallery in (get_gallery(), pending_gallery()):
+        if not len(gallery):
+            continue
+        distances = gallery.distance_matrix(encodings)
+        best_rows = np.argmin(distances, axis=1)
+        for i, row in enumerate(best_rows):
+            distance = float(distances[i, row])
+            if distance <= tolerance and (conflicts[i] is None or distance < conflicts[i][2]):
+                conflicts[i] = ('enrolled', int(gallery.ids[row]), distance)
+
+    batch = FaceGallery(encodings, np.arange(len(encodings)))
+    distances = batch.distance_matrix(encodings)
+    # Only compare each row with the rows before it
+    distances[np.triu_indices(len(encodings))] = np.inf
+    best_rows = np.argmin(distances, axis=1)
+    for i, row in enumerate(best_rows):
+        distance = float(distances[i, row])
+        if conflicts[i] is None and distance <= tolerance:
+            conflicts[i] = ('batch', int(row), distance)
+    return conflicts
+
+
+# --- Import ---
+class Lookup:
+    """
+    Case-insensitive name (or id) lookup for the foreign keys named in a roster.
+    With a scope field (e.g. a course's department) names are resolved within the scope.
+    """
+
+    def __init__(self, queryset, field, scope=None):
+        self.scope = scope
+        self.by_name = {}
+        self.by_id = {}
+        for obj in queryset:
+            scope_id = getattr(obj, scope) if scope else None
+            self.by_name[(scope_id, str(getattr(obj, field)).strip().lower())] = obj
+            self.by_id[str(obj.pk)] = obj
+
+    def get(self, value, scope_id=None):
+        value = (value or '').strip()
+        return self.by_name.get((scope_id, value.lower())) or self.by_id.get(value)
+
+
+def import_students(roster_file, roster_name, photos_zip, default_password=None, authorize=False,
+                    dry_run=False, workers=None, tolerance=None, engine=None):
+    """
+    Imports students from a roster and a ZIP of photos, encoding on `engine`
+    (a RecognitionEngine) when given, else in a pool of `workers` processes.
+    Returns a list of per-row results: dicts with 'row' (spreadsheet line),
+    'username', 'roll_no', 'status' and 'message'.
+    """
+    from django.core.files.base import ContentFile
+    from django.core.files.storage import default_storage
+    from django.db import transaction
+    from django.utils.text import slugify
+
+    from .face_gallery import DUPLICATE_TOLERANCE, publish_student_change
+    from .models import Course, Department, Semester, Session, User, pack_encoding
+
+    tolerance = DUPLICATE_TOLERANCE if tolerance is None else tolerance
+    workers = import_workers() if workers is None else workers
+
+    roster = read_roster(roster_file, roster_name)
+    photos = read_photos(photos_zip)
+    results = [{
+        'row': number,
+        'username': row.get('username', ''),
+        'roll_no': row.get('roll_no', ''),
+        'status': None,
+        'message': '',
+    } for number, row in enumerate(roster, start=2)]
+
+    def reject(i, status, message):
+        results[i]['status'] = status
+        results[i]['message'] = message
+
+    departments = Lookup(Department.objects.all(), 'name')
+    courses = Lookup(Course.objects.all(), 'name', scope='department_id')
+    sessions = Lookup(Session.objects.all(), 'year')
+    semesters = Lookup(Semester.objects.all(), 'name')
+
+    usernames = [row.get('username', '') for row in roster]
+    roll_nos = [row.get('roll_no', '') for row in roster]
+    taken_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    taken_roll_nos = set(User.objects.filter(roll_no__in=roll_nos).values_list('roll_no', flat=True))
+    seen_usernames = set()
+    seen_roll_nos = set()
+
+    # --- Validate rows ---
+    candidates = []
+    for i, row in enumerate(roster):
+        missing = [column for column in REQUIRED_COLUMNS if not row.get(column)]
+        if missing:
+            reject(i, INVALID, f"Missing {', '.join(missing)}.")
+            continue
+        username, roll_no = row['username'], row['roll_no']
+        if username in taken_usernames or username in seen_usernames:
+            reject(i, INVALID, "A user with this username already exists.")
+            continue
+        if roll_no in taken_roll_nos or roll_no in seen_roll_nos:
+            reject(i, INVALID, "A student with this Roll Number already exists.")
+            continue
+        department = departments.get(row['department'])
+        foreign_keys = {
+            'department': department,
+            'course': courses.get(row['course'], department.pk if department else None),
+            'session': sessions.get(row['session']),
+            'semester': semesters.get(row['semester']),
+        }
+        unknown = [name for name, obj in foreign_keys.items() if obj is None]
+        if unknown:
+            reject(i, INVALID, f"Unknown {', '.join(unknown)}.")
+            continue
+        password = row.get('password') or default_password
+        if not password:
+            reject(i, INVALID, "No password given and no default password set.")
+            continue
+        photo_name, photo = find_photo(row, photos)
+        if photo is None:
+            reject(i, INVALID, "Photo not found in the ZIP archive.")
+            continue
+        seen_usernames.add(username)
+        seen_roll_nos.add(roll_no)
+        candidates.append((i, row, foreign_keys, password, photo_name, photo))
+
+    # --- Encode faces and hash passwords in parallel ---
+    prepared = prepare_students([(photo, password) for _, _, _, password, _, photo in candidates], workers, engine)
+    encoded = []
+    for candidate, (encoding, error, password_hash, image_hash) in zip(candidates, prepared):
+        if encoding is None:
+            reject(candidate[0], NO_FACE if error and error.startswith('No face') else ERROR, error)
+        else:
+            encoded.append((candidate, encoding, password_hash, image_hash))
+
+    # --- Duplicate faces, against enrolled students and within the batch ---
+    encodings = np.array([encoding for _, encoding, _, _ in encoded], dtype=np.float32).reshape(-1, 128)
+    conflicts = find_duplicate_faces(encodings, tolerance)
+    enrolled_ids = [conflict[1] for conflict in conflicts if conflict and conflict[0] == 'enrolled']
+    enrolled = User.objects.in_bulk(enrolled_ids)
+
+    new_students = []
+    for (candidate, encoding, password_hash, image_hash), conflict in zip(encoded, conflicts):
+        i, row, foreign_keys, _, photo_name, photo = candidate
+        if conflict is not None:
+            kind, other, distance = conflict
+            if kind == 'enrolled':
+                student = enrolled.get(other)
+                who = f"'{student.name}' (Roll No: {student.roll_no})" if student else f"student #{other}"
+                reject(i, DUPLICATE, f"Face already registered to {who}, distance {distance:.2f}.")
+            else:
+                reject(i, DUPLICATE, f"Same face as roster line {results[encoded[other][0][0]]['row']}, distance {distance:.2f}.")
+            continue
+        new_students.append((i, row, foreign_keys, password_hash, photo_name, photo, encoding, image_hash))
+
+    if dry_run:
+        for i, *_ in new_students:
+            reject(i, WOULD_CREATE, "Ready to import.")
+        return results
+
+    # --- Create users in bulk ---
+    saved_files = []
+    users = []
+    try:
+        for i, row, foreign_keys, password_hash, photo_name, photo, encoding, image_hash in new_students:
+            extension = os.path.splitext(photo_name)[1].lower()
+            image_name = default_storage.save(
+                f"profile_pics/{slugify(row['username'])}_profile{extension}", ContentFile(photo)
+            )
+            saved_files.append(image_name)
+            users.append(User(
+                username=row['username'],
+                email=row.get('email', ''),
+                password=password_hash,
+                name=row['name'],
+                roll_no=row['roll_no'],
+                contact=row.get('contact') or None,
+                is_student=True,
+                is_admin=False,
+                authorized=authorize,
+                profile_image=image_name,
+                face_encoding=pack_encoding(encoding),
+                face_image_hash=image_hash,
+                **foreign_keys,
+            ))
+        with transaction.atomic():
+            User.objects.bulk_create(users, batch_size=BULK_CREATE_BATCH_SIZE)
+            if authorize:
+                # bulk_create sends no post_save signals, so publish the new gallery rows here
+                created = User.objects.filter(username__in=[user.username for user in users])
+                for student in created:
+                    transaction.on_commit(lambda student=student: publish_student_change(student, row_changed=True))
+    except Exception as e:
+        for image_name in saved_files:
+            default_storage.delete(image_name)
+        for i, *_ in new_students:
+            reject(i, ERROR, f"Import failed, no students were created: {e}")
+        return results
+
+    for i, *_ in new_students:
+        reject(i, CREATED, "Student created." if authorize else "Student created, awaiting authorization.")
+    return results
+
+
+def summarize(results):
+    """Counts results per status."""
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return summary
+
+
+# --- Background imports from the admin page ---
+def run_import_job(job_id, default_password=None, engine=None):
+    """
+    Runs a queued StudentImport and stores its results. The uploaded files are
+    deleted afterwards. Returns the job, or None if it was not queued.
+    """
+    from django.utils import timezone
+
+    from .models import StudentImport
+
+    # Claim the job so it never runs twice
+    if not StudentImport.objects.filter(pk=job_id, status=StudentImport.QUEUED).update(status=StudentImport.RUNNING):
+        return None
+    job = StudentImport.objects.get(pk=job_id)
+    try:
+        with job.roster.open('rb') as roster, job.photos.open('rb') as photos:
+            job.results = import_students(
+                roster, job.roster.name, photos,
+                default_password=default_password,
+                authorize=job.authorize,
+                dry_run=job.dry_run,
+                engine=engine,
+            )
+        job.status = StudentImport.DONE
+    except zipfile.BadZipFile:
+        job.status = StudentImport.FAILED
+        job.message = "The photos file is not a valid ZIP archive."
+    except Exception as e:
+        job.status = StudentImport.FAILED
+        job.message = f"Could not import students: {e}"[:255]
+
+    for upload in (job.roster, job.photos):
+        if upload.name:
+            upload.storage.delete(upload.name)
+    job.roster = job.photos = ''
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'message', 'results', 'roster', 'photos', 'finished_at'])
+    return job
+
+
+class ImportJobQueue:
+    """FIFO of StudentImport ids drained by one background thread per process."""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enqueue(self, job_id, default_password=None):
+        """Schedules a stored StudentImport. The default password is kept in memory only."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='student-imports', daemon=True)
+                self._thread.start()
+        self._queue.put((int(job_id), default_password))
+
+    def pending(self):
+        """Number of imports waiting to run."""
+        return self._queue.qsize()
+
+    def _run(self):
+        from django.db import close_old_connections
+
+        from .recognition_engine import get_background_engine
+
+        while True:
+            job_id, default_password = self._queue.get()
+            close_old_connections()
+            try:
+                job = run_import_job(job_id, default_password, engine=get_background_engine())
+                if job is not None:
+                    print(f"[Bulk Import] Import #{job_id}: {job.status} {summarize(job.results)}")
+            except Exception as e:
+                print(f"[Bulk Import] Import #{job_id} failed: {e}")
+            finally:
+                close_old_connections()
+
+
+import_jobs = ImportJobQueue()
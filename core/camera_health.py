@@ -0,0 +1,234 @@
+"""
+Background health probes for server-side cameras.
+
+Opening a camera with cv2.VideoCapture can block for a long time (an
+unreachable RTSP host, a missing USB device), so it never happens in a request.
+`manage.py probe_cameras --watch` checks every camera concurrently every
+CAMERA_PROBE_INTERVAL seconds; run one per deployment. Web workers never probe
+on a schedule (each would open every camera again), they only run the single
+probe asked for by "Test Connection" in a background thread. Each probe opens the device index or stream URL in its own thread,
+reads a few frames and is abandoned after CAMERA_PROBE_TIMEOUT. The opening
+latency, achieved FPS and any error are stored on the Camera rows in a single
+bulk_update; the camera management page only reads those fields.
+
+Only cameras that are 'active' or 'offline' change status ('active' when
+reachable, 'offline' otherwise), through updates filtered on the status seen
+before the probe, so an admin's change made meanwhile wins. 'inactive' and
+'maintenance' are left as the admin set them but still get probe results.
+
+A camera held open by ingest_cameras (fresh ingest_heartbeat_at) is not
+opened again, since a USB device usually cannot be opened twice; it counts
+as reachable.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .camera_ingest import CAMERA_INGEST_HEARTBEAT, capture_source
+
+# Seconds between probe rounds of `probe_cameras --watch`
+CAMERA_PROBE_INTERVAL = getattr(settings, 'CAMERA_PROBE_INTERVAL', 60)
+# Seconds a single camera probe may take before it counts as unreachable
+CAMERA_PROBE_TIMEOUT = getattr(settings, 'CAMERA_PROBE_TIMEOUT', 5.0)
+# Frames read to measure the achieved frame rate
+CAMERA_PROBE_FRAMES = 10
+# Cameras probed at the same time
+CAMERA_PROBE_CONCURRENCY = 8
+
+# Fields owned by the prober; status is changed separately (see save_probe_results)
+PROBE_FIELDS = ['last_probe_at', 'probe_latency_ms', 'probe_fps', 'probe_error']
+
+
+def held_by_ingest(camera, now=None):
+    """True if a running ingest_cameras reported the camera open recently."""
+    if camera.ingest_heartbeat_at is None:
+        return False
+    now = now or timezone.now()
+    return (now - camera.ingest_heartbeat_at).total_seconds() <= 3 * CAMERA_INGEST_HEARTBEAT
+
+
+def probe_capture(source, frames=CAMERA_PROBE_FRAMES, timeout=CAMERA_PROBE_TIMEOUT):
+    """
+    Opens a capture source, reads up to `frames` frames and closes it (blocking).
+    Returns a dict with 'ok', 'latency_ms', 'fps' and 'error'.
+    """
+    started = time.monotonic()
+    timeout_ms = int(timeout * 1000)
+    params = []
+    # Backend-level timeouts (OpenCV 4.5.2+) so abandoned probes don't linger
+    if hasattr(cv2, 'CAP_PROP_OPEN_TIMEOUT_MSEC'):
+        params = [cv2.CAP_PROP_OPEN_TIMEOUT_MSEC, timeout_ms, cv2.CAP_PROP_READ_TIMEOUT_MSEC, timeout_ms]
+    try:
+        capture = cv2.VideoCapture(source, cv2.CAP_ANY, params) if params else cv2.VideoCapture(source)
+    except Exception as e:
+        return {'ok': False, 'latency_ms': None, 'fps': None, 'error': f"Could not open: {e}"}
+    try:
+        if not capture.isOpened():
+            return {'ok': False, 'latency_ms': None, 'fps': None, 'error': "Camera could not be opened."}
+        ok, _ = capture.read()
+        if not ok:
+            return {'ok': False, 'latency_ms': None, 'fps': None, 'error': "Camera opened but delivered no frame."}
+        first_frame = time.monotonic()
+        read = 0
+        deadline = started + timeout
+        while read < frames - 1 and time.monotonic() < deadline:
+            ok, _ = capture.read()
+            if not ok:
+                break
+            read += 1
+        elapsed = time.monotonic() - first_frame
+        return {
+            'ok': True,
+            'latency_ms': (first_frame - started) * 1000,
+            'fps': read / elapsed if read and elapsed > 0 else None,
+            'error': '',
+        }
+    finally:
+        capture.release()
+
+
+async def probe_cameras(cameras, timeout=CAMERA_PROBE_TIMEOUT, concurrency=CAMERA_PROBE_CONCURRENCY):
+    """Probes cameras concurrently, each bounded by `timeout`. Returns {camera_id: result}."""
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(concurrency)
+    # Own executor: probes stuck inside a driver call must not occupy the loop's default one
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='camera-probe')
+
+    async def probe(camera):
+        if held_by_ingest(camera):
+            return camera.id, {'ok': True, 'latency_ms': None, 'fps': None, 'error': ''}
+        source = capture_source(camera)
+        if source is None:
+            return camera.id, {'ok': False, 'latency_ms': None, 'fps': None, 'error': "No device index or stream URL configured."}
+        async with limit:
+            try:
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(executor, probe_capture, source, CAMERA_PROBE_FRAMES, timeout),
+                    timeout + 1,
+                )
+            except asyncio.TimeoutError:
+                result = {'ok': False, 'latency_ms': None, 'fps': None, 'error': f"No answer within {timeout:g} seconds."}
+        return camera.id, result
+
+    try:
+        return dict(await asyncio.gather(*(probe(camera) for camera in cameras)))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def save_probe_results(cameras, results):
+    """
+    Stores probe results on the cameras in one bulk_update of the probe
+    fields, then flips active/offline status with updates filtered on the
+    status read before the probe, so concurrent admin edits are kept.
+    """
+    from .models import Camera
+
+    now = timezone.now()
+    probed = []
+    reachable = []
+    unreachable = []
+    for camera in cameras:
+        result = results.get(camera.id)
+        if result is None:
+            continue
+        camera.last_probe_at = now
+        camera.probe_latency_ms = result['latency_ms']
+        camera.probe_fps = result['fps']
+        camera.probe_error = result['error'][:255]
+        probed.append(camera)
+        if camera.status == 'offline' and result['ok']:
+            reachable.append(camera.id)
+        elif camera.status == 'active' and not result['ok']:
+            unreachable.append(camera.id)
+    if not probed:
+        return
+    Camera.objects.bulk_update(probed, PROBE_FIELDS)
+    if reachable:
+        Camera.objects.filter(pk__in=reachable, status='offline').update(status='active')
+    if unreachable:
+        Camera.objects.filter(pk__in=unreachable, status='active').update(status='offline')
+    statuses = dict(Camera.objects.filter(pk__in=[camera.id for camera in probed]).values_list('id', 'status'))
+    for camera in probed:
+        camera.status = statuses.get(camera.id, camera.status)
+
+
+def run_probes(camera_ids=None, timeout=CAMERA_PROBE_TIMEOUT):
+    """Probes all cameras (or the given ids) and saves the results. Returns the cameras."""
+    from .models import Camera
+
+    cameras = Camera.objects.all()
+    if camera_ids is not None:
+        cameras = cameras.filter(pk__in=camera_ids)
+    cameras = list(cameras)
+    if not cameras:
+        return []
+    results = asyncio.run(probe_cameras(cameras, timeout))
+    save_probe_results(cameras, results)
+    return cameras
+
+
+class CameraHealthProber:
+    """
+    Runs run_probes every `interval` seconds, or sooner for requested cameras.
+    With interval 0 (web processes) it only probes on request, in a daemon
+    thread that exits once nothing is left to do.
+    """
+
+    def __init__(self, interval=0, timeout=CAMERA_PROBE_TIMEOUT):
+        self.interval = interval
+        self.timeout = timeout
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._requested = set()
+        self._thread = None
+
+    def request(self, camera_id):
+        """Asks for a fresh probe of one camera as soon as possible, without waiting for it."""
+        with self._lock:
+            self._requested.add(int(camera_id))
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self.run, name='camera-prober', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def run(self):
+        """Probe loop; runs in the foreground for `probe_cameras --watch`."""
+        next_round = time.monotonic()
+        while True:
+            # Clear before taking the requests: one made after this point sets it again
+            self._wake.clear()
+            with self._lock:
+                requested, self._requested = self._requested, set()
+            full_round = self.interval > 0 and time.monotonic() >= next_round
+            if full_round or requested:
+                close_old_connections()
+                try:
+                    cameras = run_probes(None if full_round else requested, self.timeout)
+                    if full_round:
+                        offline = sum(camera.status == 'offline' for camera in cameras)
+                        print(f"[Camera Health] Probed {len(cameras)} camera(s), {offline} offline")
+                except Exception as e:
+                    print(f"[Camera Health] Probe round failed: {e}")
+                finally:
+                    close_old_connections()
+                if full_round:
+                    next_round = time.monotonic() + self.interval
+            if self.interval <= 0:
+                # On-demand only: exit once nothing is requested (request() restarts the thread)
+                with self._lock:
+                    if not self._requested:
+                        self._thread = None
+                        return
+                continue
+            self._wake.wait(max(0.0, next_round - time.monotonic()))
+
+
+# On-demand probes of the web process ("Test Connection")
+camera_prober = CameraHealthProber()
@@ -0,0 +1,268 @@
+"""
+Headless ingestion of server-side cameras (USB devices and RTSP/HTTP streams).
+
+Each active Camera gets two threads:
+
+- a reader that keeps cv2.VideoCapture draining the device and puts every
+  frame into a small LatestFrameBuffer (a full buffer drops its oldest frame,
+  so a slow consumer never builds up latency), reconnecting after failures;
+- a recognizer that takes the newest frame, applies the camera's
+  recognition_fps and the frame-difference gate, and feeds it straight into
+  the recognition engine (through the per-camera scheduler) and multi-face
+  attendance marking.
+
+Frames never leave the process as JPEG/base64/HTTP. Tracking, the check-in
+cache and gallery enrichment work exactly as for the browser kiosk.
+Run it with `manage.py ingest_cameras`.
+"""
+import collections
+import threading
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .frame_gate import FRAME_DIFF_THRESHOLD, FRAME_RESULT_TTL, frame_thumbnail
+
+# Frames held per camera; the newest is processed, older ones are dropped
+CAMERA_INGEST_BUFFER_SIZE = getattr(settings, 'CAMERA_INGEST_BUFFER_SIZE', 2)
+# Seconds between "camera is open" heartbeats written for the health prober
+CAMERA_INGEST_HEARTBEAT = getattr(settings, 'CAMERA_INGEST_HEARTBEAT', 15.0)
+# Seconds to wait before reopening a camera that failed or stopped delivering frames
+CAMERA_RECONNECT_DELAY = getattr(settings, 'CAMERA_RECONNECT_DELAY', 5.0)
+
+
+def capture_source(camera):
+    """The cv2.VideoCapture source of a Camera: its device index or stream URL, or None."""
+    if camera.camera_type == 'usb':
+        return camera.device_index
+    return camera.stream_url or None
+
+
+def open_capture(camera):
+    """Opens a camera with its configured resolution and frame rate; returns None on failure."""
+    source = capture_source(camera)
+    if source is None:
+        return None
+    capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        capture.release()
+        return None
+    capture.set(cv2.CAP_PROP_FRAME_WIDTH, camera.resolution_width)
+    capture.set(cv2.CAP_PROP_FRAME_HEIGHT, camera.resolution_height)
+    capture.set(cv2.CAP_PROP_FPS, camera.fps)
+    # Keep the driver's own queue short too, where the backend supports it
+    capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    return capture
+
+
+class LatestFrameBuffer:
+    """Bounded ring buffer of (timestamp, frame); put() drops the oldest frame when full."""
+
+    def __init__(self, size=CAMERA_INGEST_BUFFER_SIZE):
+        self._frames = collections.deque(maxlen=max(1, size))
+        self._condition = threading.Condition()
+        self.received = 0
+        self.dropped = 0
+
+    def put(self, frame):
+        with self._condition:
+            if len(self._frames) == self._frames.maxlen:
+                self.dropped += 1
+            self._frames.append((time.monotonic(), frame))
+            self.received += 1
+            self._condition.notify()
+
+    def get_latest(self, timeout=None):
+        """
+        Waits for a frame and returns the newest (timestamp, frame), discarding
+        older ones. Returns None on timeout.
+        """
+        with self._condition:
+            if not self._frames and not self._condition.wait_for(lambda: self._frames, timeout):
+                return None
+            latest = self._frames.pop()
+            self.dropped += len(self._frames)
+            self._frames.clear()
+            return latest
+
+
+class CameraReader(threading.Thread):
+    """Reads frames from one camera into a LatestFrameBuffer until stopped."""
+
+    def __init__(self, camera, buffer, stop_event, reconnect_delay=CAMERA_RECONNECT_DELAY):
+        super().__init__(name=f'camera-reader-{camera.id}', daemon=True)
+        self.camera = camera
+        self.buffer = buffer
+        self.stop_event = stop_event
+        self.reconnect_delay = reconnect_delay
+        self.connected = False
+        self.reconnects = 0
+
+    def run(self):
+        while not self.stop_event.is_set():
+            capture = open_capture(self.camera)
+            if capture is None:
+                print(f"[Camera Ingest] Could not open {self.camera.name}; retrying in {self.reconnect_delay}s")
+                self.stop_event.wait(self.reconnect_delay)
+                continue
+            self.connected = True
+            print(f"[Camera Ingest] Reading {self.camera.name}")
+            last_heartbeat = 0.0
+            try:
+                while not self.stop_event.is_set():
+                    ok, frame = capture.read()
+                    if not ok or frame is None:
+                        print(f"[Camera Ingest] {self.camera.name} stopped delivering frames")
+                        break
+                    self.buffer.put(frame)
+                    if time.monotonic() - last_heartbeat >= CAMERA_INGEST_HEARTBEAT:
+                        self.heartbeat(timezone.now())
+                        last_heartbeat = time.monotonic()
+            finally:
+                capture.release()
+                self.connected = False
+                self.heartbeat(None)
+            if not self.stop_event.is_set():
+                self.reconnects += 1
+                self.stop_event.wait(self.reconnect_delay)
+
+    def heartbeat(self, at):
+        """Tells the health prober (camera_health.py) that this process holds the camera open, or no longer does."""
+        from .models import Camera
+
+        close_old_connections()
+        try:
+            Camera.objects.filter(pk=self.camera.pk).update(ingest_heartbeat_at=at)
+        except Exception as e:
+            print(f"[Camera Ingest] Could not record heartbeat for {self.camera.name}: {e}")
+
+
+class CameraRecognizer(threading.Thread):
+    """Runs the newest frames of one camera through recognition and check-in."""
+
+    def __init__(self, camera, buffer, stop_event, course_id, semester_id):
+        super().__init__(name=f'camera-recognizer-{camera.id}', daemon=True)
+        self.camera = camera
+        self.buffer = buffer
+        self.stop_event = stop_event
+        self.course_id = course_id
+        self.semester_id = semester_id
+        self.stream_key = ('ingest', str(camera.id), str(course_id), str(semester_id))
+        self.processed = 0
+        self.skipped = 0
+        self.busy = 0
+        self.recognized = 0
+        self.last_latency = None
+        self._thumbnail = None
+        self._last_processed = 0.0
+
+    def should_process(self, frame, now):
+        """Applies the camera's recognition_fps and skips unchanged scenes."""
+        fps = self.camera.recognition_fps
+        if fps and now - self._last_processed < 1.0 / fps:
+            return False
+        thumbnail = frame_thumbnail(frame)
+        if (
+            self._thumbnail is not None
+            and now - self._last_processed <= FRAME_RESULT_TTL
+            and float(np.mean(np.abs(thumbnail - self._thumbnail))) < FRAME_DIFF_THRESHOLD
+        ):
+            return False
+        self._thumbnail = thumbnail
+        self._last_processed = now
+        return True
+
+    def run(self):
+        from .face_tracker import face_tracker
+        from .gallery_enrichment import gallery_enricher
+        from .recognition_engine import EngineBusy
+        from .recognition_scheduler import get_scheduler
+        from .attendance import recognize_all_faces
+
+        scheduler = get_scheduler()
+        while not self.stop_event.is_set():
+            latest = self.buffer.get_latest(timeout=1.0)
+            if latest is None:
+                continue
+            captured_at, frame = latest
+            if not self.should_process(frame, time.monotonic()):
+                self.skipped += 1
+                continue
+
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            close_old_connections()
+            try:
+                result = scheduler.recognize(
+                    str(self.camera.id), rgb_frame, self.camera.detection_width, self.course_id, self.semester_id,
+                    tolerance=0.45, tracks=face_tracker.snapshot(self.stream_key),
+                    weight=self.camera.recognition_weight
+                )
+            except EngineBusy as e:
+                self.busy += 1
+                print(f"[Camera Ingest] {self.camera.name}: {e}")
+                continue
+            face_tracker.update(self.stream_key, result)
+            gallery_enricher.offer(result)
+            self.processed += 1
+
+            if result['matches']:
+                try:
+                    payload = recognize_all_faces(result['locations'], result['matches'], self.course_id, self.semester_id)
+                except Exception as e:
+                    print(f"[Camera Ingest] {self.camera.name}: could not mark attendance: {e}")
+                    continue
+                for face in payload['faces']:
+                    if face['status'] == 'success':
+                        self.recognized += 1
+                        print(f"[Camera Ingest] {self.camera.name}: {face['name']} - {face['attendance_status']}")
+            self.last_latency = time.monotonic() - captured_at
+        close_old_connections()
+
+
+class CameraIngestService:
+    """Starts and stops the reader/recognizer threads for a set of cameras."""
+
+    def __init__(self, cameras, course_id, semester_id, buffer_size=CAMERA_INGEST_BUFFER_SIZE):
+        self.stop_event = threading.Event()
+        self.streams = []
+        for camera in cameras:
+            buffer = LatestFrameBuffer(buffer_size)
+            self.streams.append((
+                camera,
+                buffer,
+                CameraReader(camera, buffer, self.stop_event),
+                CameraRecognizer(camera, buffer, self.stop_event, course_id, semester_id),
+            ))
+
+    def start(self):
+        for _, _, reader, recognizer in self.streams:
+            reader.start()
+            recognizer.start()
+
+    def stop(self, timeout=5.0):
+        self.stop_event.set()
+        for _, _, reader, recognizer in self.streams:
+            reader.join(timeout)
+            recognizer.join(timeout)
+
+    def stats(self):
+        """Per-camera counters for monitoring."""
+        return [
+            {
+                'camera': camera.name,
+                'connected': reader.connected,
+                'reconnects': reader.reconnects,
+                'received': buffer.received,
+                'dropped': buffer.dropped,
+                'processed': recognizer.processed,
+                'skipped': recognizer.skipped,
+                'busy': recognizer.busy,
+                'recognized': recognizer.recognized,
+                'latency': recognizer.last_latency,
+            }
+            for camera, buffer, reader, recognizer in self.streams
+        ]
@@ -0,0 +1,91 @@
+"""
+Short-lived cache of check-in outcomes for the recognition kiosk.
+
+A student standing in front of the camera is recognized on every frame. Once
+their attendance for the day has been answered, the kiosk response for
+(attendance session, student, date) is kept for a few minutes so repeat
+matches return immediately without touching the attendance tables.
+
+Entries live in the Django cache named by CHECKIN_CACHE_ALIAS, which must be
+shared by all web workers (Redis or the database cache, see settings.py).
+Cache backends cannot delete by prefix, so every key carries the student's
+invalidation stamps: invalidate() writes a new stamp and all older entries of
+the student (or of one date) become unreachable in every worker at once.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+CHECKIN_CACHE_TTL = getattr(settings, 'CHECKIN_CACHE_TTL', 5 * 60)
+CHECKIN_CACHE_ALIAS = getattr(settings, 'CHECKIN_CACHE_ALIAS', 'default')
+KEY_PREFIX = 'checkin'
+
+
+class RecentCheckIns:
+    """TTL map of (course_id, semester_id, student_id, date) -> kiosk JSON payload in a shared cache."""
+
+    def __init__(self, ttl=CHECKIN_CACHE_TTL, alias=CHECKIN_CACHE_ALIAS):
+        self.ttl = ttl
+        self.alias = alias
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @staticmethod
+    def _stamp_key(student_id, date=None):
+        """Cache key of the invalidation stamp of a student, or of one of their dates."""
+        key = f'{KEY_PREFIX}:stamp:{int(student_id)}'
+        return f'{key}:{date.isoformat()}' if date is not None else key
+
+    @classmethod
+    def _stamp_keys(cls, student_id, date):
+        return [cls._stamp_key(student_id), cls._stamp_key(student_id, date)]
+
+    @classmethod
+    def _entry_key(cls, course_id, semester_id, student_id, date, stamps):
+        """Entry key including the current invalidation stamps of the student and date."""
+        student_key, date_key = cls._stamp_keys(student_id, date)
+        return (
+            f'{KEY_PREFIX}:{course_id}:{semester_id}:{int(student_id)}:{date.isoformat()}'
+            f':{stamps.get(student_key, 0)}:{stamps.get(date_key, 0)}'
+        )
+
+    def _key(self, course_id, semester_id, student_id, date):
+        stamps = self.cache.get_many(self._stamp_keys(student_id, date))
+        return self._entry_key(course_id, semester_id, student_id, date, stamps)
+
+    async def _akey(self, course_id, semester_id, student_id, date):
+        stamps = await self.cache.aget_many(self._stamp_keys(student_id, date))
+        return self._entry_key(course_id, semester_id, student_id, date, stamps)
+
+    def get(self, course_id, semester_id, student_id, date):
+        """Returns the cached payload, or None if missing, expired or invalidated."""
+        payload = self.cache.get(self._key(course_id, semester_id, student_id, date))
+        return dict(payload) if payload is not None else None
+
+    async def aget(self, course_id, semester_id, student_id, date):
+        """get() for async views."""
+        payload = await self.cache.aget(await self._akey(course_id, semester_id, student_id, date))
+        return dict(payload) if payload is not None else None
+
+    def put(self, course_id, semester_id, student_id, date, payload):
+        """Caches a payload for the TTL."""
+        self.cache.set(self._key(course_id, semester_id, student_id, date), dict(payload), self.ttl)
+
+    async def aput(self, course_id, semester_id, student_id, date, payload):
+        """put() for async views."""
+        await self.cache.aset(await self._akey(course_id, semester_id, student_id, date), dict(payload), self.ttl)
+
+    def invalidate(self, student_id, date=None):
+        """
+        Drops a student's entries in every session and every worker
+        (optionally for one date only) by writing a new invalidation stamp.
+        A stamp outlives every entry written before it, so it may expire
+        after twice the TTL.
+        """
+        self.cache.set(self._stamp_key(student_id, date), time.time_ns(), 2 * self.ttl)
+
+
+recent_checkins = RecentCheckIns()
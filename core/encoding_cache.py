@@ -0,0 +1,107 @@
+"""
+Persisted face-encoding cache keyed by photo content.
+
+Photos are normalized first (EXIF rotation, 8-bit RGB, size cap; see
+face_pipeline.load_face_image) and the SHA-256 of the resulting pixels is the
+cache key, so re-saved or re-uploaded copies of the same picture hit the same
+entry. generate_encodings, the bulk importer, register_student and
+edit_student_view consult the cache before running dlib, which makes
+re-encoding unchanged photos nearly free.
+"""
+import hashlib
+
+import numpy as np
+
+from .face_pipeline import encode_face_image, load_face_image, photo_hash
+
+
+def normalized_image_hash(image_array):
+    """SHA-256 over the shape and pixels of a normalized RGB photo."""
+    digest = hashlib.sha256(repr(image_array.shape).encode())
+    digest.update(np.ascontiguousarray(image_array).tobytes())
+    return digest.hexdigest()
+
+
+def lookup(image_hash, use_cnn=False):
+    """
+    Returns (box, encoding) for a cached photo, (None, None) when it is known
+    to contain no face, or None on a cache miss. A "no face" entry found without
+    the CNN detector does not count when use_cnn is requested.
+    """
+    from .models import FaceEncodingCache
+
+    entry = FaceEncodingCache.objects.filter(image_hash=image_hash).first()
+    if entry is None:
+        return None
+    encoding = entry.get_encoding()
+    if encoding is None:
+        if use_cnn and not entry.used_cnn:
+            return None
+        return None, None
+    return entry.get_box(), encoding
+
+
+def store(image_hash, box, encoding, used_cnn=False):
+    """Saves a detection result (encoding None for "no face") for a normalized photo."""
+    from .models import FaceEncodingCache, pack_encoding
+
+    top, right, bottom, left = box if box is not None else (None, None, None, None)
+    FaceEncodingCache.objects.update_or_create(
+        image_hash=image_hash,
+        defaults={
+            'face_top': top,
+            'face_right': right,
+            'face_bottom': bottom,
+            'face_left': left,
+            'face_encoding': pack_encoding(encoding) if encoding is not None else None,
+            'used_cnn': used_cnn,
+        },
+    )
+
+
+def encode_image_cached(image_array, use_cnn=False, image_hash=None):
+    """
+    Encodes the first face in a normalized photo, through the cache.
+    Returns (box, encoding, cached); box and encoding are None if there is no face.
+    """
+    image_hash = image_hash or normalized_image_hash(image_array)
+    hit = lookup(image_hash, use_cnn)
+    if hit is not None:
+        return hit[0], hit[1], True
+    box, encoding = encode_face_image(image_array, use_cnn=use_cnn)
+    store(image_hash, box, encoding, used_cnn=use_cnn)
+    return box, encoding, False
+
+
+def cached_photo_encoding(source, use_cnn=False):
+    """
+    Cache lookup only, without running dlib on a miss.
+    Returns (box, encoding) like lookup(), or None on a miss.
+    """
+    return lookup(normalized_image_hash(load_face_image(source)), use_cnn)
+
+
+def encode_photo_cached(source, use_cnn=False):
+    """Decodes a photo (path, file object or bytes) and encodes it through the cache. Returns (box, encoding, cached)."""
+    return encode_image_cached(load_face_image(source), use_cnn=use_cnn)
+
+
+def encode_photo_file_cached(path, use_cnn=False):
+    """
+    Reads, decodes and encodes a photo file through the cache, for
+    generate_encodings (pool workers must have Django set up).
+    Returns (photo_hash, encoding or None, error message or None, cached).
+    """
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return None, None, f"Could not read image: {e}", False
+    file_hash = photo_hash(data)
+    try:
+        _, encoding, cached = encode_photo_cached(data, use_cnn=use_cnn)
+    except Exception as e:
+        return file_hash, None, f"Could not process image: {e}", False
+    if encoding is None:
+        return file_hash, None, "No face detected after all attempts.", cached
+    return file_hash, encoding, None, cached
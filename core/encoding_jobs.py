@@ -0,0 +1,148 @@
+"""
+Background re-encoding of single students after a profile photo change, and
+encoding of additional enrollment photos (FaceEncoding rows).
+
+edit_student_view enqueues the student once the save is committed and returns
+immediately. A dispatcher thread hands each job to the background encoding
+engine (recognition_engine.get_background_engine), a small pool of its own,
+so the dlib work never runs in a request thread and the CNN detector never
+takes a kiosk worker. The worker saves the new encoding; the User post_save
+signal then replaces the student's row in that worker's gallery and logs the
+change for every other worker.
+
+Extra photos are encoded the same way and stored with FaceEncoding.add, whose
+post_save signal updates the gallery.
+
+Jobs are kept in memory only. If the process restarts first, the student's
+face_image_hash no longer matches the photo, so the next generate_encodings
+run picks them up.
+"""
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .recognition_engine import EngineBusy, get_background_engine
+
+# Seconds to wait before retrying a job when the recognition queue is full
+ENCODING_JOB_RETRY_DELAY = getattr(settings, 'ENCODING_JOB_RETRY_DELAY', 2.0)
+
+
+def encode_student(student_id):
+    """
+    Re-encodes one student's profile photo (runs in a recognition worker).
+    Returns 'encoded', 'unchanged', 'no_face' or 'missing'.
+    """
+    from .encoding_cache import encode_photo_cached
+    from .face_pipeline import photo_hash
+    from .models import User
+
+    student = User.objects.filter(pk=student_id, is_student=True).first()
+    if student is None or not student.profile_image:
+        return 'missing'
+    try:
+        with student.profile_image.open('rb') as f:
+            data = f.read()
+    except OSError:
+        return 'missing'
+
+    image_hash = photo_hash(data)
+    if image_hash == student.face_image_hash and student.face_encoding:
+        return 'unchanged'
+
+    _, encoding, _ = encode_photo_cached(data, use_cnn=True)
+    if encoding is None:
+        return 'no_face'
+    student.set_encoding(encoding)
+    student.face_image_hash = image_hash
+    student.save(update_fields=['face_encoding', 'face_image_hash'])
+    return 'encoded'
+
+
+def encode_extra_photo(student_id, data):
+    """
+    Encodes an additional enrollment photo of a student (runs in a recognition
+    worker) and stores it as a FaceEncoding. Returns 'encoded', 'no_face' or 'missing'.
+    """
+    from .encoding_cache import encode_photo_cached
+    from .models import FaceEncoding, User
+
+    student = User.objects.filter(pk=student_id, is_student=True).first()
+    if student is None:
+        return 'missing'
+    _, encoding, _ = encode_photo_cached(data, use_cnn=True)
+    if encoding is None:
+        return 'no_face'
+    FaceEncoding.add(student, encoding, source='enrollment')
+    return 'encoded'
+
+
+class EncodingJobQueue:
+    """
+    FIFO of encoding jobs drained by one dispatcher thread. Profile re-encodes
+    are de-duplicated per student; extra photo jobs are always queued.
+    """
+
+    def __init__(self, retry_delay=ENCODING_JOB_RETRY_DELAY):
+        self.retry_delay = retry_delay
+        self._queue = queue.Queue()
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def enqueue(self, student_id):
+        """Schedules a re-encode; a student already waiting is not queued twice."""
+        student_id = int(student_id)
+        with self._lock:
+            if student_id in self._pending:
+                return
+            self._pending.add(student_id)
+            self._start()
+        self._queue.put((student_id, encode_student, (student_id,)))
+
+    def enqueue_photo(self, student_id, data):
+        """Schedules encoding an additional photo (raw file bytes) of a student."""
+        with self._lock:
+            self._start()
+        self._queue.put((int(student_id), encode_extra_photo, (int(student_id), data)))
+
+    def pending(self):
+        """Number of jobs waiting to run."""
+        return self._queue.qsize()
+
+    def join(self):
+        """Blocks until every queued job has run."""
+        self._queue.join()
+
+    def _start(self):
+        # Called with self._lock held
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='encoding-jobs', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            student_id, fn, args = self._queue.get()
+            if fn is encode_student:
+                with self._lock:
+                    # Later edits of the same student while this job runs queue it again
+                    self._pending.discard(student_id)
+            try:
+                while True:
+                    try:
+                        result = get_background_engine().run(fn, *args)
+                        print(f"[Encoding Jobs] Student {student_id}: {result}")
+                        break
+                    except EngineBusy:
+                        time.sleep(self.retry_delay)
+                    except Exception as e:
+                        print(f"[Encoding Jobs] Student {student_id} failed: {e}")
+                        break
+            finally:
+                close_old_connections()
+                self._queue.task_done()
+
+
+encoding_jobs = EncodingJobQueue()
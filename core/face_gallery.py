@@ -0,0 +1,655 @@
+"""
+In-memory face gallery used by the recognition views.
+
+All known encodings are held in one contiguous float32 (N, 128) matrix with
+their squared norms precomputed, so a probe face is matched against the whole
+enrollment in a single vectorized pass instead of re-stacking a Python list of
+arrays on every frame.
+
+The gallery is versioned: User post_save/post_delete signals add, replace or
+remove single rows in place and append to the FaceGalleryChange log, whose
+auto-increment id is the gallery generation. Other worker processes replay the
+log every few seconds (see sync_gallery) instead of reloading everything.
+Workers start from the memory-mapped shared file written by gallery_file.py.
+
+A student can have several rows: the profile photo encoding (key 0) plus
+their FaceEncoding rows (key = FaceEncoding id). A probe's best row gives its
+best student directly; ranking students (nearest_k) reduces rows to one score
+per student with a vectorized group-min.
+
+Very large galleries are searched through an IVF index (see face_index.py)
+instead of a full scan; the tolerance check is the same either way.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from .face_index import IVFIndex, use_index
+
+ENCODING_DIM = 128
+DEFAULT_TOLERANCE = 0.45
+# Stricter distance used when checking a new photo against enrolled faces
+DUPLICATE_TOLERANCE = 0.4
+
+# Seconds between checks of the change log by each worker process
+GALLERY_SYNC_INTERVAL = getattr(settings, 'FACE_GALLERY_SYNC_INTERVAL', 5)
+# Change log entries older than this are pruned; idle workers fully reload
+GALLERY_CHANGE_RETENTION = getattr(settings, 'FACE_GALLERY_CHANGE_RETENTION', 24 * 60 * 60)
+# Minimum seconds between rewrites of the shared gallery file by a worker
+GALLERY_FILE_REBUILD_INTERVAL = getattr(settings, 'FACE_GALLERY_FILE_REBUILD_INTERVAL', 30)
+# Row key of the profile photo encoding stored on the User itself
+PRIMARY_KEY = 0
+ROW_ARRAYS = ('_encodings', '_ids', '_keys', '_course_ids', '_semester_ids', '_sq_norms')
+
+
+class FaceGallery:
+    """
+    Contiguous matrix of face encodings with parallel arrays of student IDs,
+    row keys (0 for the profile photo, FaceEncoding id otherwise) and the
+    students' course/semester IDs (-1 when unset), used to partition the gallery.
+
+    Rows live in over-allocated buffers so single rows can be added,
+    replaced or removed in place; all access goes through an internal lock.
+    Arrays that are already contiguous (e.g. read-only memmaps of the shared
+    gallery file) are used without copying until the first row change.
+    """
+
+    def __init__(self, encodings=None, ids=None, course_ids=None, semester_ids=None, sq_norms=None, keys=None):
+        if encodings is None or len(encodings) == 0:
+            encodings = np.empty((0, ENCODING_DIM), dtype=np.float32)
+            ids = np.empty((0,), dtype=np.int64)
+            keys = None
+            sq_norms = None
+        self._encodings = np.ascontiguousarray(encodings, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        self._ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self._size = len(self._ids)
+        if self._size != len(self._encodings):
+            raise ValueError("Gallery encodings and ids must have the same length.")
+        if keys is None:
+            keys = np.full(self._size, PRIMARY_KEY, dtype=np.int64)
+        self._keys = np.ascontiguousarray(keys, dtype=np.int64)
+        if len(self._keys) != self._size:
+            raise ValueError("Gallery row keys must have the same length as encodings.")
+        self._course_ids = self._group_array(course_ids)
+        self._semester_ids = self._group_array(semester_ids)
+        if sq_norms is None:
+            sq_norms = np.einsum('ij,ij->i', self._encodings, self._encodings)
+        self._sq_norms = np.ascontiguousarray(sq_norms, dtype=np.float32)
+        # (student_id, key) -> row, and student_id -> keys of their rows
+        self._rows = {}
+        self._student_keys = {}
+        for row, (student_id, key) in enumerate(zip(self._ids.tolist(), self._keys.tolist())):
+            self._rows[(student_id, key)] = row
+            self._student_keys.setdefault(student_id, set()).add(key)
+        self._lock = threading.RLock()
+        # (course_id, semester_id) -> sub-gallery, built on first use
+        self._partitions = {}
+        # IVF index over the rows, built on first search once the gallery is large
+        self._index = None
+        # Id of the last FaceGalleryChange applied to this gallery
+        self.generation = 0
+
+    def _group_array(self, values):
+        if values is None:
+            return np.full(self._size, -1, dtype=np.int64)
+        if isinstance(values, np.ndarray):
+            values = np.ascontiguousarray(values, dtype=np.int64)
+        else:
+            values = np.array([-1 if v is None else v for v in values], dtype=np.int64)
+        if len(values) != self._size:
+            raise ValueError("Gallery group ids must have the same length as encodings.")
+        return values
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, student_id):
+        return int(student_id) in self._student_keys
+
+    @property
+    def student_count(self):
+        return len(self._student_keys)
+
+    # --- Views of the live rows ---
+    @property
+    def encodings(self):
+        return self._encodings[:self._size]
+
+    @property
+    def ids(self):
+        return self._ids[:self._size]
+
+    @property
+    def keys(self):
+        return self._keys[:self._size]
+
+    @property
+    def course_ids(self):
+        return self._course_ids[:self._size]
+
+    @property
+    def semester_ids(self):
+        return self._semester_ids[:self._size]
+
+    @property
+    def sq_norms(self):
+        return self._sq_norms[:self._size]
+
+    @classmethod
+    def from_students(cls, students, extra_encodings=()):
+        """
+        Builds a gallery from an iterable of User objects with stored encodings,
+        plus optional (student_id, FaceEncoding id, encoding) extra rows for them.
+        """
+        encodings = []
+        ids = []
+        keys = []
+        course_ids = []
+        semester_ids = []
+        groups = {}
+        for student in students:
+            encoding = student.get_encoding()
+            if encoding is not None:
+                encodings.append(encoding)
+                ids.append(student.id)
+                keys.append(PRIMARY_KEY)
+                course_ids.append(student.course_id)
+                semester_ids.append(student.semester_id)
+                groups[student.id] = (student.course_id, student.semester_id)
+            else:
+                print(f"[Face Load Warning] Could not decode encoding for {student.username}")
+        for student_id, key, encoding in extra_encodings:
+            # Extra encodings only count for students whose profile encoding is in the gallery
+            if student_id in groups and encoding is not None:
+                encodings.append(encoding)
+                ids.append(student_id)
+                keys.append(key)
+                course_ids.append(groups[student_id][0])
+                semester_ids.append(groups[student_id][1])
+        if not encodings:
+            return cls()
+        return cls(np.stack(encodings), ids, course_ids, semester_ids, keys=keys)
+
+    # --- Incremental updates ---
+    def _ensure_writable(self):
+        """Copies memory-mapped or borrowed arrays into private buffers before a write."""
+        for name in ROW_ARRAYS:
+            array = getattr(self, name)
+            if not array.flags.writeable or isinstance(array, np.memmap):
+                setattr(self, name, np.array(array))
+
+    def _grow(self):
+        capacity = max(16, 2 * len(self._encodings))
+        for name in ROW_ARRAYS:
+            old = getattr(self, name)
+            new = np.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def get_rows(self, student_id):
+        """
+        Returns ({key: encoding}, course_id, semester_id) for a student's rows,
+        or None if the student is not in the gallery.
+        """
+        student_id = int(student_id)
+        with self._lock:
+            keys = self._student_keys.get(student_id)
+            if not keys:
+                return None
+            rows = {key: self._rows[(student_id, key)] for key in keys}
+            first = next(iter(rows.values()))
+            return (
+                {key: self._encodings[row].copy() for key, row in rows.items()},
+                int(self._course_ids[first]),
+                int(self._semester_ids[first]),
+            )
+
+    def upsert(self, student_id, encoding, course_id=None, semester_id=None, key=PRIMARY_KEY):
+        """Adds one of a student's rows, or replaces it in place if already present."""
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(ENCODING_DIM)
+        student_id = int(student_id)
+        key = int(key)
+        with self._lock:
+            self._ensure_writable()
+            row = self._rows.get((student_id, key))
+            if row is None:
+                if self._size == len(self._encodings):
+                    self._grow()
+                row = self._size
+                self._size += 1
+                self._rows[(student_id, key)] = row
+                self._student_keys.setdefault(student_id, set()).add(key)
+                self._ids[row] = student_id
+                self._keys[row] = key
+            self._encodings[row] = encoding
+            self._sq_norms[row] = float(np.dot(encoding, encoding))
+            self._course_ids[row] = -1 if course_id is None else course_id
+            self._semester_ids[row] = -1 if semester_id is None else semester_id
+            if self._index is not None:
+                self._index.update_row(row, encoding)
+            self._partitions.clear()
+
+    def _remove_row(self, row):
+        """Removes a row by swapping the last row into its place."""
+        last = self._size - 1
+        if row != last:
+            for name in ROW_ARRAYS:
+                array = getattr(self, name)
+                array[row] = array[last]
+            self._rows[(int(self._ids[row]), int(self._keys[row]))] = row
+        if self._index is not None:
+            self._index.remove_row(row, last)
+        self._size = last
+
+    def remove(self, student_id, key=None):
+        """Removes one of a student's rows, or all of them when key is None."""
+        student_id = int(student_id)
+        with self._lock:
+            keys = self._student_keys.get(student_id)
+            if not keys or (key is not None and int(key) not in keys):
+                return False
+            self._ensure_writable()
+            for row_key in ([int(key)] if key is not None else list(keys)):
+                self._remove_row(self._rows.pop((student_id, row_key)))
+                keys.discard(row_key)
+            if not keys:
+                del self._student_keys[student_id]
+            self._partitions.clear()
+            return True
+
+    # --- Matching ---
+    def partition(self, course_id, semester_id):
+        """
+        Returns the sub-gallery of students enrolled in the given course and
+        semester. Sub-galleries are cached until the next row change, so
+        repeated frames for the same session only pay the row selection once.
+        """
+        try:
+            key = (int(course_id), int(semester_id))
+        except (TypeError, ValueError):
+            return FaceGallery()
+        with self._lock:
+            part = self._partitions.get(key)
+            if part is None:
+                rows = np.flatnonzero((self.course_ids == key[0]) & (self.semester_ids == key[1]))
+                part = FaceGallery(
+                    self.encodings[rows], self.ids[rows],
+                    self.course_ids[rows], self.semester_ids[rows],
+                    keys=self.keys[rows]
+                )
+                self._partitions[key] = part
+            return part
+
+    def distance_matrix(self, probes):
+        """
+        Euclidean distances between each probe (M, 128) and every gallery row.
+        Returns an (M, N) float32 array, same metric as face_recognition.face_distance.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            if self._size == 0:
+                return np.empty((len(probes), 0), dtype=np.float32)
+            # |g - p|^2 = |g|^2 - 2 g.p + |p|^2, computed as one matrix product
+            probe_sq = np.einsum('ij,ij->i', probes, probes)
+            sq = self.sq_norms[np.newaxis, :] - 2.0 * (probes @ self.encodings.T) + probe_sq[:, np.newaxis]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def _get_index(self):
+        """The IVF index for this gallery's size, (re)trained when needed; None for a full scan."""
+        if not use_index(self._size):
+            self._index = None
+        elif self._index is None or self._index.needs_retrain(self._size):
+            self._index = IVFIndex.train(self.encodings)
+        return self._index
+
+    def nearest(self, probes):
+        """
+        Closest gallery row for each probe, through the IVF index for large
+        galleries and an exact scan otherwise.
+        Returns (rows, distances) arrays; the gallery must not be empty.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            index = self._get_index()
+            if index is not None:
+                return index.search(probes, self.encodings, self.sq_norms)
+            distances = self.distance_matrix(probes)
+            best_rows = np.argmin(distances, axis=1)
+            return best_rows, distances[np.arange(len(probes)), best_rows]
+
+    def student_distances(self, probe):
+        """
+        Distance from a single probe to each student, taking the closest of
+        their rows (a group-min over student ids).
+        Returns (student_ids, distances) sorted nearest first.
+        """
+        with self._lock:
+            distances = self.distances(probe)
+            ids = self.ids.copy()
+        order = np.argsort(distances, kind='stable')
+        sorted_ids = ids[order]
+        # The first occurrence of each student in distance order is their minimum
+        _, first = np.unique(sorted_ids, return_index=True)
+        first.sort()
+        return sorted_ids[first], distances[order][first]
+
+    def nearest_k(self, probe, k):
+        """
+        The k closest students to a single probe by exact distance.
+        Returns a list of (student_id, distance), nearest first.
+        """
+        if k <= 0 or self._size == 0:
+            return []
+        student_ids, distances = self.student_distances(probe)
+        return [(int(student_id), float(distance)) for student_id, distance in zip(student_ids[:k], distances[:k])]
+
+    def distances(self, probe):
+        """Distances from a single probe encoding to every gallery row, shape (N,)."""
+        return self.distance_matrix(probe)[0]
+
+    def match(self, probe, tolerance=DEFAULT_TOLERANCE):
+        """
+        Finds the closest gallery entry for a single probe.
+        Returns (student_id, distance); student_id is None when the best distance
+        exceeds the tolerance, distance is None when the gallery is empty.
+        """
+        return self.match_many(probe, tolerance)[0]
+
+    def match_many(self, probes, tolerance=DEFAULT_TOLERANCE):
+        """
+        Matches several probes (e.g. every face in a frame) in one batched
+        distance computation. Returns a list of (student_id, distance) per probe.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        with self._lock:
+            if self._size == 0:
+                return [(None, None)] * len(probes)
+            best_rows, best_distances = self.nearest(probes)
+            best_ids = self.ids[best_rows]
+        results = []
+        for i, best_distance in enumerate(best_distances):
+            best_distance = float(best_distance)
+            if best_distance <= tolerance:
+                results.append((int(best_ids[i]), best_distance))
+            else:
+                results.append((None, best_distance))
+        return results
+
+    def match_scoped(self, probe, course_id, semester_id, tolerance=DEFAULT_TOLERANCE):
+        """
+        Matches a probe against the (course_id, semester_id) partition first and
+        only falls back to the full gallery when nothing in the partition is
+        within tolerance, so out-of-session students can still be reported.
+        Returns (student_id, distance, in_scope).
+        """
+        return self.match_scoped_many(probe, course_id, semester_id, tolerance)[0]
+
+    def match_scoped_many(self, probes, course_id, semester_id, tolerance=DEFAULT_TOLERANCE):
+        """
+        Batched match_scoped: all probes are matched against the partition in one
+        pass, and only the unmatched ones are re-run against the full gallery.
+        Returns a list of (student_id, distance, in_scope) per probe.
+        """
+        probes = np.asarray(probes, dtype=np.float32).reshape(-1, ENCODING_DIM)
+        scoped = self.partition(course_id, semester_id).match_many(probes, tolerance)
+        results = [(student_id, distance, True) for student_id, distance in scoped]
+
+        unmatched = [i for i, (student_id, _) in enumerate(scoped) if student_id is None]
+        if unmatched:
+            fallback = self.match_many(probes[unmatched], tolerance)
+            for i, (fallback_id, fallback_distance) in zip(unmatched, fallback):
+                if fallback_id is not None:
+                    results[i] = (fallback_id, fallback_distance, False)
+                else:
+                    # Report the closest distance seen for debugging
+                    distance = results[i][1]
+                    if distance is None:
+                        distance = fallback_distance
+                    results[i] = (None, distance, False)
+        return results
+
+
+# --- Process-wide gallery, loaded lazily on first recognition request ---
+_gallery = FaceGallery()
+_gallery_loaded = False
+_last_sync = 0.0
+_last_file_write = 0.0
+_sync_lock = threading.Lock()
+
+
+def gallery_queryset():
+    """Students that belong in the recognition gallery."""
+    from .models import User
+
+    return User.objects.filter(
+        is_student=True,
+        authorized=True,
+        is_active=True,
+        face_encoding__isnull=False
+    ).exclude(face_encoding=b'').only(
+        'id', 'username', 'face_encoding', 'course_id', 'semester_id', 'is_student', 'authorized', 'is_active'
+    )
+
+
+def in_gallery(student):
+    """Whether a student's encodings belong in the recognition gallery (see gallery_queryset)."""
+    return bool(student.is_student and student.authorized and student.is_active and student.face_encoding)
+
+
+def extra_encodings(students):
+    """(student_id, FaceEncoding id, encoding) for the extra encodings of a student queryset."""
+    from .models import FaceEncoding, unpack_encoding
+
+    for student_id, key, data in FaceEncoding.objects.filter(
+        student__in=students.values('id')
+    ).values_list('student_id', 'id', 'encoding').iterator():
+        try:
+            yield student_id, key, unpack_encoding(data)
+        except ValueError as e:
+            print(f"[Face Load Warning] Could not decode extra encoding #{key}: {e}")
+
+
+def get_gallery():
+    """
+    Returns the process-wide gallery, loading it on first use and replaying
+    changes made by other workers at most every GALLERY_SYNC_INTERVAL seconds.
+    """
+    if not _gallery_loaded:
+        return load_known_faces()
+    return sync_gallery()
+
+
+def _open_shared_gallery():
+    """Memory-maps the shared gallery file if it is present and recent enough to replay from."""
+    from .gallery_file import gallery_file_path, open_gallery_file
+
+    path = gallery_file_path()
+    try:
+        age = time.time() - os.path.getmtime(path)
+    except OSError:
+        return None
+    if age > GALLERY_CHANGE_RETENTION:
+        return None
+    try:
+        return open_gallery_file(path)
+    except (OSError, ValueError) as e:
+        print(f"[Face Load Warning] Could not open shared gallery file {path}: {e}")
+        return None
+
+
+def _write_shared_gallery(gallery):
+    """Rewrites the shared gallery file and returns a memory-mapped gallery over it."""
+    global _last_file_write
+    from .gallery_file import write_gallery_file, open_gallery_file
+
+    _last_file_write = time.monotonic()
+    try:
+        if write_gallery_file(gallery):
+            shared = open_gallery_file()
+            if shared is not None and shared.generation == gallery.generation:
+                return shared
+    except OSError as e:
+        print(f"[Face Load Warning] Could not write shared gallery file: {e}")
+    return gallery
+
+
+def load_known_faces(from_file=True):
+    """
+    Loads the process-wide gallery. The shared gallery file is memory-mapped
+    when available (instant warm start for recycled workers), with newer
+    changes replayed from the log; otherwise encodings are read from the
+    database and the shared file is rebuilt. Run generate_encodings first.
+    """
+    global _gallery, _gallery_loaded, _last_sync
+    from .models import FaceGalleryChange
+
+    gallery = _open_shared_gallery() if from_file else None
+    if gallery is not None and len(gallery):
+        _gallery = gallery
+        _gallery_loaded = True
+        _last_sync = time.monotonic()
+        print(f"[Face Load] Memory-mapped {len(gallery)} known encodings (generation {gallery.generation}).")
+        return sync_gallery(force=True)
+
+    # Read the generation first so changes committed during the load are replayed
+    generation = FaceGalleryChange.latest_generation()
+    students_with_encodings = gallery_queryset()
+
+    print(f"[Face Load] Loading encodings for {students_with_encodings.count()} students from DB...")
+    gallery = FaceGallery.from_students(students_with_encodings, extra_encodings(students_with_encodings))
+    gallery.generation = generation
+    _gallery = _write_shared_gallery(gallery)
+    _gallery_loaded = True
+    _last_sync = time.monotonic()
+    print(f"[Face Load] Loaded {len(_gallery)} known encodings from DB (generation {generation}).")
+    return _gallery
+
+
+def apply_student(gallery, student):
+    """
+    Brings a student's gallery rows (profile encoding plus FaceEncoding rows)
+    in line with the database. Returns True if the gallery changed.
+    """
+    desired = {}
+    if in_gallery(student):
+        encoding = student.get_encoding()
+        if encoding is not None:
+            desired[PRIMARY_KEY] = np.asarray(encoding, dtype=np.float32)
+            for extra in student.face_encodings.all():
+                extra_encoding = extra.get_encoding()
+                if extra_encoding is not None:
+                    desired[extra.id] = np.asarray(extra_encoding, dtype=np.float32)
+    if not desired:
+        return gallery.remove(student.id)
+
+    current_rows, course_id, semester_id = gallery.get_rows(student.id) or ({}, None, None)
+    same_group = course_id == (student.course_id or -1) and semester_id == (student.semester_id or -1)
+    changed = False
+    for key in set(current_rows) - set(desired):
+        gallery.remove(student.id, key)
+        changed = True
+    for key, encoding in desired.items():
+        if same_group and key in current_rows and np.array_equal(current_rows[key], encoding):
+            continue
+        gallery.upsert(student.id, encoding, student.course_id, student.semester_id, key=key)
+        changed = True
+    return changed
+
+
+def sync_gallery(force=False):
+    """
+    Replays FaceGalleryChange entries newer than the gallery generation,
+    refetching only the affected students.
+    """
+    global _gallery, _last_sync
+    from .models import FaceGalleryChange
+
+    now = time.monotonic()
+    if not force and now - _last_sync < GALLERY_SYNC_INTERVAL:
+        return _gallery
+    if now - _last_sync > GALLERY_CHANGE_RETENTION:
+        # The log may have been pruned past our generation
+        return load_known_faces()
+
+    with _sync_lock:
+        _last_sync = now
+        gallery = _gallery
+        changes = list(
+            FaceGalleryChange.objects.filter(id__gt=gallery.generation)
+            .values_list('id', 'student_id')
+        )
+        if not changes:
+            return gallery
+
+        changed_ids = {student_id for _, student_id in changes}
+        students = {
+            s.id: s for s in gallery_queryset().filter(id__in=changed_ids).prefetch_related('face_encodings')
+        }
+        for student_id in changed_ids:
+            student = students.get(student_id)
+            if student is None:
+                gallery.remove(student_id)
+            else:
+                apply_student(gallery, student)
+        gallery.generation = max(change_id for change_id, _ in changes)
+        print(f"[Face Sync] Applied {len(changed_ids)} change(s), now at generation {gallery.generation}.")
+        # Publish the new state so other workers (and restarts) can map it
+        if now - _last_file_write >= GALLERY_FILE_REBUILD_INTERVAL:
+            _gallery = _write_shared_gallery(gallery)
+        return _gallery
+
+
+def pending_gallery(exclude_ids=()):
+    """
+    Gallery of students with an encoding who are not yet authorized, and so
+    not in the recognition gallery. Used for duplicate checks at registration.
+    """
+    from .models import User
+
+    return FaceGallery.from_students(
+        User.objects.filter(is_student=True, authorized=False, face_encoding__isnull=False)
+        .exclude(face_encoding=b'')
+        .exclude(id__in=list(exclude_ids))
+        .only('id', 'username', 'face_encoding', 'course_id', 'semester_id')
+    )
+
+
+def duplicate_candidates(encoding, tolerance=DUPLICATE_TOLERANCE, limit=3, exclude_ids=()):
+    """
+    Enrolled students whose face is within `tolerance` of the encoding, nearest
+    first, as (student_id, distance) pairs (at most `limit`).
+    The live gallery covers authorized students; students still awaiting
+    authorization are checked in the same vectorized way from the database.
+    """
+    exclude_ids = {int(student_id) for student_id in exclude_ids}
+    candidates = get_gallery().nearest_k(encoding, limit + len(exclude_ids))
+    candidates += pending_gallery(exclude_ids).nearest_k(encoding, limit)
+
+    candidates = sorted(
+        (candidate for candidate in candidates
+         if candidate[0] not in exclude_ids and candidate[1] <= tolerance),
+        key=lambda candidate: candidate[1]
+    )
+    return candidates[:limit]
+
+
+def publish_student_change(student, deleted=False, row_changed=False):
+    """
+    Applies a student change to this process's gallery and records it in the
+    change log so other workers pick it up on their next sync. Only changes
+    that added, replaced or removed gallery rows are recorded: row_changed
+    tells that the caller saw the student's rows change in the database,
+    since this process's gallery may be stale (web processes sync lazily).
+    """
+    from .models import FaceGalleryChange
+
+    if deleted:
+        changed = _gallery.remove(student.id)
+    else:
+        changed = apply_student(_gallery, student)
+    if changed or deleted or row_changed:
+        FaceGalleryChange.record(student.id)
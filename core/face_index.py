@@ -0,0 +1,181 @@
+"""
+Nearest-neighbour search behind FaceGallery.
+
+Small galleries are searched exhaustively with one matrix product. Large
+multi-campus galleries use an inverted-file (IVF) index: encodings are
+clustered with k-means and each probe is compared only against the rows of
+its FACE_INDEX_PROBES nearest clusters. Distances to those candidates are
+exact, so the tolerance check is unchanged; only a true nearest neighbour
+sitting in an unprobed cluster can be missed. Raise FACE_INDEX_PROBES for
+recall, lower it for latency, and measure both with
+`python manage.py benchmark_face_index`.
+
+Settings:
+    FACE_INDEX           'auto' (IVF from FACE_INDEX_MIN_SIZE rows), 'ivf' or 'brute'
+    FACE_INDEX_MIN_SIZE  gallery size at which 'auto' switches to IVF
+    FACE_INDEX_LISTS     number of clusters (0 = about sqrt(N))
+    FACE_INDEX_PROBES    clusters searched per probe
+"""
+import numpy as np
+from django.conf import settings
+
+FACE_INDEX = getattr(settings, 'FACE_INDEX', 'auto')
+FACE_INDEX_MIN_SIZE = getattr(settings, 'FACE_INDEX_MIN_SIZE', 20000)
+FACE_INDEX_LISTS = getattr(settings, 'FACE_INDEX_LISTS', 0)
+FACE_INDEX_PROBES = getattr(settings, 'FACE_INDEX_PROBES', 8)
+
+KMEANS_ITERATIONS = 10
+# Training points sampled per cluster
+KMEANS_SAMPLE_PER_LIST = 64
+# Rows per block when assigning points to clusters, bounds temporary memory
+ASSIGN_CHUNK = 8192
+
+
+def use_index(size, kind=FACE_INDEX, min_size=FACE_INDEX_MIN_SIZE):
+    """Whether a gallery of the given size should be searched through an IVF index."""
+    if kind == 'ivf':
+        return size >= 2
+    if kind == 'auto':
+        return size >= min_size
+    return False
+
+
+def default_list_count(size):
+    """About sqrt(N) clusters, the usual IVF balance between list scans and centroid scans."""
+    return max(1, int(round(np.sqrt(size))))
+
+
+def squared_distances(points, centroids, centroid_sq=None):
+    """Squared Euclidean distances (len(points), len(centroids)) via the norm trick."""
+    if centroid_sq is None:
+        centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    point_sq = np.einsum('ij,ij->i', points, points)
+    sq = point_sq[:, np.newaxis] - 2.0 * (points @ centroids.T) + centroid_sq[np.newaxis, :]
+    return np.maximum(sq, 0.0, out=sq)
+
+
+def nearest_centroids(points, centroids):
+    """Index of the closest centroid for every point, computed in blocks."""
+    centroid_sq = np.einsum('ij,ij->i', centroids, centroids)
+    labels = np.empty(len(points), dtype=np.int32)
+    for start in range(0, len(points), ASSIGN_CHUNK):
+        block = points[start:start + ASSIGN_CHUNK]
+        labels[start:start + len(block)] = np.argmin(squared_distances(block, centroids, centroid_sq), axis=1)
+    return labels
+
+
+def kmeans(points, n_clusters, iterations=KMEANS_ITERATIONS, seed=0):
+    """
+    Lloyd's k-means on a random sample of the points. Empty clusters are
+    reseeded from random sample points. Returns (n_clusters, dim) float32 centroids.
+    """
+    rng = np.random.default_rng(seed)
+    points = np.asarray(points, dtype=np.float32)
+    n_clusters = min(n_clusters, len(points))
+    sample_size = min(len(points), n_clusters * KMEANS_SAMPLE_PER_LIST)
+    sample = points[np.sort(rng.choice(len(points), sample_size, replace=False))]
+
+    centroids = sample[rng.choice(len(sample), n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = nearest_centroids(sample, centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+        empty = np.flatnonzero(~filled)
+        if len(empty):
+            centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file index over the rows of a FaceGallery.
+
+    The index stores only the cluster of each row; encodings and squared norms
+    are passed in at search time, so it follows the gallery's in-place row
+    updates through update_row/remove_row without retraining.
+    """
+
+    def __init__(self, centroids, labels, n_probe=FACE_INDEX_PROBES):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self._centroid_sq = np.einsum('ij,ij->i', self.centroids, self.centroids)
+        self._labels = np.array(labels, dtype=np.int32)
+        self._size = len(labels)
+        self.trained_size = self._size
+        self.n_probe = n_probe
+        self._order = None
+        self._offsets = None
+
+    @classmethod
+    def train(cls, encodings, n_lists=FACE_INDEX_LISTS, n_probe=FACE_INDEX_PROBES, seed=0):
+        """Clusters the encodings and assigns every row to its nearest cluster."""
+        encodings = np.asarray(encodings, dtype=np.float32)
+        n_lists = n_lists or default_list_count(len(encodings))
+        centroids = kmeans(encodings, n_lists, seed=seed)
+        return cls(centroids, nearest_centroids(encodings, centroids), n_probe)
+
+    @property
+    def n_lists(self):
+        return len(self.centroids)
+
+    def needs_retrain(self, size):
+        """Clusters trained on a much smaller or larger gallery no longer balance well."""
+        return size > 2 * self.trained_size or 2 * size < self.trained_size
+
+    # --- Row maintenance, mirroring FaceGallery.upsert/remove ---
+    def update_row(self, row, encoding):
+        """Assigns a new or replaced gallery row to its nearest cluster."""
+        if row >= len(self._labels):
+            grown = np.empty(max(16, 2 * len(self._labels), row + 1), dtype=np.int32)
+            grown[:self._size] = self._labels[:self._size]
+            self._labels = grown
+        encoding = np.asarray(encoding, dtype=np.float32).reshape(1, -1)
+        self._labels[row] = nearest_centroids(encoding, self.centroids)[0]
+        self._size = max(self._size, row + 1)
+        self._order = None
+
+    def remove_row(self, row, last):
+        """Mirrors the gallery's swap-with-last removal of `row`."""
+        if row != last:
+            self._labels[row] = self._labels[last]
+        self._size -= 1
+        self._order = None
+
+    def _lists(self):
+        """Rows grouped by cluster: (order, offsets) so list c is order[offsets[c]:offsets[c + 1]]."""
+        if self._order is None:
+            labels = self._labels[:self._size]
+            self._order = np.argsort(labels, kind='stable')
+            self._offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=self.n_lists))))
+        return self._order, self._offsets
+
+    # --- Search ---
+    def search(self, probes, encodings, sq_norms, n_probe=None):
+        """
+        Approximate nearest row for each probe.
+        Returns (rows, distances): int64 and float32 arrays of length len(probes).
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        probes = np.asarray(probes, dtype=np.float32)
+        order, offsets = self._lists()
+
+        centroid_distances = squared_distances(probes, self.centroids, self._centroid_sq)
+        if n_probe < self.n_lists:
+            probed = np.argpartition(centroid_distances, n_probe - 1, axis=1)[:, :n_probe]
+        else:
+            probed = np.broadcast_to(np.arange(self.n_lists), (len(probes), self.n_lists))
+
+        rows = np.empty(len(probes), dtype=np.int64)
+        distances = np.empty(len(probes), dtype=np.float32)
+        for i, probe in enumerate(probes):
+            candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probed[i]])
+            if not len(candidates):
+                # Every probed cluster is empty (rows were removed): scan all rows
+                candidates = order
+            sq = sq_norms[candidates] - 2.0 * (encodings[candidates] @ probe) + float(probe @ probe)
+            best = int(np.argmin(sq))
+            rows[i] = candidates[best]
+            distances[i] = np.sqrt(max(float(sq[best]), 0.0))
+        return rows, distances
@@ -0,0 +1,223 @@
+"""
+Detection and encoding stages shared by the recognition views.
+
+HOG detection cost grows with pixel count, while kiosk faces are large, so
+frames are downscaled to the camera's detection width before face_locations
+and the boxes are scaled back up. Encodings are still computed on the
+full-resolution frame so the 128-d descriptors see the sharp original crop.
+
+Frames recognized together (see recognition_engine.process_frames) are encoded
+with a single batched dlib call by encode_faces_batch.
+
+Enrollment photos go through load_face_image / encode_face_image, shared by
+registration, the bulk importer and generate_encodings.
+
+dlib and face_recognition are imported on first use, so modules that only
+need the camera lookups or image helpers (and their tests) load without them.
+"""
+import hashlib
+import io
+import threading
+import time
+
+import cv2
+import numpy as np
+from PIL import Image, ImageOps
+
+DEFAULT_DETECTION_WIDTH = 320
+# Enrollment photos larger than this are shrunk before detection
+MAX_PHOTO_DIMENSION = 1600
+# Seconds a camera's settings are cached before being re-read from the DB
+CAMERA_CONFIG_TTL = 30
+
+_camera_cache = {}
+_camera_cache_lock = threading.Lock()
+
+_dlib_face_models = None
+_dlib_face_models_lock = threading.Lock()
+
+
+def get_camera(camera_id):
+    """
+    Returns the Camera for a request's camera_id, cached for CAMERA_CONFIG_TTL
+    seconds so per-frame lookups don't hit the database. None if unknown.
+    """
+    from .models import Camera
+
+    try:
+        camera_id = int(camera_id)
+    except (TypeError, ValueError):
+        return None
+
+    now = time.monotonic()
+    with _camera_cache_lock:
+        cached = _camera_cache.get(camera_id)
+        if cached is not None and now - cached[0] < CAMERA_CONFIG_TTL:
+            return cached[1]
+
+    camera = Camera.objects.filter(pk=camera_id).first()
+    with _camera_cache_lock:
+        _camera_cache[camera_id] = (now, camera)
+    return camera
+
+
+def get_detection_width(camera_id):
+    """Detection width configured for a camera, or the default for unknown cameras."""
+    camera = get_camera(camera_id)
+    if camera is None:
+        return DEFAULT_DETECTION_WIDTH
+    return camera.detection_width
+
+
+def get_recognition_fps(camera_id):
+    """Maximum recognition frame rate for a camera, or None (unlimited) for unknown cameras."""
+    camera = get_camera(camera_id)
+    if camera is None:
+        return None
+    return camera.recognition_fps
+
+
+def locate_faces(rgb_frame, model="hog", upsample=1):
+    """face_recognition.face_locations on a frame, as (top, right, bottom, left) tuples."""
+    import face_recognition
+
+    return face_recognition.face_locations(rgb_frame, number_of_times_to_upsample=upsample, model=model)
+
+
+def detect_faces(rgb_frame, detection_width=DEFAULT_DETECTION_WIDTH, model="hog"):
+    """
+    Finds face boxes on a downscaled copy of the frame and returns them as
+    (top, right, bottom, left) tuples in full-resolution coordinates.
+    A detection width of 0, or one at least as wide as the frame, disables scaling.
+    """
+    height, width = rgb_frame.shape[:2]
+    if not detection_width or width <= detection_width:
+        return locate_faces(rgb_frame, model=model)
+
+    scale = detection_width / width
+    small_height = max(1, int(round(height * scale)))
+    small_frame = cv2.resize(rgb_frame, (detection_width, small_height), interpolation=cv2.INTER_AREA)
+    small_locations = locate_faces(small_frame, model=model)
+
+    # Rescale boxes back to the original frame, clamped to its bounds
+    scale_x = width / detection_width
+    scale_y = height / small_height
+    locations = []
+    for top, right, bottom, left in small_locations:
+        locations.append((
+            max(0, int(round(top * scale_y))),
+            min(width, int(round(right * scale_x))),
+            min(height, int(round(bottom * scale_y))),
+            max(0, int(round(left * scale_x))),
+        ))
+    return locations
+
+
+def encode_faces(rgb_frame, face_locations):
+    """Computes 128-d encodings for the given boxes on the full-resolution frame."""
+    if not face_locations:
+        return []
+    import face_recognition
+
+    return face_recognition.face_encodings(rgb_frame, face_locations)
+
+
+def get_dlib_face_models():
+    """
+    The 5-point landmark predictor and face encoder that
+    face_recognition.face_encodings uses by default (model="small"), loaded
+    once per process from the face_recognition_models package.
+    """
+    global _dlib_face_models
+    with _dlib_face_models_lock:
+        if _dlib_face_models is None:
+            import dlib
+            import face_recognition_models
+
+            _dlib_face_models = (
+                dlib.shape_predictor(face_recognition_models.pose_predictor_five_point_model_location()),
+                dlib.face_recognition_model_v1(face_recognition_models.face_recognition_model_location()),
+            )
+        return _dlib_face_models
+
+
+def encode_faces_batch(frames):
+    """
+    Encodes the faces of several frames with one dlib descriptor call.
+    `frames` is a list of (rgb_frame, face_locations); returns one list of
+    encodings per frame, equal to calling encode_faces on each (same 5-point
+    landmarks, encoder and single jitter). Falls back to per-frame calls if
+    this dlib build has no batch descriptor API.
+    """
+    if sum(1 for _, face_locations in frames if face_locations) <= 1:
+        return [encode_faces(rgb_frame, face_locations) for rgb_frame, face_locations in frames]
+
+    import dlib
+
+    pose_predictor, face_encoder = get_dlib_face_models()
+    images = []
+    shapes = []
+    for rgb_frame, face_locations in frames:
+        if face_locations:
+            images.append(rgb_frame)
+            detections = dlib.full_object_detections()
+            for top, right, bottom, left in face_locations:
+                detections.append(pose_predictor(rgb_frame, dlib.rectangle(left, top, right, bottom)))
+            shapes.append(detections)
+
+    try:
+        batched = face_encoder.compute_face_descriptor(images, shapes, 1)
+    except (TypeError, RuntimeError):
+        return [encode_faces(rgb_frame, face_locations) for rgb_frame, face_locations in frames]
+
+    descriptors = iter(batched)
+    results = []
+    for _, face_locations in frames:
+        if face_locations:
+            results.append([np.array(descriptor) for descriptor in next(descriptors)])
+        else:
+            results.append([])
+    return results
+
+
+def load_face_image(source, max_dimension=MAX_PHOTO_DIMENSION):
+    """
+    Decodes an enrollment photo (path, file object or bytes) into an 8-bit RGB
+    array with EXIF rotation applied and the longest side capped at max_dimension.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    with Image.open(source) as pil_image:
+        # Fix EXIF rotation (mobile photo issues)
+        pil_image = ImageOps.exif_transpose(pil_image)
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert("RGB")
+        if max(pil_image.size) > max_dimension:
+            pil_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        return np.ascontiguousarray(pil_image, dtype=np.uint8)
+
+
+def photo_hash(data):
+    """SHA-256 of a photo's file content, used to skip photos that were already encoded."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_face_image(image_array, use_cnn=False):
+    """
+    Finds the first face in an enrollment photo and encodes it.
+    Tries HOG, then CNN (if use_cnn), then HOG with more upsampling.
+    Returns (location, encoding), or (None, None) if no face was found.
+    """
+    face_locations = locate_faces(image_array, model='hog', upsample=1)
+    if not face_locations and use_cnn:
+        face_locations = locate_faces(image_array, model='cnn')
+    if not face_locations:
+        face_locations = locate_faces(image_array, model='hog', upsample=2)
+    if not face_locations:
+        return None, None
+
+    encodings = encode_faces(image_array, face_locations[:1])
+    if not encodings:
+        return None, None
+    return tuple(int(v) for v in face_locations[0]), np.asarray(encodings[0], dtype=np.float32)
+
@@ -0,0 +1,193 @@
+"""
+Per-camera face tracking so a lingering face is encoded once, not every frame.
+
+Each stream (camera + endpoint + attendance session) keeps a short list of
+tracks: the last box of a face and, once a frame matched it, the student it
+belongs to. On the next frame the recognition worker associates fresh
+detections with those tracks by IoU (falling back to centroid distance for
+fast movement). A detection that continues a track with a known identity
+reuses it and skips the 128-d encoding; everything else is encoded and
+matched as usual. Identities are re-verified every FACE_TRACK_REFRESH_INTERVAL
+seconds, and a track that is not seen for FACE_TRACK_MAX_AGE seconds is lost.
+
+Tracks live in the web process (which sees every frame of its streams); the
+workers only receive a snapshot with each frame.
+"""
+import itertools
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+# Minimum box overlap for a detection to continue a track
+TRACK_IOU_THRESHOLD = 0.3
+# Maximum centroid shift, as a fraction of the track's box width, when boxes don't overlap enough
+TRACK_CENTROID_THRESHOLD = 0.5
+# Seconds a track survives without being detected
+TRACK_MAX_AGE = getattr(settings, 'FACE_TRACK_MAX_AGE', 1.5)
+# Seconds a track's identity is reused before the face is encoded again
+TRACK_REFRESH_INTERVAL = getattr(settings, 'FACE_TRACK_REFRESH_INTERVAL', 3.0)
+# Streams idle for longer than this are forgotten
+TRACK_STREAM_IDLE = 10 * 60
+
+
+def box_iou_matrix(boxes_a, boxes_b):
+    """IoU between every pair of (top, right, bottom, left) boxes, as an (A, B) array."""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)
+    top = np.maximum(a[:, None, 0], b[None, :, 0])
+    right = np.minimum(a[:, None, 1], b[None, :, 1])
+    bottom = np.minimum(a[:, None, 2], b[None, :, 2])
+    left = np.maximum(a[:, None, 3], b[None, :, 3])
+    intersection = np.clip(right - left, 0, None) * np.clip(bottom - top, 0, None)
+    area_a = (a[:, 1] - a[:, 3]) * (a[:, 2] - a[:, 0])
+    area_b = (b[:, 1] - b[:, 3]) * (b[:, 2] - b[:, 0])
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-6), 0.0)
+
+
+def associate(face_locations, track_boxes,
+              iou_threshold=TRACK_IOU_THRESHOLD, centroid_threshold=TRACK_CENTROID_THRESHOLD):
+    """
+    Greedily pairs detections with track boxes, best IoU first, then by nearest
+    centroid for detections that moved too far to overlap.
+    Returns a list with the matched track index (or None) for each detection.
+    """
+    assignment = [None] * len(face_locations)
+    if not face_locations or not track_boxes:
+        return assignment
+
+    iou = box_iou_matrix(face_locations, track_boxes)
+    used_tracks = set()
+    for flat in np.argsort(-iou, axis=None):
+        face_index, track_index = np.unravel_index(flat, iou.shape)
+        if iou[face_index, track_index] < iou_threshold:
+            break
+        if assignment[face_index] is None and track_index not in used_tracks:
+            assignment[face_index] = int(track_index)
+            used_tracks.add(track_index)
+
+    faces = np.asarray(face_locations, dtype=np.float32).reshape(-1, 4)
+    tracks = np.asarray(track_boxes, dtype=np.float32).reshape(-1, 4)
+    face_centers = np.stack([(faces[:, 1] + faces[:, 3]) / 2, (faces[:, 0] + faces[:, 2]) / 2], axis=1)
+    track_centers = np.stack([(tracks[:, 1] + tracks[:, 3]) / 2, (tracks[:, 0] + tracks[:, 2]) / 2], axis=1)
+    track_widths = np.maximum(tracks[:, 1] - tracks[:, 3], 1.0)
+    shift = np.linalg.norm(face_centers[:, None, :] - track_centers[None, :, :], axis=2) / track_widths[None, :]
+    for flat in np.argsort(shift, axis=None):
+        face_index, track_index = np.unravel_index(flat, shift.shape)
+        if shift[face_index, track_index] > centroid_threshold:
+            break
+        if assignment[face_index] is None and track_index not in used_tracks:
+            assignment[face_index] = int(track_index)
+            used_tracks.add(track_index)
+    return assignment
+
+
+def reuse_track_identities(face_locations, tracks):
+    """
+    Matches detections against a tracker snapshot (see FaceTracker.snapshot).
+    Returns (track_id, identity) for each detection: track_id is None for a new
+    face, and identity is the (student_id, distance, in_scope) to reuse, or
+    None if the face must be encoded.
+    """
+    if not tracks:
+        return [(None, None)] * len(face_locations)
+    assignment = associate(face_locations, [track['box'] for track in tracks])
+    reused = []
+    for track_index in assignment:
+        if track_index is None:
+            reused.append((None, None))
+        else:
+            track = tracks[track_index]
+            reused.append((track['track_id'], track['identity']))
+    return reused
+
+
+class Track:
+    """One face followed across frames of a stream."""
+
+    def __init__(self, track_id, box, now):
+        self.track_id = track_id
+        self.box = box
+        self.last_seen = now
+        self.identity = None
+        self.identified_at = 0.0
+
+
+class FaceTracker:
+    """Tracks keyed by stream, updated from recognition results."""
+
+    def __init__(self, max_age=TRACK_MAX_AGE, refresh_interval=TRACK_REFRESH_INTERVAL):
+        self.max_age = max_age
+        self.refresh_interval = refresh_interval
+        self._streams = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def snapshot(self, key):
+        """
+        Live tracks of a stream as plain dicts for the recognition worker.
+        'identity' is only set while the track's identity is fresh.
+        """
+        if key is None:
+            return []
+        now = time.monotonic()
+        with self._lock:
+            self._forget_idle(now)
+            stream = self._streams.get(key)
+            if not stream:
+                return []
+            live = [track for track in stream.values() if now - track.last_seen <= self.max_age]
+            for track_id in set(stream) - {track.track_id for track in live}:
+                del stream[track_id]
+            return [{
+                'track_id': track.track_id,
+                'box': track.box,
+                'identity': track.identity if now - track.identified_at < self.refresh_interval else None,
+            } for track in live]
+
+    def update(self, key, result):
+        """
+        Folds a recognition result back into the stream's tracks. Faces that
+        were encoded this frame (re)set their track's identity; a face that did
+        not match anyone leaves the track unidentified so it is encoded again.
+        """
+        if key is None:
+            return
+        now = time.monotonic()
+        encoded = set(result.get('encoded', ()))
+        with self._lock:
+            stream = self._streams.setdefault(key, {})
+            for index, (box, track_id, match) in enumerate(zip(result['locations'], result['track_ids'], result['matches'])):
+                track = stream.get(track_id) if track_id is not None else None
+                if track is None:
+                    track = Track(next(self._ids), box, now)
+                    stream[track.track_id] = track
+                track.box = box
+                track.last_seen = now
+                if index in encoded:
+                    if match[0] is not None:
+                        track.identity = tuple(match)
+                        track.identified_at = now
+                    else:
+                        track.identity = None
+
+    def forget(self, key=None):
+        """Drops the tracks of one stream, or of all streams."""
+        with self._lock:
+            if key is None:
+                self._streams.clear()
+            else:
+                self._streams.pop(key, None)
+
+    def _forget_idle(self, now):
+        idle = [
+            key for key, stream in self._streams.items()
+            if all(now - track.last_seen > TRACK_STREAM_IDLE for track in stream.values())
+        ]
+        for key in idle:
+            del self._streams[key]
+
+
+face_tracker = FaceTracker()
@@ -0,0 +1,124 @@
+"""
+Per-camera gating in front of the recognition endpoints.
+
+The kiosk posts frames continuously, so most of them show an empty doorway or
+the same student standing still. Each stream (camera + endpoint + attendance
+session) keeps a tiny grayscale thumbnail of the last processed frame and the
+response it produced. A new frame is short-circuited with that cached response
+when the scene has not changed. Frames of a changed scene that arrive faster
+than the camera's recognition_fps are skipped with an explicit 429 answer; the
+cached response is never replayed for them, since it may belong to someone else.
+"""
+import threading
+import time
+
+import cv2
+import numpy as np
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+
+THUMBNAIL_SIZE = (32, 24)
+# Mean absolute grayscale difference (0-255) below which a scene is "unchanged"
+FRAME_DIFF_THRESHOLD = getattr(settings, 'FRAME_GATE_DIFF_THRESHOLD', 4.0)
+# Seconds a cached response may be replayed for an unchanged scene
+FRAME_RESULT_TTL = getattr(settings, 'FRAME_GATE_RESULT_TTL', 3.0)
+# Streams idle for longer than this are forgotten
+FRAME_STREAM_IDLE = 10 * 60
+
+
+def frame_thumbnail(frame):
+    """Downscaled grayscale copy of a BGR frame used for change detection."""
+    small = cv2.resize(frame, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY).astype(np.int16)
+
+
+class StreamState:
+    """Last processed thumbnail, time and response for one stream."""
+
+    def __init__(self):
+        self.last_processed = 0.0
+        self.pending_thumbnail = None
+        self.thumbnail = None
+        self.response = None
+        self.response_time = 0.0
+
+
+class FrameGate:
+    """Frame-difference and max-FPS gate keyed by stream."""
+
+    def __init__(self, diff_threshold=FRAME_DIFF_THRESHOLD, result_ttl=FRAME_RESULT_TTL):
+        self.diff_threshold = diff_threshold
+        self.result_ttl = result_ttl
+        self._streams = {}
+        self._lock = threading.Lock()
+
+    def check(self, key, frame, max_fps=None):
+        """
+        Decides whether a frame needs processing.
+        Returns (cached_response, reason): reason is None when the frame should be
+        processed, otherwise 'unchanged' (cached_response is the stream's last
+        response, still fresh) or 'rate_limited' (cached_response is None).
+        """
+        thumbnail = frame_thumbnail(frame)
+        now = time.monotonic()
+        with self._lock:
+            self._forget_idle(now)
+            state = self._streams.setdefault(key, StreamState())
+
+            cached = None
+            if state.response is not None and now - state.response_time <= self.result_ttl:
+                cached = state.response
+
+            if cached is not None and state.thumbnail is not None:
+                difference = float(np.mean(np.abs(thumbnail - state.thumbnail)))
+                if difference < self.diff_threshold:
+                    return cached, 'unchanged'
+
+            if max_fps and now - state.last_processed < 1.0 / max_fps:
+                return None, 'rate_limited'
+
+            state.last_processed = now
+            state.pending_thumbnail = thumbnail
+            return None, None
+
+    def remember(self, key, response):
+        """Caches a successful response against the thumbnail of the frame that produced it."""
+        if response.status_code != 200:
+            return
+        with self._lock:
+            state = self._streams.get(key)
+            if state is None or state.pending_thumbnail is None:
+                return
+            state.thumbnail = state.pending_thumbnail
+            state.response = (response.status_code, response.content)
+            state.response_time = time.monotonic()
+
+    def forget(self, key=None):
+        """Drops cached state for one stream, or for all streams."""
+        with self._lock:
+            if key is None:
+                self._streams.clear()
+            else:
+                self._streams.pop(key, None)
+
+    def _forget_idle(self, now):
+        idle = [key for key, state in self._streams.items() if now - state.last_processed > FRAME_STREAM_IDLE]
+        for key in idle:
+            del self._streams[key]
+
+
+def gated_http_response(cached, reason):
+    """
+    Builds the answer for a gated frame: the replayed response for an
+    unchanged scene, or a 429 "busy" answer for a rate-limited one.
+    """
+    if cached is None:
+        response = JsonResponse({'status': 'busy', 'message': 'Frame skipped: camera frame rate limit.'}, status=429)
+    else:
+        status_code, content = cached
+        response = HttpResponse(content, content_type='application/json', status=status_code)
+    response['X-Frame-Gate'] = reason
+    return response
+
+
+frame_gate = FrameGate()
@@ -0,0 +1,146 @@
+"""
+Adaptive gallery enrichment from confident kiosk recognitions.
+
+Faces that the kiosk matches with a very small distance are offered here after
+the frame is answered. A background thread stores a few of them per student as
+'kiosk' FaceEncoding rows, so the gallery follows gradual changes in a
+student's appearance (haircut, glasses, seasonal lighting) without a new
+enrollment photo.
+
+- Only faces encoded in that frame (not tracker reuses) within
+  FACE_ENRICHMENT_DISTANCE of an in-session student are sampled.
+- A student is sampled at most once per FACE_ENRICHMENT_INTERVAL seconds.
+- A sample is kept only if it is at least FACE_ENRICHMENT_MIN_DIVERSITY away
+  from all of the student's current encodings (near-duplicates add nothing).
+- At most FACE_ENRICHMENT_MAX_SAMPLES kiosk rows are kept per student; the
+  oldest is replaced first (FaceEncoding.add also applies the overall cap).
+
+The FaceEncoding signals update the live gallery incrementally. Enrichment is
+off unless FACE_ENRICHMENT_ENABLED is set.
+"""
+import queue
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+FACE_ENRICHMENT_ENABLED = getattr(settings, 'FACE_ENRICHMENT_ENABLED', False)
+FACE_ENRICHMENT_DISTANCE = getattr(settings, 'FACE_ENRICHMENT_DISTANCE', 0.3)
+FACE_ENRICHMENT_MIN_DIVERSITY = getattr(settings, 'FACE_ENRICHMENT_MIN_DIVERSITY', 0.15)
+FACE_ENRICHMENT_MAX_SAMPLES = getattr(settings, 'FACE_ENRICHMENT_MAX_SAMPLES', 3)
+FACE_ENRICHMENT_INTERVAL = getattr(settings, 'FACE_ENRICHMENT_INTERVAL', 60 * 60)
+# Samples waiting for the background thread; further offers are dropped
+FACE_ENRICHMENT_QUEUE_SIZE = 64
+
+
+def confident_samples(result, max_distance=FACE_ENRICHMENT_DISTANCE):
+    """
+    (student_id, encoding) for the faces of a recognition engine result that
+    were encoded in this frame and matched an in-session student within max_distance.
+    """
+    samples = []
+    for encoding, index in zip(result.get('encodings', ()), result.get('encoded', ())):
+        student_id, distance, in_scope = result['matches'][index]
+        if student_id is not None and in_scope and distance is not None and distance <= max_distance:
+            samples.append((int(student_id), encoding))
+    return samples
+
+
+def is_diverse(encoding, existing, min_distance=FACE_ENRICHMENT_MIN_DIVERSITY):
+    """True if encoding is at least min_distance away from every existing encoding."""
+    if not len(existing):
+        return True
+    existing = np.asarray(existing, dtype=np.float32).reshape(-1, 128)
+    distances = np.linalg.norm(existing - np.asarray(encoding, dtype=np.float32), axis=1)
+    return float(distances.min()) >= min_distance
+
+
+def store_sample(student_id, encoding, min_distance=FACE_ENRICHMENT_MIN_DIVERSITY,
+                 max_samples=FACE_ENRICHMENT_MAX_SAMPLES):
+    """
+    Adds a kiosk encoding for a student if it is diverse enough, replacing
+    their oldest kiosk samples beyond max_samples.
+    Returns 'stored', 'similar' or 'missing'.
+    """
+    from .models import FaceEncoding, User
+
+    if max_samples <= 0:
+        return 'similar'
+    student = User.objects.filter(pk=student_id, is_student=True, authorized=True).first()
+    if student is None or not student.face_encoding:
+        return 'missing'
+    extras = list(student.face_encodings.all())
+    existing = [student.get_encoding()] + [extra.get_encoding() for extra in extras]
+    existing = [e for e in existing if e is not None]
+    if not is_diverse(encoding, existing, min_distance):
+        return 'similar'
+
+    # Rolling window: make room by dropping the oldest kiosk samples first
+    kiosk = [extra for extra in extras if extra.source == 'kiosk']
+    with transaction.atomic():
+        for extra in kiosk[:max(0, len(kiosk) - max_samples + 1)]:
+            extra.delete()
+        entry = FaceEncoding.add(student, encoding, source='kiosk')
+    return 'stored' if entry is not None else 'similar'
+
+
+class GalleryEnricher:
+    """Rate-limited, bounded hand-off of confident kiosk samples to a background thread."""
+
+    def __init__(self, enabled=FACE_ENRICHMENT_ENABLED, interval=FACE_ENRICHMENT_INTERVAL,
+                 max_distance=FACE_ENRICHMENT_DISTANCE, queue_size=FACE_ENRICHMENT_QUEUE_SIZE):
+        self.enabled = enabled
+        self.interval = interval
+        self.max_distance = max_distance
+        self._queue = queue.Queue(maxsize=queue_size)
+        # student_id -> monotonic time of the last accepted sample
+        self._last_sampled = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def offer(self, result):
+        """Queues the confident faces of a recognition result; never blocks the request."""
+        if not self.enabled:
+            return 0
+        samples = confident_samples(result, self.max_distance)
+        if not samples:
+            return 0
+        queued = 0
+        now = time.monotonic()
+        with self._lock:
+            if len(self._last_sampled) > 10000:
+                self._last_sampled = {
+                    student_id: t for student_id, t in self._last_sampled.items() if now - t < self.interval
+                }
+            for student_id, encoding in samples:
+                last = self._last_sampled.get(student_id)
+                if last is not None and now - last < self.interval:
+                    continue
+                try:
+                    self._queue.put_nowait((student_id, np.array(encoding, dtype=np.float32)))
+                except queue.Full:
+                    break
+                self._last_sampled[student_id] = now
+                queued += 1
+            if queued and (self._thread is None or not self._thread.is_alive()):
+                self._thread = threading.Thread(target=self._run, name='gallery-enrichment', daemon=True)
+                self._thread.start()
+        return queued
+
+    def _run(self):
+        while True:
+            student_id, encoding = self._queue.get()
+            close_old_connections()
+            try:
+                result = store_sample(student_id, encoding)
+                if result == 'stored':
+                    print(f"[Gallery Enrichment] Stored a kiosk encoding for student {student_id}")
+            except Exception as e:
+                print(f"[Gallery Enrichment] Student {student_id} failed: {e}")
+            finally:
+                close_old_connections()
+
+
+gallery_enricher = GalleryEnricher()
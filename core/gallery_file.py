@@ -0,0 +1,174 @@
+"""
+Consolidated on-disk face gallery shared by all worker processes.
+
+Layout (little-endian, every section 8-byte aligned):
+
+    header      64 bytes: magic, version, count, dim, generation
+    ids         int64[count]   student id of each row
+    keys        int64[count]   0 for the profile encoding, else FaceEncoding id
+    course_ids  int64[count]
+    semester_ids int64[count]
+    sq_norms    float32[count]  (padded to 8 bytes)
+    encodings   float32[count, dim]
+
+The file is written to a temporary name and moved into place with os.replace,
+so readers never see a partial file. Workers open it with np.memmap in
+read-only mode and share one page-cached copy of the matrix.
+"""
+import os
+import struct
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+GALLERY_FILE_MAGIC = b'FGAL'
+GALLERY_FILE_VERSION = 2
+HEADER_FORMAT = '<4sIQIQ'
+HEADER_SIZE = 64
+
+
+def gallery_file_path():
+    """Location of the shared gallery file (FACE_GALLERY_FILE setting)."""
+    return getattr(settings, 'FACE_GALLERY_FILE', os.path.join(settings.BASE_DIR, 'encodings', 'gallery.bin'))
+
+
+def _aligned(nbytes):
+    return (nbytes + 7) // 8 * 8
+
+
+def _layout(count, dim):
+    """Byte offsets of each section for a gallery of the given size."""
+    offsets = {}
+    position = HEADER_SIZE
+    for name, nbytes in (
+        ('ids', 8 * count),
+        ('keys', 8 * count),
+        ('course_ids', 8 * count),
+        ('semester_ids', 8 * count),
+        ('sq_norms', 4 * count),
+        ('encodings', 4 * count * dim),
+    ):
+        offsets[name] = position
+        position += _aligned(nbytes)
+    return offsets, position
+
+
+def _parse_header(raw):
+    """Returns (count, dim, generation) from the first HEADER_SIZE bytes, or None if invalid."""
+    from .face_gallery import ENCODING_DIM
+
+    if len(raw) < HEADER_SIZE:
+        return None
+    magic, version, count, dim, generation = struct.unpack_from(HEADER_FORMAT, raw)
+    if magic != GALLERY_FILE_MAGIC or version != GALLERY_FILE_VERSION or dim != ENCODING_DIM:
+        return None
+    return count, dim, generation
+
+
+def read_header(path=None):
+    """Returns (count, dim, generation) or None if the file is missing or invalid."""
+    path = path or gallery_file_path()
+    try:
+        with open(path, 'rb') as f:
+            raw = f.read(HEADER_SIZE)
+    except OSError:
+        return None
+    return _parse_header(raw)
+
+
+def write_gallery_file(gallery, path=None):
+    """
+    Atomically writes the gallery to disk. A file already holding a newer
+    generation is left alone. Returns True if the file was replaced.
+    """
+    path = path or gallery_file_path()
+    existing = read_header(path)
+    if existing is not None and existing[2] > gallery.generation:
+        return False
+
+    with gallery._lock:
+        ids = np.array(gallery.ids, dtype='<i8')
+        keys = np.array(gallery.keys, dtype='<i8')
+        course_ids = np.array(gallery.course_ids, dtype='<i8')
+        semester_ids = np.array(gallery.semester_ids, dtype='<i8')
+        sq_norms = np.array(gallery.sq_norms, dtype='<f4')
+        encodings = np.array(gallery.encodings, dtype='<f4')
+        generation = gallery.generation
+
+    count, dim = encodings.shape
+    offsets, total = _layout(count, dim)
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.gallery-', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(struct.pack(HEADER_FORMAT, GALLERY_FILE_MAGIC, GALLERY_FILE_VERSION, count, dim, generation).ljust(HEADER_SIZE, b'\0'))
+            for name, array in (
+                ('ids', ids),
+                ('keys', keys),
+                ('course_ids', course_ids),
+                ('semester_ids', semester_ids),
+                ('sq_norms', sq_norms),
+                ('encodings', encodings),
+            ):
+                f.seek(offsets[name])
+                f.write(array.tobytes())
+            f.truncate(total)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return True
+
+
+def open_gallery_file(path=None):
+    """
+    Memory-maps the gallery file read-only and returns a FaceGallery over it,
+    or None if the file is missing or invalid.
+
+    The file is opened and mapped once and every section is sliced out of that
+    one mapping, so a concurrent write_gallery_file (which replaces the path)
+    cannot mix sections of two generations.
+    """
+    from .face_gallery import FaceGallery
+
+    path = path or gallery_file_path()
+    try:
+        with open(path, 'rb') as f:
+            mapped = np.memmap(f, dtype=np.uint8, mode='r')
+    except (OSError, ValueError):
+        # Missing, unreadable or empty file
+        return None
+    header = _parse_header(bytes(mapped[:HEADER_SIZE]))
+    if header is None:
+        return None
+    count, dim, generation = header
+    if count == 0:
+        gallery = FaceGallery()
+        gallery.generation = generation
+        return gallery
+
+    offsets, total = _layout(count, dim)
+    if len(mapped) < total:
+        return None
+
+    def section(name, dtype, shape):
+        dtype = np.dtype(dtype)
+        start = offsets[name]
+        return mapped[start:start + dtype.itemsize * int(np.prod(shape))].view(dtype).reshape(shape)
+
+    gallery = FaceGallery(
+        section('encodings', '<f4', (count, dim)),
+        section('ids', '<i8', (count,)),
+        section('course_ids', '<i8', (count,)),
+        section('semester_ids', '<i8', (count,)),
+        sq_norms=section('sq_norms', '<f4', (count,)),
+        keys=section('keys', '<i8', (count,)),
+    )
+    gallery.generation = generation
+    return gallery
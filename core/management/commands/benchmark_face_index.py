@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from core.face_gallery import DEFAULT_TOLERANCE, ENCODING_DIM, FaceGallery, load_known_faces
+from core.face_index import FACE_INDEX_LISTS, IVFIndex, default_list_count
+
+
+class Command(BaseCommand):
+    help = 'Measures recall@1 and latency of the IVF face index against exact search.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--synthetic',
+            type=int,
+            default=0,
+            help='Benchmark a synthetic gallery of this many encodings instead of the real one',
+        )
+        parser.add_argument(
+            '--queries',
+            type=int,
+            default=500,
+            help='Number of probe faces (default: 500)',
+        )
+        parser.add_argument(
+            '--probes',
+            type=str,
+            default='1,2,4,8,16,32',
+            help='Comma-separated FACE_INDEX_PROBES values to try (default: 1,2,4,8,16,32)',
+        )
+        parser.add_argument(
+            '--lists',
+            type=int,
+            default=FACE_INDEX_LISTS,
+            help='Number of clusters (default: FACE_INDEX_LISTS, 0 = about sqrt(N))',
+        )
+        parser.add_argument(
+            '--noise',
+            type=float,
+            default=0.3,
+            help='Typical distance of a probe from its enrolled encoding (default: 0.3)',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed (default: 0)',
+        )
+
+    def synthetic_gallery(self, size, rng):
+        """Encodings grouped around a few hundred centres, at real inter-person distances (~0.9)."""
+        centres = rng.normal(0.0, 0.06, size=(max(1, size // 200), ENCODING_DIM)).astype(np.float32)
+        members = rng.integers(0, len(centres), size=size)
+        encodings = centres[members] + rng.normal(0.0, 0.04, size=(size, ENCODING_DIM)).astype(np.float32)
+        return FaceGallery(encodings, np.arange(1, size + 1))
+
+    def time_search(self, search, queries):
+        """
+        Runs search(probe) one probe at a time, as faces arrive from the kiosk,
+        so exact search and the index are timed the same way. Returns the best
+        rows and distances of those same calls and the mean ms per probe.
+        """
+        rows = np.empty(len(queries), dtype=np.int64)
+        distances = np.empty(len(queries), dtype=np.float32)
+        started = time.perf_counter()
+        for i, query in enumerate(queries):
+            best_rows, best_distances = search(query[np.newaxis, :])
+            rows[i], distances[i] = best_rows[0], best_distances[0]
+        return rows, distances, (time.perf_counter() - started) * 1000 / len(queries)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+
+        if options['synthetic']:
+            gallery = self.synthetic_gallery(options['synthetic'], rng)
+            self.stdout.write(f'Synthetic gallery of {len(gallery)} encodings.')
+        else:
+            gallery = load_known_faces()
+            self.stdout.write(f'Enrolled gallery of {len(gallery)} encodings.')
+        if len(gallery) < 2:
+            self.stdout.write(self.style.WARNING('Gallery too small to benchmark.'))
+            return
+
+        try:
+            probe_counts = [int(value) for value in options['probes'].split(',') if value.strip()]
+        except ValueError:
+            self.stdout.write(self.style.ERROR(f"Invalid --probes value: {options['probes']}"))
+            return
+
+        encodings = np.asarray(gallery.encodings, dtype=np.float32)
+        sq_norms = np.asarray(gallery.sq_norms, dtype=np.float32)
+
+        # Probes are enrolled faces seen again with some appearance noise
+        targets = rng.integers(0, len(encodings), size=options['queries'])
+        noise = rng.normal(0.0, options['noise'] / np.sqrt(ENCODING_DIM), size=(len(targets), ENCODING_DIM))
+        queries = (encodings[targets] + noise).astype(np.float32)
+
+        def exact_search(probe):
+            distances = gallery.distance_matrix(probe)
+            rows = np.argmin(distances, axis=1)
+            return rows, distances[np.arange(len(probe)), rows]
+
+        exact_rows, exact_best, exact_ms = self.time_search(exact_search, queries)
+        exact_matched = exact_best <= DEFAULT_TOLERANCE
+
+        n_lists = options['lists'] or default_list_count(len(encodings))
+        started = time.perf_counter()
+        index = IVFIndex.train(encodings, n_lists=n_lists, seed=options['seed'])
+        train_s = time.perf_counter() - started
+
+        self.stdout.write(f'Exact search: {exact_ms:.3f} ms/probe, {exact_matched.mean():.1%} within tolerance {DEFAULT_TOLERANCE}.')
+        self.stdout.write(f'IVF index: {index.n_lists} lists trained in {train_s:.2f} s.')
+        self.stdout.write(f"{'probes':>7} {'recall@1':>9} {'lost matches':>13} {'ms/probe':>9} {'speedup':>8}")
+
+        for n_probe in probe_counts:
+            rows, distances, ivf_ms = self.time_search(
+                lambda probe: index.search(probe, encodings, sq_norms, n_probe=n_probe), queries
+            )
+            recall = float(np.mean(rows == exact_rows))
+            # Probes matched by exact search but missed (or matched to someone else) through the index
+            lost = float(np.mean(exact_matched & ((distances > DEFAULT_TOLERANCE) | (rows != exact_rows))))
+            speedup = exact_ms / ivf_ms if ivf_ms else float('inf')
+            self.stdout.write(f'{min(n_probe, index.n_lists):>7} {recall:>9.1%} {lost:>13.2%} {ivf_ms:>9.3f} {speedup:>7.1f}x')
+
+        self.stdout.write(self.style.SUCCESS('Done. Set FACE_INDEX_PROBES to the smallest value with acceptable recall.'))
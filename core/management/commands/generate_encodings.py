@@ -1,11 +1,11 @@
-import face_recognition
+import multiprocessing
 import os
-import json
-import numpy as np
-from PIL import Image, ImageOps
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 from django.core.management.base import BaseCommand
-from django.conf import settings
-from core.models import User
+from core.encoding_cache import encode_photo_file_cached
+from core.face_pipeline import photo_hash
+from core.models import FaceGalleryChange, User, pack_encoding
 
 # Optional: Support HEIC images (does NOT break if not installed)
 try:
@@ -15,19 +15,62 @@ except:
     pass
 
 
+def _init_worker():
+    """Sets up Django (for the encoding cache) and the HEIC opener in spawned pool workers."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+    import django
+    django.setup()
+    try:
+        from pillow_heif import register_heif_opener
+        register_heif_opener()
+    except ImportError:
+        pass
+
+
 class Command(BaseCommand):
     help = 'Generates and saves face encodings for students with profile images.'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Worker processes used for face detection and encoding (default: 1, no pool)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Encodings written per bulk_update (default: 50)',
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-encode every student, even if their photo has not changed since the last run',
+        )
+        parser.add_argument(
+            '--no-cnn',
+            action='store_true',
+            help='Skip the (slow) CNN detector fallback when HOG finds no face',
+        )
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.NOTICE("Starting face encoding generation..."))
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        use_cnn = not options['no_cnn']
 
         students_to_process = User.objects.filter(
             is_student=True,
             authorized=True,
             profile_image__isnull=False
-        ).exclude(profile_image='')
+        ).exclude(profile_image='').only(
+            'id', 'username', 'profile_image', 'face_encoding', 'face_image_hash'
+        ).order_by('id')
 
         processed_count = 0
+        cached_count = 0
+        unchanged_count = 0
         skipped_count = 0
         error_count = 0
 
@@ -37,101 +80,100 @@ class Command(BaseCommand):
 
         self.stdout.write(f"Found {students_to_process.count()} students with profile images.")
 
-        for student in students_to_process:
-            self.stdout.write(f"Processing student: {student.username} (ID: {student.id})... ")
-
+        # --- Work out which photos need (re-)encoding ---
+        # Encodings are saved together with the hash of the photo they came from,
+        # so an interrupted run resumes where it stopped and unchanged photos are skipped
+        jobs = {}
+        for student in students_to_process.iterator():
             if not student.profile_image or not hasattr(student.profile_image, 'path'):
-                self.stdout.write(self.style.WARNING("  No valid image path found, skipping."))
+                self.stdout.write(self.style.WARNING(f"  {student.username}: no valid image path found, skipping."))
                 skipped_count += 1
                 continue
 
             image_path = student.profile_image.path
-
             if not os.path.exists(image_path):
-                self.stdout.write(self.style.ERROR(f"  Image file not found at {image_path}, skipping."))
+                self.stdout.write(self.style.ERROR(f"  {student.username}: image file not found at {image_path}, skipping."))
                 error_count += 1
                 continue
 
-            try:
-                # Load image and fix EXIF rotation (mobile photo issues)
-                pil_image = Image.open(image_path)
-                pil_image = ImageOps.exif_transpose(pil_image)
-
-                # Force convert to 8-bit RGB
-                if pil_image.mode != 'RGB':
-                    pil_image = pil_image.convert("RGB")
-
-                # Resize if image is too large (helps with detection)
-                max_dimension = 1600
-                if max(pil_image.size) > max_dimension:
-                    self.stdout.write(f"  Resizing from {pil_image.size}... ")
-                    pil_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
-
-                # Use face_recognition's built-in image loader instead
-                # This ensures proper format for dlib
-                # Save to temp location and reload
-                temp_path = image_path + ".temp.jpg"
+            if not options['force'] and student.face_encoding and student.face_image_hash:
                 try:
-                    pil_image.save(temp_path, "JPEG", quality=95)
-                    image_array = face_recognition.load_image_file(temp_path)
-                finally:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-
-                self.stdout.write(f"  Image shape: {image_array.shape}, dtype: {image_array.dtype}")
-
-                # Try HOG model first (faster)
-                self.stdout.write("  Detecting faces (HOG)... ")
-                face_locations = face_recognition.face_locations(
-                    image_array, 
-                    model='hog',
-                    number_of_times_to_upsample=1
-                )
-
-                # If no faces found with HOG, try CNN (more accurate but slower)
-                if not face_locations:
-                    self.stdout.write("  No faces with HOG, trying CNN... ")
-                    face_locations = face_recognition.face_locations(
-                        image_array,
-                        model='cnn'
-                    )
-
-                # If still no faces, try with more upsampling
-                if not face_locations:
-                    self.stdout.write("  Trying with increased upsampling... ")
-                    face_locations = face_recognition.face_locations(
-                        image_array,
-                        model='hog',
-                        number_of_times_to_upsample=2
-                    )
-
-                if face_locations:
-                    self.stdout.write(f"  Found {len(face_locations)} face(s)")
-                    
-                    # Generate encodings for detected faces
-                    encodings = face_recognition.face_encodings(image_array, face_locations)
-                    
-                    if encodings:
-                        # Use the first face found
-                        encoding = encodings[0]
-                        student.set_encoding(encoding)
-                        student.save(update_fields=['face_encoding'])
-                        self.stdout.write(self.style.SUCCESS("  ✅ Encoding generated and saved."))
-                        processed_count += 1
-                    else:
-                        self.stdout.write(self.style.WARNING("  ⚠️ Face detected but encoding failed, skipping."))
-                        skipped_count += 1
+                    with open(image_path, 'rb') as f:
+                        unchanged = photo_hash(f.read()) == student.face_image_hash
+                except OSError:
+                    unchanged = False
+                if unchanged:
+                    unchanged_count += 1
+                    continue
+
+            jobs[student.id] = (student, image_path)
+
+        self.stdout.write(f"{len(jobs)} photo(s) to encode, {unchanged_count} unchanged since the last run.")
+
+        # --- Encode, in a process pool if requested, writing results in batches ---
+        pending = []
+
+        def flush():
+            if not pending:
+                return
+            User.objects.bulk_update(pending, ['face_encoding', 'face_image_hash'])
+            # bulk_update sends no post_save signals; tell the recognition workers directly
+            FaceGalleryChange.record_many([student.id for student in pending])
+            pending.clear()
+
+        def handle_result(student, image_hash, encoding, error, cached):
+            nonlocal processed_count, cached_count, skipped_count, error_count
+            if encoding is not None:
+                student.face_encoding = pack_encoding(encoding)
+                student.face_image_hash = image_hash
+                pending.append(student)
+                processed_count += 1
+                if cached:
+                    cached_count += 1
+                    self.stdout.write(self.style.SUCCESS(f"  ✅ {student.username}: encoding taken from cache."))
                 else:
-                    self.stdout.write(self.style.WARNING("  ⚠️ No face detected after all attempts, skipping."))
-                    skipped_count += 1
-
-            except Exception as e:
-                self.stderr.write(self.style.ERROR(f"  ❌ Critical error for {student.username}: {e}"))
-                import traceback
-                self.stderr.write(traceback.format_exc())
+                    self.stdout.write(self.style.SUCCESS(f"  ✅ {student.username}: encoding generated."))
+                if len(pending) >= batch_size:
+                    flush()
+            elif image_hash is not None and error.startswith("No face"):
+                self.stdout.write(self.style.WARNING(f"  ⚠️ {student.username}: {error} Skipping."))
+                skipped_count += 1
+            else:
+                self.stderr.write(self.style.ERROR(f"  ❌ {student.username}: {error}"))
                 error_count += 1
 
+        try:
+            if workers == 1:
+                for student, image_path in jobs.values():
+                    handle_result(student, *encode_photo_file_cached(image_path, use_cnn))
+            else:
+                self.stdout.write(f"Encoding with {workers} worker processes...")
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                ) as executor:
+                    futures = {
+                        executor.submit(encode_photo_file_cached, image_path, use_cnn): student
+                        for student, image_path in jobs.values()
+                    }
+                    for future in as_completed(futures):
+                        student = futures[future]
+                        try:
+                            result = future.result()
+                        except Exception as e:
+                            result = (None, None, f"Worker failed: {e}", False)
+                        handle_result(student, *result)
+        except KeyboardInterrupt:
+            flush()
+            self.stdout.write(self.style.WARNING(
+                f"\nInterrupted. {processed_count} encoding(s) saved; run the command again to resume."
+            ))
+            return
+        flush()
+
         self.stdout.write(self.style.SUCCESS("\nFinished processing."))
-        self.stdout.write(f"✅ Successfully generated/saved: {processed_count}")
+        self.stdout.write(f"✅ Successfully generated/saved: {processed_count} ({cached_count} from the encoding cache)")
+        self.stdout.write(f"⏭️ Unchanged since last run: {unchanged_count}")
         self.stdout.write(f"⚠️ Skipped (no face/no image path): {skipped_count}")
-        self.stdout.write(f"❌ Errors: {error_count}")
\ No newline at end of file
+        self.stdout.write(f"❌ Errors: {error_count}")
@@ -0,0 +1,88 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk_import import (
+    CREATED, DUPLICATE, ERROR, INVALID, NO_FACE, WOULD_CREATE,
+    import_students, import_workers, summarize,
+)
+
+# Optional: Support HEIC images (does NOT break if not installed)
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:
+    pass
+
+
+class Command(BaseCommand):
+    help = 'Registers students in bulk from a CSV/XLSX roster and a ZIP of their photos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='CSV or XLSX roster with one student per row')
+        parser.add_argument('photos', help='ZIP archive with the students\' photos')
+        parser.add_argument(
+            '--default-password',
+            help='Password for rows without a password column value',
+        )
+        parser.add_argument(
+            '--authorize',
+            action='store_true',
+            help='Authorize the imported students (adds them to face recognition immediately)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate, encode and check for duplicates without creating anyone',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=import_workers(),
+            help='Worker processes for face encoding (default: BULK_IMPORT_WORKERS or CPU count)',
+        )
+        parser.add_argument(
+            '--report',
+            help='Write the per-row results to this CSV file',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['roster'], 'rb') as roster, open(options['photos'], 'rb') as photos:
+                self.stdout.write(self.style.NOTICE("Importing students..."))
+                results = import_students(
+                    roster, options['roster'], photos,
+                    default_password=options['default_password'],
+                    authorize=options['authorize'],
+                    dry_run=options['dry_run'],
+                    workers=options['workers'],
+                )
+        except OSError as e:
+            raise CommandError(f"Could not read input file: {e}")
+
+        styles = {
+            CREATED: self.style.SUCCESS,
+            WOULD_CREATE: self.style.SUCCESS,
+            DUPLICATE: self.style.WARNING,
+            NO_FACE: self.style.WARNING,
+            INVALID: self.style.ERROR,
+            ERROR: self.style.ERROR,
+        }
+        for result in results:
+            style = styles.get(result['status'], str)
+            self.stdout.write(style(
+                f"  Line {result['row']}: {result['username'] or '-'} ({result['roll_no'] or '-'}) "
+                f"{result['status']}: {result['message']}"
+            ))
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as report:
+                writer = csv.DictWriter(report, fieldnames=['row', 'username', 'roll_no', 'status', 'message'])
+                writer.writeheader()
+                writer.writerows(results)
+            self.stdout.write(f"Report written to {options['report']}")
+
+        summary = summarize(results)
+        self.stdout.write(self.style.SUCCESS("\nFinished importing."))
+        for status, count in sorted(summary.items()):
+            self.stdout.write(f"{status}: {count}")
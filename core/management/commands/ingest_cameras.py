@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.camera_ingest import CAMERA_INGEST_BUFFER_SIZE, CameraIngestService
+from core.models import Camera, Course, Semester
+
+
+class Command(BaseCommand):
+    help = 'Reads every active server-side camera and marks attendance for recognized students, without a browser.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, required=True, help='Course ID of the attendance session')
+        parser.add_argument('--semester', type=int, required=True, help='Semester ID of the attendance session')
+        parser.add_argument(
+            '--camera',
+            type=int,
+            action='append',
+            help='Only ingest this camera ID (repeatable; default: all active cameras)',
+        )
+        parser.add_argument(
+            '--buffer-size',
+            type=int,
+            default=CAMERA_INGEST_BUFFER_SIZE,
+            help=f'Frames buffered per camera before the oldest is dropped (default: {CAMERA_INGEST_BUFFER_SIZE})',
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=60,
+            help='Seconds between per-camera statistics lines (0 disables them)',
+        )
+
+    def handle(self, *args, **options):
+        if not Course.objects.filter(pk=options['course']).exists():
+            raise CommandError(f"Course {options['course']} does not exist.")
+        if not Semester.objects.filter(pk=options['semester']).exists():
+            raise CommandError(f"Semester {options['semester']} does not exist.")
+
+        cameras = Camera.objects.filter(status='active')
+        if options['camera']:
+            cameras = cameras.filter(pk__in=options['camera'])
+        cameras = list(cameras)
+        if not cameras:
+            raise CommandError("No active cameras to ingest.")
+
+        service = CameraIngestService(cameras, options['course'], options['semester'], options['buffer_size'])
+        self.stdout.write(self.style.NOTICE(
+            f"Ingesting {len(cameras)} camera(s): {', '.join(camera.name for camera in cameras)}. Press Ctrl+C to stop."
+        ))
+        service.start()
+
+        interval = options['stats_interval']
+        try:
+            while True:
+                time.sleep(interval or 3600)
+                if interval:
+                    self.write_stats(service)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING("\nStopping camera ingestion..."))
+        finally:
+            service.stop()
+        self.write_stats(service)
+
+    def write_stats(self, service):
+        for stats in service.stats():
+            latency = f"{stats['latency'] * 1000:.0f} ms" if stats['latency'] is not None else "-"
+            self.stdout.write(
+                f"  {stats['camera']}: {'connected' if stats['connected'] else 'disconnected'}, "
+                f"{stats['received']} received, {stats['dropped']} dropped, {stats['processed']} processed, "
+                f"{stats['skipped']} skipped, {stats['busy']} busy, {stats['recognized']} recognized, "
+                f"last latency {latency}"
+            )
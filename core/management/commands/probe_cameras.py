@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.camera_health import CAMERA_PROBE_INTERVAL, CAMERA_PROBE_TIMEOUT, CameraHealthProber, run_probes
+
+
+class Command(BaseCommand):
+    help = 'Checks every camera concurrently and stores its status, latency and frame rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--camera',
+            type=int,
+            action='append',
+            help='Only probe this camera ID (repeatable; default: all cameras)',
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            default=CAMERA_PROBE_TIMEOUT,
+            help=f'Seconds before a camera counts as unreachable (default: {CAMERA_PROBE_TIMEOUT})',
+        )
+        parser.add_argument(
+            '--watch',
+            action='store_true',
+            help='Keep probing all cameras every --interval seconds (run one of these per deployment)',
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=CAMERA_PROBE_INTERVAL,
+            help=f'Seconds between probe rounds with --watch (default: {CAMERA_PROBE_INTERVAL})',
+        )
+
+    def handle(self, *args, **options):
+        if options['watch']:
+            if options['interval'] <= 0:
+                raise CommandError("--interval must be positive with --watch.")
+            self.stdout.write(self.style.NOTICE(f"Probing cameras every {options['interval']} seconds (Ctrl+C to stop)..."))
+            try:
+                CameraHealthProber(options['interval'], options['timeout']).run()
+            except KeyboardInterrupt:
+                self.stdout.write("Stopped.")
+            return
+
+        cameras = run_probes(options['camera'], timeout=options['timeout'])
+        if not cameras:
+            self.stdout.write(self.style.WARNING("No cameras to probe."))
+            return
+        for camera in cameras:
+            if camera.probe_error:
+                self.stdout.write(self.style.ERROR(f"  {camera.name}: {camera.get_status_display()} - {camera.probe_error}"))
+            elif camera.probe_latency_ms is None:
+                self.stdout.write(self.style.SUCCESS(f"  {camera.name}: {camera.get_status_display()} - in use by camera ingestion"))
+            else:
+                fps = f", {camera.probe_fps:.1f} fps" if camera.probe_fps else ""
+                self.stdout.write(self.style.SUCCESS(
+                    f"  {camera.name}: {camera.get_status_display()} - opened in {camera.probe_latency_ms:.0f} ms{fps}"
+                ))
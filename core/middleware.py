@@ -13,7 +13,7 @@ class AttendanceSessionMiddleware(MiddlewareMixin):
     """
 
     def __init__(self, get_response):
-        self.get_response = get_response
+        super().__init__(get_response)
         # URLs that are allowed during attendance session
         self.allowed_urls = [
             '/login/',
@@ -26,7 +26,7 @@ class AttendanceSessionMiddleware(MiddlewareMixin):
             '/media/',
         ]
 
-    def __call__(self, request):
+    def process_request(self, request):
         # Check if user is authenticated and is admin
         if request.user.is_authenticated and request.user.is_admin:
             # Check if attendance session is active
@@ -48,6 +48,3 @@ class AttendanceSessionMiddleware(MiddlewareMixin):
                     messages.warning(request,
                         "Attendance session was active. Please log in again to access other admin features.")
                     return redirect(reverse('login'))
-
-        response = self.get_response(request)
-        return response
\ No newline at end of file
@@ -0,0 +1,59 @@
+import json
+
+import numpy as np
+from django.db import migrations, models
+
+# Mirrors core.models.pack_encoding at the time of this migration
+ENCODING_HEADER = b'FE' + bytes([1]) + b'f'
+
+
+def json_to_binary(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    students = User.objects.filter(face_encoding__isnull=False).exclude(face_encoding='')
+    for user in students.only('id', 'face_encoding').iterator():
+        try:
+            encoding = np.asarray(json.loads(user.face_encoding), dtype='<f4')
+        except (ValueError, TypeError):
+            print(f"[Migration Warning] Dropping undecodable face encoding for user {user.id}")
+            continue
+        User.objects.filter(pk=user.pk).update(face_encoding_bin=ENCODING_HEADER + encoding.tobytes())
+
+
+def binary_to_json(apps, schema_editor):
+    User = apps.get_model('core', 'User')
+    for user in User.objects.filter(face_encoding_bin__isnull=False).only('id', 'face_encoding_bin').iterator():
+        data = bytes(user.face_encoding_bin)
+        if data[:len(ENCODING_HEADER)] != ENCODING_HEADER:
+            continue
+        encoding = np.frombuffer(data, dtype='<f4', offset=len(ENCODING_HEADER))
+        User.objects.filter(pk=user.pk).update(face_encoding=json.dumps(encoding.tolist()))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_facegallerychange'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='face_encoding_bin',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.RunPython(json_to_binary, binary_to_json),
+        migrations.RemoveField(
+            model_name='user',
+            name='face_encoding',
+        ),
+        migrations.RenameField(
+            model_name='user',
+            old_name='face_encoding_bin',
+            new_name='face_encoding',
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='face_encoding',
+            field=models.BinaryField(blank=True, help_text='Tagged float32 binary face encoding (see pack_encoding).', null=True),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_binary_face_encoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='detection_width',
+            field=models.PositiveIntegerField(default=320, help_text='Width frames are downscaled to for face detection (0 = full resolution)'),
+        ),
+    ]
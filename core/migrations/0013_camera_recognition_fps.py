@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_camera_detection_width'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='recognition_fps',
+            field=models.FloatField(default=2.0, help_text='Maximum frames per second sent through face recognition (0 = unlimited)'),
+        ),
+    ]
@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_camera_recognition_fps'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='face_image_hash',
+            field=models.CharField(blank=True, default='', help_text='SHA-256 of the profile image the face encoding was generated from', max_length=64),
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_user_face_image_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEncodingCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_hash', models.CharField(help_text='SHA-256 of the normalized RGB photo (see encoding_cache)', max_length=64, unique=True)),
+                ('face_top', models.IntegerField(blank=True, null=True)),
+                ('face_right', models.IntegerField(blank=True, null=True)),
+                ('face_bottom', models.IntegerField(blank=True, null=True)),
+                ('face_left', models.IntegerField(blank=True, null=True)),
+                ('face_encoding', models.BinaryField(blank=True, help_text='Tagged float32 binary face encoding (see pack_encoding)', null=True)),
+                ('used_cnn', models.BooleanField(default=False, help_text='Whether the CNN detector was tried before concluding there is no face')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
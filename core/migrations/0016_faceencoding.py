@@ -0,0 +1,26 @@
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_faceencodingcache'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FaceEncoding',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('encoding', models.BinaryField(help_text='Tagged float32 binary face encoding (see pack_encoding)')),
+                ('source', models.CharField(choices=[('enrollment', 'Enrollment photo'), ('kiosk', 'Kiosk capture')], default='enrollment', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('student', models.ForeignKey(limit_choices_to={'is_student': True}, on_delete=django.db.models.deletion.CASCADE, related_name='face_encodings', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['created_at', 'id'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_faceencoding'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='last_probe_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='probe_latency_ms',
+            field=models.FloatField(blank=True, help_text='Time to open the camera and read its first frame', null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='probe_fps',
+            field=models.FloatField(blank=True, help_text='Frame rate achieved during the last probe', null=True),
+        ),
+        migrations.AddField(
+            model_name='camera',
+            name='probe_error',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+    ]
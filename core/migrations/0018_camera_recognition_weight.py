@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_camera_probe_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='recognition_weight',
+            field=models.PositiveSmallIntegerField(default=1, help_text='Share of recognition capacity when several cameras are busy'),
+        ),
+    ]
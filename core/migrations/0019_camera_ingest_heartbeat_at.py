@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_camera_recognition_weight'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='camera',
+            name='ingest_heartbeat_at',
+            field=models.DateTimeField(blank=True, help_text='Last time ingest_cameras reported this camera open', null=True),
+        ),
+    ]
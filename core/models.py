@@ -1,9 +1,37 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
 from django.utils import timezone
-import json 
 import numpy as np 
 
+# --- Binary face encoding format ---
+# 4-byte header (magic, version, dtype code) followed by raw little-endian
+# float32 values, so a 128-d encoding takes 516 bytes instead of ~2.5 KB of JSON.
+ENCODING_MAGIC = b'FE'
+ENCODING_VERSION = 1
+ENCODING_DTYPE_CODES = {b'f': np.dtype('<f4')}
+ENCODING_HEADER = ENCODING_MAGIC + bytes([ENCODING_VERSION]) + b'f'
+ENCODING_HEADER_SIZE = len(ENCODING_HEADER)
+
+
+def pack_encoding(encoding):
+    """Serializes a face encoding to the tagged float32 binary format."""
+    return ENCODING_HEADER + np.asarray(encoding, dtype='<f4').tobytes()
+
+
+def unpack_encoding(data):
+    """
+    Returns a read-only, zero-copy numpy view over a packed encoding.
+    Raises ValueError if the header is not recognised.
+    """
+    buffer = memoryview(data)
+    header = bytes(buffer[:ENCODING_HEADER_SIZE])
+    if len(header) < ENCODING_HEADER_SIZE or header[:2] != ENCODING_MAGIC or header[2] != ENCODING_VERSION:
+        raise ValueError("Unrecognised face encoding header")
+    dtype = ENCODING_DTYPE_CODES.get(header[3:4])
+    if dtype is None:
+        raise ValueError(f"Unsupported face encoding dtype code {header[3:4]!r}")
+    return np.frombuffer(buffer, dtype=dtype, offset=ENCODING_HEADER_SIZE)
+
 # -----------------------
 # Core Management Models
 # -----------------------
@@ -116,7 +144,8 @@ class User(AbstractUser):
     semester = models.ForeignKey(Semester, on_delete=models.SET_NULL, null=True, blank=True, related_name='students')
 
     # --- Face Recognition Field ---
-    face_encoding = models.TextField(blank=True, null=True, help_text="JSON representation of the face encoding.")
+    face_encoding = models.BinaryField(blank=True, null=True, help_text="Tagged float32 binary face encoding (see pack_encoding).")
+    face_image_hash = models.CharField(max_length=64, blank=True, default='', help_text="SHA-256 of the profile image the face encoding was generated from")
 
     def save(self, *args, **kwargs):
         if not self.name:
@@ -128,37 +157,22 @@ class User(AbstractUser):
 
     # --- Methods to get/set encoding ---
     def get_encoding(self):
-        """Retrieves the face encoding from the JSON string as a numpy array."""
+        """Retrieves the face encoding as a read-only float32 numpy view (no copy)."""
         if self.face_encoding:
             try:
-                # Use numpy array for compatibility with face_recognition
-                return np.array(json.loads(self.face_encoding))
-            except json.JSONDecodeError:
-                print(f"Error decoding face encoding JSON for user {self.username}")
+                return unpack_encoding(self.face_encoding)
+            except ValueError as e:
+                print(f"Error decoding face encoding for user {self.username}: {e}")
                 return None
         return None
 
     def set_encoding(self, encoding):
-        """Stores the face encoding (numpy array) as a JSON string and saves individual .npy file."""
-        import os
-        from django.conf import settings
-        
+        """
+        Stores the face encoding (numpy array) in binary form. The shared gallery
+        file is rebuilt by the workers once the save is committed.
+        """
         if encoding is not None:
-            # Convert numpy array to list for JSON serialization
-            self.face_encoding = json.dumps(encoding.tolist())
-            
-            # Save individual .npy file
-            try:
-                encodings_dir = os.path.join(settings.BASE_DIR, 'encodings')
-                os.makedirs(encodings_dir, exist_ok=True)
-                
-                filename = f'student_{self.id}.npy'
-                filepath = os.path.join(encodings_dir, filename)
-                np.save(filepath, encoding)
-                
-                print(f"[Face Encoding] Saved .npy file: {filepath}")
-            except Exception as e:
-                print(f"[Face Encoding Error] Failed to save .npy file for student {self.username}: {e}")
+            self.face_encoding = pack_encoding(encoding)
         else:
             self.face_encoding = None
 
@@ -191,6 +205,15 @@ class Camera(models.Model):
     resolution_width = models.IntegerField(default=640, help_text="Video resolution width")
     resolution_height = models.IntegerField(default=480, help_text="Video resolution height")
     fps = models.IntegerField(default=30, help_text="Frames per second")
+    detection_width = models.PositiveIntegerField(default=320, help_text="Width frames are downscaled to for face detection (0 = full resolution)")
+    recognition_fps = models.FloatField(default=2.0, help_text="Maximum frames per second sent through face recognition (0 = unlimited)")
+    recognition_weight = models.PositiveSmallIntegerField(default=1, help_text="Share of recognition capacity when several cameras are busy")
+    # Last background health probe (see camera_health.py)
+    last_probe_at = models.DateTimeField(blank=True, null=True)
+    probe_latency_ms = models.FloatField(blank=True, null=True, help_text="Time to open the camera and read its first frame")
+    probe_fps = models.FloatField(blank=True, null=True, help_text="Frame rate achieved during the last probe")
+    probe_error = models.CharField(max_length=255, blank=True, default='')
+    ingest_heartbeat_at = models.DateTimeField(blank=True, null=True, help_text="Last time ingest_cameras reported this camera open")
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -218,6 +241,178 @@ class Camera(models.Model):
             Camera.objects.filter(is_default=True).exclude(pk=self.pk).update(is_default=False)
         super().save(*args, **kwargs)
 
+class FaceGalleryChange(models.Model):
+    """
+    Append-only log of students whose face gallery row changed.
+    The auto-increment id doubles as the gallery generation number, so each
+    worker process only replays entries newer than the last one it applied.
+    """
+    student_id = models.BigIntegerField(help_text="Student whose gallery row was added, replaced or removed")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"Gallery change #{self.id} (student {self.student_id})"
+
+    @classmethod
+    def latest_generation(cls):
+        """Returns the id of the newest change, or 0 if the log is empty."""
+        return cls.objects.aggregate(latest=models.Max('id'))['latest'] or 0
+
+    @classmethod
+    def record(cls, student_id):
+        """Appends a change and occasionally prunes entries past the retention window."""
+        from datetime import timedelta
+        from .face_gallery import GALLERY_CHANGE_RETENTION
+
+        change = cls.objects.create(student_id=student_id)
+        if change.id % 500 == 0:
+            cutoff = timezone.now() - timedelta(seconds=GALLERY_CHANGE_RETENTION)
+            cls.objects.filter(created_at__lt=cutoff).delete()
+        return change
+
+    @classmethod
+    def record_many(cls, student_ids):
+        """Appends one change per student in a single insert (for bulk_create/bulk_update callers)."""
+        from datetime import timedelta
+        from .face_gallery import GALLERY_CHANGE_RETENTION
+
+        changes = cls.objects.bulk_create([cls(student_id=student_id) for student_id in student_ids])
+        if changes and changes[-1].id is not None and changes[-1].id // 500 != (changes[-1].id - len(changes)) // 500:
+            cutoff = timezone.now() - timedelta(seconds=GALLERY_CHANGE_RETENTION)
+            cls.objects.filter(created_at__lt=cutoff).delete()
+        return changes
+
+class FaceEncoding(models.Model):
+    """
+    Additional face encoding of a student, next to the profile photo encoding
+    on User.face_encoding. The gallery matches a face against all of a
+    student's encodings and keeps the closest, so different lighting or
+    angles can match without loosening the tolerance.
+    """
+    SOURCE_CHOICES = [
+        ('enrollment', 'Enrollment photo'),
+        ('kiosk', 'Kiosk capture'),
+    ]
+
+    student = models.ForeignKey(User, on_delete=models.CASCADE, related_name='face_encodings', limit_choices_to={'is_student': True})
+    encoding = models.BinaryField(help_text="Tagged float32 binary face encoding (see pack_encoding)")
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='enrollment')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['created_at', 'id']
+
+    def __str__(self):
+        return f"{self.student.username} - {self.source} encoding #{self.id}"
+
+    def get_encoding(self):
+        """The encoding as a read-only float32 numpy view, or None if unreadable."""
+        try:
+            return unpack_encoding(self.encoding)
+        except ValueError as e:
+            print(f"Error decoding extra face encoding #{self.id}: {e}")
+            return None
+
+    @classmethod
+    def add(cls, student, encoding, source='enrollment', max_per_student=None):
+        """
+        Stores an extra encoding for a student, keeping at most max_per_student
+        (FACE_ENCODINGS_PER_STUDENT setting). Excess entries are evicted oldest
+        kiosk capture first; enrollment encodings only make room for other
+        enrollment encodings. Returns the new entry, or None if it was evicted itself.
+        """
+        from django.conf import settings
+        from django.db import transaction
+
+        if max_per_student is None:
+            max_per_student = getattr(settings, 'FACE_ENCODINGS_PER_STUDENT', 5)
+        with transaction.atomic():
+            entry = cls.objects.create(student=student, encoding=pack_encoding(encoding), source=source)
+            existing = list(cls.objects.filter(student=student).exclude(pk=entry.pk).values_list('id', 'source'))
+            excess = len(existing) + 1 - max_per_student
+            if excess <= 0:
+                return entry
+            eviction_order = [pk for pk, entry_source in existing if entry_source == 'kiosk']
+            if source == 'kiosk':
+                eviction_order.append(entry.pk)
+            eviction_order += [pk for pk, entry_source in existing if entry_source != 'kiosk']
+            evicted = eviction_order[:excess]
+            # Delete one by one so post_delete signals keep the gallery in sync
+            for extra in cls.objects.filter(pk__in=evicted):
+                extra.delete()
+        return None if entry.pk in evicted else entry
+
+class FaceEncodingCache(models.Model):
+    """
+    Face box and encoding found in a normalized photo, keyed by the hash of its
+    pixels, so the same photo never goes through dlib twice. A null encoding
+    records that no face was found (with or without the CNN detector).
+    """
+    image_hash = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the normalized RGB photo (see encoding_cache)")
+    face_top = models.IntegerField(null=True, blank=True)
+    face_right = models.IntegerField(null=True, blank=True)
+    face_bottom = models.IntegerField(null=True, blank=True)
+    face_left = models.IntegerField(null=True, blank=True)
+    face_encoding = models.BinaryField(null=True, blank=True, help_text="Tagged float32 binary face encoding (see pack_encoding)")
+    used_cnn = models.BooleanField(default=False, help_text="Whether the CNN detector was tried before concluding there is no face")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Encoding cache {self.image_hash[:12]}"
+
+    def get_box(self):
+        """Face location as (top, right, bottom, left), or None."""
+        if self.face_top is None:
+            return None
+        return (self.face_top, self.face_right, self.face_bottom, self.face_left)
+
+    def get_encoding(self):
+        """Cached encoding as a read-only float32 numpy view, or None."""
+        if not self.face_encoding:
+            return None
+        return unpack_encoding(self.face_encoding)
+
+class StudentImport(models.Model):
+    """
+    Bulk student import submitted from the admin page. The upload is stored
+    and imported in the background (bulk_import.import_jobs); the page polls
+    the status and shows the per-row results once it is done.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    roster = models.FileField(upload_to='imports/', blank=True, help_text="Uploaded roster, deleted once imported")
+    photos = models.FileField(upload_to='imports/', blank=True, help_text="Uploaded photos ZIP, deleted once imported")
+    authorize = models.BooleanField(default=False)
+    dry_run = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    message = models.CharField(max_length=255, blank=True)
+    results = models.JSONField(default=list, blank=True, help_text="Per-row results (see bulk_import.import_students)")
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Student import #{self.id} ({self.status})"
+
+    @property
+    def finished(self):
+        return self.status in (self.DONE, self.FAILED)
+
 class AttendanceRecord(models.Model):
     STATUS_CHOICES = [
         ('present', 'Present'),
@@ -0,0 +1,248 @@
+"""
+Recognition engine that keeps dlib work out of the Django request threads.
+
+Frames are handed to a persistent pool of worker processes, each with the
+face gallery preloaded (memory-mapped from the shared gallery file). At most
+FACE_RECOGNITION_WORKERS + FACE_RECOGNITION_QUEUE_SIZE frames are in flight
+per web process; beyond that submit() raises EngineBusy immediately so the
+kiosk gets an explicit "busy" answer instead of piling up requests.
+
+Kiosk frames arrive through recognition_scheduler, which sends them to the
+pool in micro-batches (process_frames) so concurrent frames share one dlib
+encoding call.
+
+Photo encoding that is not latency-critical (bulk imports, encoding jobs
+with the CNN detector) runs on a separate small background engine
+(get_background_engine, BACKGROUND_ENCODING_WORKERS) so it never takes a
+kiosk worker.
+
+Set FACE_RECOGNITION_WORKERS = 0 to run recognition inline (development).
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+from django.conf import settings
+
+from .face_gallery import DEFAULT_TOLERANCE
+from .face_pipeline import detect_faces, encode_faces_batch
+from .face_tracker import reuse_track_identities
+
+RECOGNITION_WORKERS = getattr(settings, 'FACE_RECOGNITION_WORKERS', 2)
+RECOGNITION_QUEUE_SIZE = getattr(settings, 'FACE_RECOGNITION_QUEUE_SIZE', 4)
+RECOGNITION_TIMEOUT = getattr(settings, 'FACE_RECOGNITION_TIMEOUT', 5.0)
+BACKGROUND_ENCODING_WORKERS = getattr(settings, 'BACKGROUND_ENCODING_WORKERS', 1)
+
+
+class EngineBusy(Exception):
+    """Raised when the recognition queue is full or a frame timed out."""
+
+
+def _init_worker():
+    """Sets up Django and preloads the face gallery in a pool worker."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+    import django
+    django.setup()
+
+    from .face_gallery import get_gallery
+    try:
+        gallery = get_gallery()
+        print(f"[Recognition Engine] Worker {os.getpid()} ready with {len(gallery)} encodings.")
+    except Exception as e:
+        # The gallery is retried on the first frame
+        print(f"[Recognition Engine] Worker {os.getpid()} could not preload gallery: {e}")
+
+
+def _init_background_worker():
+    """Sets up Django in a background encoding worker (no gallery needed)."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'attendance_system.settings')
+    import django
+    django.setup()
+
+
+def process_frame(rgb_frame, detection_width, course_id, semester_id, tolerance=DEFAULT_TOLERANCE, tracks=None):
+    """
+    Detects, encodes and matches every face in an RGB frame.
+    Runs inside a pool worker (or inline when the pool is disabled).
+    Faces continuing a tracked face with a known identity (see face_tracker)
+    reuse it and are not encoded.
+    Returns a dict with 'locations', 'matches' [(student_id, distance, in_scope)],
+    'track_ids' (tracker track per face, or None), 'encoded' (indices of the
+    faces encoded this frame), 'encodings' (len(encoded), 128 float32) and
+    'gallery_size'.
+    """
+    result = process_frames([(rgb_frame, detection_width, course_id, semester_id, tolerance, tracks)])[0]
+    if isinstance(result, Exception):
+        raise result
+    return result
+
+
+def process_frames(frames):
+    """
+    Batched process_frame for a micro-batch of frames, each given as the
+    tuple of process_frame arguments. Detection and matching run per frame,
+    but the faces of all frames are encoded in one dlib call.
+    Returns one result dict per frame, or the exception that frame raised.
+    """
+    from .face_gallery import get_gallery, load_known_faces
+
+    results = [None] * len(frames)
+    detected = []
+    for position, (rgb_frame, detection_width, course_id, semester_id, tolerance, tracks) in enumerate(frames):
+        try:
+            face_locations = [tuple(int(v) for v in location) for location in detect_faces(rgb_frame, detection_width)]
+            reused = reuse_track_identities(face_locations, tracks)
+            encoded = [index for index, (_, identity) in enumerate(reused) if identity is None]
+            detected.append((position, face_locations, reused, encoded))
+        except Exception as e:
+            results[position] = e
+    if not detected:
+        return results
+
+    try:
+        batch_encodings = encode_faces_batch([
+            (frames[position][0], [face_locations[index] for index in encoded])
+            for position, face_locations, _, encoded in detected
+        ])
+    except Exception as e:
+        for position, _, _, _ in detected:
+            results[position] = e
+        return results
+
+    gallery = get_gallery()
+    if not len(gallery):
+        print("[Recognition Engine] Face gallery is empty. Attempting to load...")
+        gallery = load_known_faces()
+
+    for (position, face_locations, reused, encoded), face_encodings in zip(detected, batch_encodings):
+        _, _, course_id, semester_id, tolerance, _ = frames[position]
+        try:
+            matches = [identity for _, identity in reused]
+            if face_encodings:
+                new_matches = gallery.match_scoped_many(face_encodings, course_id, semester_id, tolerance=tolerance)
+                for index, match in zip(encoded, new_matches):
+                    matches[index] = match
+            results[position] = {
+                'locations': face_locations,
+                'matches': matches,
+                'track_ids': [track_id for track_id, _ in reused],
+                'encoded': encoded,
+                'encodings': np.asarray(face_encodings, dtype=np.float32).reshape(-1, 128),
+                'gallery_size': len(gallery),
+            }
+        except Exception as e:
+            results[position] = e
+    return results
+
+
+class RecognitionEngine:
+    """Bounded front end to the recognition process pool (fed by recognition_scheduler)."""
+
+    def __init__(self, workers=RECOGNITION_WORKERS, queue_size=RECOGNITION_QUEUE_SIZE, initializer=_init_worker):
+        self.workers = workers
+        self.initializer = initializer
+        self._slots = threading.BoundedSemaphore(max(1, workers + queue_size))
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn gives each worker a clean interpreter (no inherited DB sockets)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=self.initializer,
+                )
+            return self._executor
+
+    def _reset_executor(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def submit(self, fn, *args, wait=False):
+        """
+        Submits a call to the pool and returns its Future.
+        Raises EngineBusy if the bounded queue is full, unless wait is set,
+        in which case it blocks until a slot frees up.
+        """
+        if not self._slots.acquire(blocking=wait):
+            raise EngineBusy("Recognition queue is full.")
+        try:
+            try:
+                future = self._get_executor().submit(fn, *args)
+            except BrokenProcessPool:
+                print("[Recognition Engine] Worker pool broken, restarting it.")
+                self._reset_executor()
+                future = self._get_executor().submit(fn, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def run(self, fn, *args):
+        """
+        Runs a picklable call in the pool and waits for its result, or inline
+        when the pool is disabled. Raises EngineBusy if the queue is full.
+        Used for background work that needs Django and dlib, e.g. encoding jobs
+        on the background engine.
+        """
+        if self.workers <= 0:
+            return fn(*args)
+        future = self.submit(fn, *args)
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise EngineBusy("Recognition worker crashed; the pool is restarting.")
+
+    def map(self, fn, *iterables):
+        """
+        Runs fn over the argument lists in the pool and returns the results in
+        order, waiting for free slots instead of raising EngineBusy (or runs
+        inline when the pool is disabled). For background batches such as bulk imports.
+        """
+        if self.workers <= 0:
+            return [fn(*args) for args in zip(*iterables)]
+        futures = [self.submit(fn, *args, wait=True) for args in zip(*iterables)]
+        try:
+            return [future.result() for future in futures]
+        except BrokenProcessPool:
+            self._reset_executor()
+            raise EngineBusy("Recognition worker crashed; the pool is restarting.")
+
+    def shutdown(self):
+        self._reset_executor()
+
+
+_engine = None
+_background_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """Returns the process-wide recognition engine, created on first use."""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = RecognitionEngine()
+        return _engine
+
+
+def get_background_engine():
+    """Returns the process-wide background encoding engine, created on first use."""
+    global _background_engine
+    with _engine_lock:
+        if _background_engine is None:
+            _background_engine = RecognitionEngine(
+                workers=BACKGROUND_ENCODING_WORKERS,
+                queue_size=BACKGROUND_ENCODING_WORKERS,
+                initializer=_init_background_worker,
+            )
+        return _background_engine
@@ -0,0 +1,303 @@
+"""
+Per-camera fair queuing in front of the recognition engine.
+
+Without it, frames reach the worker pool in arrival order, so one busy
+entrance camera can fill the engine's queue and starve a quiet classroom.
+The scheduler keeps a short queue per camera and a dispatcher thread that
+hands frames to the pool only when a worker is free, taking cameras in
+weighted round-robin order (Camera.recognition_weight frames per turn).
+
+- Each camera queues at most FACE_SCHEDULER_QUEUE_SIZE frames; a newer frame
+  pushes out the oldest, whose request gets a "busy" answer.
+- A frame that waited longer than FACE_SCHEDULER_DEADLINE is dropped as
+  stale rather than recognized late.
+- Frames are handed to workers in micro-batches sized to spread the waiting
+  frames over the free workers (at most FACE_ENCODE_BATCH_SIZE). Only when a
+  single worker is left does the dispatcher wait up to
+  FACE_ENCODE_BATCH_WINDOW seconds for more frames. One process_frames call
+  encodes all faces of its batch in a single dlib call.
+- stats() reports queue depth, served/dropped/stale counts and average wait
+  and total latency per camera (per web process).
+
+Async views await arecognize(), which waits on the same Future without
+holding a thread. With FACE_RECOGNITION_WORKERS = 0 frames are recognized
+inline, unscheduled.
+"""
+import asyncio
+import collections
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .face_gallery import DEFAULT_TOLERANCE
+from .recognition_engine import RECOGNITION_TIMEOUT, EngineBusy, get_engine, process_frame, process_frames
+
+# Frames waiting per camera; the oldest is dropped when a newer one arrives
+FACE_SCHEDULER_QUEUE_SIZE = getattr(settings, 'FACE_SCHEDULER_QUEUE_SIZE', 2)
+# Seconds a frame may wait for a worker before it is dropped as stale
+FACE_SCHEDULER_DEADLINE = getattr(settings, 'FACE_SCHEDULER_DEADLINE', 2.0)
+# Frames per micro-batch, and seconds the dispatcher waits for a batch to fill
+FACE_ENCODE_BATCH_SIZE = getattr(settings, 'FACE_ENCODE_BATCH_SIZE', 4)
+FACE_ENCODE_BATCH_WINDOW = getattr(settings, 'FACE_ENCODE_BATCH_WINDOW', 0.005)
+# Smoothing factor of the per-camera latency averages
+LATENCY_SMOOTHING = 0.2
+
+
+class ScheduledFrame:
+    """A frame waiting in a camera queue, with the Future its request waits on."""
+
+    __slots__ = ('camera_key', 'args', 'enqueued', 'future')
+
+    def __init__(self, camera_key, args):
+        self.camera_key = camera_key
+        self.args = args
+        self.enqueued = time.monotonic()
+        self.future = Future()
+
+
+class CameraStats:
+    """Counters and smoothed latencies of one camera queue."""
+
+    def __init__(self):
+        self.served = 0
+        self.dropped = 0
+        self.stale = 0
+        self.wait_ms = None
+        self.latency_ms = None
+
+    @staticmethod
+    def _smooth(average, value):
+        return value if average is None else average + LATENCY_SMOOTHING * (value - average)
+
+    def record_wait(self, seconds):
+        self.wait_ms = self._smooth(self.wait_ms, seconds * 1000)
+
+    def record_latency(self, seconds):
+        self.latency_ms = self._smooth(self.latency_ms, seconds * 1000)
+
+
+class RecognitionScheduler:
+    """Weighted round-robin over per-camera frame queues, feeding the engine's pool."""
+
+    def __init__(self, engine=None, queue_size=FACE_SCHEDULER_QUEUE_SIZE, deadline=FACE_SCHEDULER_DEADLINE,
+                 batch_size=FACE_ENCODE_BATCH_SIZE, batch_window=FACE_ENCODE_BATCH_WINDOW):
+        self.engine = engine or get_engine()
+        self.queue_size = max(1, queue_size)
+        self.deadline = deadline
+        self.batch_size = max(1, batch_size)
+        self.batch_window = batch_window
+        # Batches sent to the pool at once: one per worker, so waiting happens here
+        self.slots = max(1, self.engine.workers)
+        self._queues = {}
+        self._weights = {}
+        self._stats = {}
+        # Cameras with waiting frames, in serving order; the head is being served
+        self._rotation = collections.deque()
+        self._served_this_turn = 0
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, camera_key, args, weight=1):
+        """Queues process_frame(*args) for a camera and returns the Future of its result."""
+        frame = ScheduledFrame(camera_key, args)
+        with self._condition:
+            queue = self._queues.get(camera_key)
+            if queue is None:
+                queue = self._queues[camera_key] = collections.deque()
+                self._stats[camera_key] = CameraStats()
+            self._weights[camera_key] = max(1, int(weight or 1))
+            if len(queue) >= self.queue_size:
+                dropped = queue.popleft()
+                self._stats[camera_key].dropped += 1
+                if dropped.future.set_running_or_notify_cancel():
+                    dropped.future.set_exception(EngineBusy("Frame replaced by a newer frame from the same camera."))
+            queue.append(frame)
+            if camera_key not in self._rotation:
+                self._rotation.append(camera_key)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._dispatch, name='recognition-scheduler', daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+        return frame.future
+
+    def recognize(self, camera_key, rgb_frame, detection_width, course_id, semester_id,
+                  tolerance=DEFAULT_TOLERANCE, timeout=RECOGNITION_TIMEOUT, tracks=None, weight=1):
+        """
+        Recognizes one camera frame through the scheduler, waiting up to
+        `timeout` seconds for its turn and result.
+        Raises EngineBusy when the frame is dropped, stale or late.
+        """
+        if self.engine.workers <= 0:
+            return process_frame(rgb_frame, detection_width, course_id, semester_id, tolerance, tracks)
+        future = self.submit(camera_key, (rgb_frame, detection_width, course_id, semester_id, tolerance, tracks), weight)
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            # A frame still queued is skipped by the dispatcher; one already running finishes unused
+            future.cancel()
+            raise EngineBusy(f"Recognition did not finish within {timeout} seconds.")
+
+    async def arecognize(self, camera_key, rgb_frame, detection_width, course_id, semester_id,
+                         tolerance=DEFAULT_TOLERANCE, timeout=RECOGNITION_TIMEOUT, tracks=None, weight=1):
+        """
+        Awaitable recognize() for async views: the event loop is free while
+        the frame waits for its turn and its worker.
+        """
+        if self.engine.workers <= 0:
+            return await sync_to_async(process_frame, thread_sensitive=False)(
+                rgb_frame, detection_width, course_id, semester_id, tolerance, tracks
+            )
+        future = self.submit(camera_key, (rgb_frame, detection_width, course_id, semester_id, tolerance, tracks), weight)
+        try:
+            # On timeout the cancellation reaches the Future, so a still queued frame is skipped
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            raise EngineBusy(f"Recognition did not finish within {timeout} seconds.")
+
+    def _next_frame(self):
+        """Pops the next frame in weighted round-robin order (called with the lock held)."""
+        while self._rotation:
+            camera_key = self._rotation[0]
+            queue = self._queues[camera_key]
+            if not queue:
+                self._rotation.popleft()
+                self._served_this_turn = 0
+                continue
+            frame = queue.popleft()
+            self._served_this_turn += 1
+            if not queue:
+                self._rotation.popleft()
+                self._served_this_turn = 0
+            elif self._served_this_turn >= self._weights.get(camera_key, 1):
+                self._rotation.rotate(-1)
+                self._served_this_turn = 0
+            return frame
+        return None
+
+    def batch_limit(self, free_slots):
+        """
+        Frames for the next batch: the waiting frames spread evenly over the
+        free workers (ceil(queued / free_slots)), at most batch_size. Detection
+        runs serially inside a batch, so idle workers are not left unused.
+        """
+        queued = sum(len(queue) for queue in self._queues.values())
+        return max(1, min(self.batch_size, -(-queued // max(1, free_slots))))
+
+    def _take_frames(self, limit):
+        """
+        Pops up to `limit` runnable frames in fair order, skipping cancelled
+        ones and failing stale ones (called with the lock held).
+        """
+        frames = []
+        while len(frames) < limit:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            if not frame.future.set_running_or_notify_cancel():
+                continue
+            stats = self._stats[frame.camera_key]
+            waited = time.monotonic() - frame.enqueued
+            if waited > self.deadline:
+                stats.stale += 1
+                frame.future.set_exception(EngineBusy(f"Frame waited {waited:.1f} seconds and is stale."))
+                continue
+            stats.record_wait(waited)
+            frames.append(frame)
+        return frames
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                while self._in_flight >= self.slots or not self._rotation:
+                    self._condition.wait()
+                free_slots = self.slots - self._in_flight
+                batch = self._take_frames(self.batch_limit(free_slots))
+                if not batch:
+                    continue
+                # Only the last free worker waits for the window to fill its batch;
+                # while others are idle, spreading frames over them is faster
+                window_end = time.monotonic() + self.batch_window
+                while free_slots == 1 and len(batch) < self.batch_size:
+                    remaining = window_end - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    if not self._rotation:
+                        self._condition.wait(remaining)
+                    batch += self._take_frames(self.batch_size - len(batch))
+                self._in_flight += 1
+
+            try:
+                pool_future = self.engine.submit(process_frames, [frame.args for frame in batch])
+            except Exception as e:
+                self._finish(batch, None, e)
+                continue
+            pool_future.add_done_callback(lambda done, batch=batch: self._finish(batch, done))
+
+    def _finish(self, batch, pool_future, error=None):
+        results = [error] * len(batch)
+        if error is None:
+            try:
+                results = pool_future.result()
+            except BrokenProcessPool:
+                self.engine.shutdown()
+                results = [EngineBusy("Recognition worker crashed; the pool is restarting.")] * len(batch)
+            except Exception as e:
+                results = [e] * len(batch)
+        now = time.monotonic()
+        with self._condition:
+            self._in_flight -= 1
+            for frame, result in zip(batch, results):
+                if not isinstance(result, Exception):
+                    stats = self._stats[frame.camera_key]
+                    stats.served += 1
+                    stats.record_latency(now - frame.enqueued)
+            self._condition.notify_all()
+        for frame, result in zip(batch, results):
+            if isinstance(result, Exception):
+                frame.future.set_exception(result)
+            else:
+                frame.future.set_result(result)
+
+    def stats(self):
+        """Per-camera queue depth, counters and average wait/total latency in ms."""
+        with self._condition:
+            return {
+                camera_key: {
+                    'queued': len(self._queues[camera_key]),
+                    'weight': self._weights.get(camera_key, 1),
+                    'served': stats.served,
+                    'dropped': stats.dropped,
+                    'stale': stats.stale,
+                    'wait_ms': round(stats.wait_ms, 1) if stats.wait_ms is not None else None,
+                    'latency_ms': round(stats.latency_ms, 1) if stats.latency_ms is not None else None,
+                }
+                for camera_key, stats in self._stats.items()
+            }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide recognition scheduler, created on first use."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RecognitionScheduler()
+        return _scheduler
+
+
+def camera_schedule(camera_id):
+    """(queue key, weight) of a request's camera; requests without a known camera share one queue."""
+    from .face_pipeline import get_camera
+
+    camera = get_camera(camera_id)
+    if camera is None:
+        return 'default', 1
+    return str(camera.id), camera.recognition_weight
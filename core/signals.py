@@ -1,11 +1,74 @@
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save
 from django.dispatch import receiver
-from .models import User, StudentProfile
+from .models import AttendanceRecord, FaceEncoding, User
+from .checkin_cache import recent_checkins
+from .face_gallery import in_gallery, publish_student_change
+
+# Only saves touching these fields can change a student's gallery row
+GALLERY_FIELDS = {
+    'face_encoding', 'is_student', 'authorized', 'is_active', 'course', 'course_id', 'semester', 'semester_id'
+}
+# Marks a saved student whose previous gallery row was not read
+UNKNOWN_ROW = object()
+
+
+def gallery_row(student):
+    """What the gallery holds for a student's profile encoding: None, or (encoding bytes, course, semester)."""
+    if student is None or not in_gallery(student):
+        return None
+    return bytes(student.face_encoding), student.course_id, student.semester_id
+
+
+@receiver(pre_save, sender=User)
+def remember_gallery_row(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Notes the student's gallery row before an update so saves that keep it publish nothing."""
+    if raw or instance._state.adding:
+        return
+    if update_fields is not None and not GALLERY_FIELDS.intersection(update_fields):
+        return
+    previous = User.objects.filter(pk=instance.pk).only(
+        'face_encoding', 'is_student', 'authorized', 'is_active', 'course_id', 'semester_id'
+    ).first()
+    instance._gallery_row_before = gallery_row(previous)
+
 
 @receiver(post_save, sender=User)
-def create_or_update_user_profile(sender, instance, created, **kwargs):
+def update_face_gallery_on_save(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    """Adds, replaces or removes the student's gallery row once the save is committed."""
+    if raw:
+        return
+    if update_fields is not None and not GALLERY_FIELDS.intersection(update_fields):
+        return
+    before = None if created else instance.__dict__.pop('_gallery_row_before', UNKNOWN_ROW)
+    if gallery_row(instance) == before:
+        return
+    transaction.on_commit(lambda: publish_student_change(instance, row_changed=True))
+
+
+@receiver(post_delete, sender=User)
+def remove_from_face_gallery_on_delete(sender, instance, **kwargs):
+    """Removes a deleted student's gallery row once the delete is committed."""
     if instance.is_student:
-        if created:
-            StudentProfile.objects.create(user=instance)
-        else:
-            instance.student_profile.save()
+        transaction.on_commit(lambda: publish_student_change(instance, deleted=True))
+
+
+@receiver(post_save, sender=FaceEncoding)
+@receiver(post_delete, sender=FaceEncoding)
+def update_face_gallery_on_extra_encoding(sender, instance, raw=False, **kwargs):
+    """Re-applies the student's gallery rows once an extra encoding is added or removed."""
+    if raw:
+        return
+    student_id = instance.student_id
+
+    def publish():
+        student = User.objects.filter(pk=student_id).first()
+        if student is not None:
+            publish_student_change(student, row_changed=in_gallery(student))
+    transaction.on_commit(publish)
+
+
+@receiver(post_delete, sender=AttendanceRecord)
+def forget_cached_check_in(sender, instance, **kwargs):
+    """A deleted attendance record must not keep being answered as "Already marked"."""
+    transaction.on_commit(lambda: recent_checkins.invalidate(instance.student_id, instance.date))
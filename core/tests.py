@@ -1,3 +1,1439 @@
-from django.test import TestCase
+import base64
+import datetime
+import importlib.util
+import io
+import json
+import os
+import queue
+import struct
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from concurrent.futures import Future
+from unittest import mock
 
-# Create your tests here.
+import cv2
+import numpy as np
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .attendance import recognize_all_faces
+from .bulk_import import DUPLICATE, INVALID, WOULD_CREATE, find_duplicate_faces, import_students, run_import_job
+from .camera_health import CameraHealthProber, save_probe_results
+from .camera_ingest import CameraReader, LatestFrameBuffer
+from .checkin_cache import RecentCheckIns
+from . import face_gallery
+from .encoding_jobs import EncodingJobQueue
+from .face_gallery import FaceGallery, sync_gallery
+from .face_index import IVFIndex
+from .face_pipeline import detect_faces
+from .face_tracker import FaceTracker, associate, box_iou_matrix, reuse_track_identities
+from .frame_gate import FrameGate, gated_http_response
+from .gallery_enrichment import GalleryEnricher, is_diverse, store_sample
+from .gallery_file import GALLERY_FILE_VERSION, HEADER_FORMAT, open_gallery_file, read_header, write_gallery_file
+from .models import (
+    ENCODING_HEADER, AttendanceRecord, AttendanceSettings, Camera, Course, Department, FaceEncoding, FaceGalleryChange,
+    Semester, Session, StudentImport, User, pack_encoding, unpack_encoding,
+)
+from .recognition_engine import EngineBusy, RecognitionEngine
+from .recognition_scheduler import RecognitionScheduler
+from .views import read_frame_request
+
+HAS_FACE_RECOGNITION = importlib.util.find_spec('face_recognition') is not None
+
+# Per-process caches for tests (settings use Redis or the database cache)
+LOCMEM_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'checkins': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'checkin-tests'},
+}
+
+
+def random_encodings(count, seed=0):
+    """Unit-scale random 128-d vectors, about 1.4 apart from each other."""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal((count, 128)) / np.sqrt(128)).astype(np.float32)
+
+
+class FaceGalleryTests(SimpleTestCase):
+    """Row bookkeeping and matching of the contiguous face gallery."""
+
+    def setUp(self):
+        self.encodings = random_encodings(5)
+        self.gallery = FaceGallery()
+        self.gallery.upsert(1, self.encodings[0], course_id=10, semester_id=20)
+        self.gallery.upsert(2, self.encodings[1], course_id=10, semester_id=20)
+        self.gallery.upsert(3, self.encodings[2], course_id=11, semester_id=20)
+        # Second row (e.g. a FaceEncoding) of student 2
+        self.gallery.upsert(2, self.encodings[3], course_id=10, semester_id=20, key=7)
+
+    def assert_rows_consistent(self):
+        """Every (student, key) row maps back to the arrays it was stored in."""
+        gallery = self.gallery
+        self.assertEqual(len(gallery._rows), len(gallery))
+        for (student_id, key), row in gallery._rows.items():
+            self.assertLess(row, len(gallery))
+            self.assertEqual(gallery.ids[row], student_id)
+            self.assertEqual(gallery.keys[row], key)
+            np.testing.assert_allclose(gallery.sq_norms[row], np.dot(gallery.encodings[row], gallery.encodings[row]), rtol=1e-5)
+
+    def test_upsert_adds_and_replaces_rows(self):
+        self.assertEqual(len(self.gallery), 4)
+        self.assertEqual(self.gallery.student_count, 3)
+        self.gallery.upsert(3, self.encodings[4], course_id=11, semester_id=20)
+        self.assertEqual(len(self.gallery), 4)
+        rows, course_id, semester_id = self.gallery.get_rows(3)
+        np.testing.assert_array_equal(rows[0], self.encodings[4])
+        self.assertEqual((course_id, semester_id), (11, 20))
+        self.assert_rows_consistent()
+
+    def test_remove_swaps_last_row_into_place(self):
+        self.assertTrue(self.gallery.remove(1))
+        self.assertNotIn(1, self.gallery)
+        self.assertEqual(len(self.gallery), 3)
+        # Student 2's second row was last and now fills row 0
+        self.assertEqual(self.gallery._rows[(2, 7)], 0)
+        self.assert_rows_consistent()
+        self.assertEqual(self.gallery.match(self.encodings[3])[0], 2)
+        self.assertEqual(self.gallery.match(self.encodings[2])[0], 3)
+
+    def test_remove_single_key(self):
+        self.assertTrue(self.gallery.remove(2, key=7))
+        self.assertIn(2, self.gallery)
+        self.assertEqual(set(self.gallery.get_rows(2)[0]), {0})
+        self.assertFalse(self.gallery.remove(2, key=7))
+        self.assertTrue(self.gallery.remove(2))
+        self.assertNotIn(2, self.gallery)
+        self.assert_rows_consistent()
+
+    def test_remove_last_row(self):
+        self.assertTrue(self.gallery.remove(2, key=7))
+        self.assertEqual(len(self.gallery), 3)
+        self.assert_rows_consistent()
+
+    def test_match_scoped_many(self):
+        probes = np.stack([
+            self.encodings[3] + 0.001,   # student 2's second row, in scope
+            self.encodings[2] + 0.001,   # student 3, other course
+            -self.encodings[0],          # nobody
+        ])
+        results = self.gallery.match_scoped_many(probes, 10, 20)
+        self.assertEqual([(student_id, in_scope) for student_id, _, in_scope in results],
+                         [(2, True), (3, False), (None, False)])
+        self.assertLess(results[0][1], 0.05)
+        self.assertGreater(results[2][1], 0.45)
+
+    def test_nearest_k_takes_group_min_per_student(self):
+        probe = self.encodings[3] + 0.001
+        ranked = self.gallery.nearest_k(probe, 3)
+        self.assertEqual([student_id for student_id, _ in ranked][0], 2)
+        self.assertEqual(len({student_id for student_id, _ in ranked}), 3)
+        expected = float(np.linalg.norm(self.encodings[3] - probe))
+        self.assertAlmostEqual(ranked[0][1], expected, places=4)
+        distances = [distance for _, distance in ranked]
+        self.assertEqual(distances, sorted(distances))
+
+    def test_empty_gallery(self):
+        gallery = FaceGallery()
+        self.assertEqual(gallery.match(self.encodings[0]), (None, None))
+        self.assertEqual(gallery.match_scoped_many(self.encodings[:2], 10, 20), [(None, None, False)] * 2)
+        self.assertEqual(gallery.nearest_k(self.encodings[0], 3), [])
+
+
+class EncodingFormatTests(SimpleTestCase):
+    """Tagged float32 binary encoding format."""
+
+    def test_round_trip(self):
+        encoding = random_encodings(1)[0]
+        data = pack_encoding(encoding)
+        self.assertEqual(len(data), len(ENCODING_HEADER) + 4 * 128)
+        unpacked = unpack_encoding(data)
+        self.assertEqual(unpacked.dtype, np.dtype('<f4'))
+        np.testing.assert_array_equal(unpacked, encoding)
+        self.assertFalse(unpacked.flags.writeable)
+
+    def test_round_trip_from_float64(self):
+        encoding = random_encodings(1)[0].astype(np.float64)
+        np.testing.assert_allclose(unpack_encoding(pack_encoding(encoding)), encoding, rtol=1e-6)
+
+    def test_unknown_header_is_rejected(self):
+        data = pack_encoding(random_encodings(1)[0])
+        for bad in (b'XX' + data[2:], data[:2] + bytes([9]) + data[3:], data[:3] + b'd' + data[4:], b'FE'):
+            with self.assertRaises(ValueError):
+                unpack_encoding(bad)
+
+
+class BinaryEncodingMigrationTests(TransactionTestCase):
+    """0011 converts JSON text encodings to the binary format (and back)."""
+
+    migrate_from = [('core', '0010_facegallerychange')]
+    migrate_to = [('core', '0011_binary_face_encoding')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        executor.loader.build_graph()
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_json_encodings_become_binary(self):
+        encoding = random_encodings(1)[0]
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        student = User.objects.create(username='legacy', face_encoding=json.dumps(encoding.tolist()))
+        broken = User.objects.create(username='broken', face_encoding='not json')
+        empty = User.objects.create(username='empty', face_encoding='')
+
+        apps = self.migrate(self.migrate_to)
+        User = apps.get_model('core', 'User')
+        np.testing.assert_array_equal(unpack_encoding(bytes(User.objects.get(pk=student.pk).face_encoding)), encoding)
+        self.assertIsNone(User.objects.get(pk=broken.pk).face_encoding)
+        self.assertIsNone(User.objects.get(pk=empty.pk).face_encoding)
+
+    def test_reverse_restores_json(self):
+        encoding = random_encodings(1)[0]
+        apps = self.migrate(self.migrate_to)
+        User = apps.get_model('core', 'User')
+        student = User.objects.create(username='binary', face_encoding=pack_encoding(encoding))
+
+        apps = self.migrate(self.migrate_from)
+        User = apps.get_model('core', 'User')
+        restored = json.loads(User.objects.get(pk=student.pk).face_encoding)
+        np.testing.assert_allclose(restored, encoding, rtol=1e-6)
+
+
+class GalleryFileTests(SimpleTestCase):
+    """Writing and memory-mapping the shared gallery file."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'gallery.bin')
+        self.encodings = random_encodings(3)
+        self.gallery = FaceGallery(self.encodings, [1, 1, 2], [10, 10, None], [20, 20, 21], keys=[0, 7, 0])
+        self.gallery.generation = 5
+
+    def test_round_trip_with_keys(self):
+        self.assertTrue(write_gallery_file(self.gallery, self.path))
+        self.assertEqual(read_header(self.path), (3, 128, 5))
+        opened = open_gallery_file(self.path)
+        self.assertEqual(opened.generation, 5)
+        np.testing.assert_array_equal(opened.encodings, self.encodings)
+        np.testing.assert_array_equal(opened.ids, [1, 1, 2])
+        np.testing.assert_array_equal(opened.keys, [0, 7, 0])
+        np.testing.assert_array_equal(opened.course_ids, [10, 10, -1])
+        np.testing.assert_array_equal(opened.semester_ids, [20, 20, 21])
+        np.testing.assert_allclose(opened.sq_norms, self.gallery.sq_norms)
+        self.assertEqual(set(opened.get_rows(1)[0]), {0, 7})
+
+    def test_memory_mapped_gallery_copies_on_write(self):
+        write_gallery_file(self.gallery, self.path)
+        opened = open_gallery_file(self.path)
+        opened.upsert(3, random_encodings(1, seed=1)[0], course_id=10, semester_id=20)
+        opened.remove(1, key=7)
+        self.assertEqual(open_gallery_file(self.path).keys.tolist(), [0, 7, 0])
+        self.assertEqual(sorted(zip(opened.ids.tolist(), opened.keys.tolist())), [(1, 0), (2, 0), (3, 0)])
+
+    def test_empty_gallery(self):
+        gallery = FaceGallery()
+        gallery.generation = 2
+        write_gallery_file(gallery, self.path)
+        opened = open_gallery_file(self.path)
+        self.assertEqual(len(opened), 0)
+        self.assertEqual(opened.generation, 2)
+
+    def test_older_generation_does_not_replace_newer_file(self):
+        write_gallery_file(self.gallery, self.path)
+        older = FaceGallery(self.encodings[:1], [9])
+        older.generation = 4
+        self.assertFalse(write_gallery_file(older, self.path))
+        self.assertEqual(read_header(self.path), (3, 128, 5))
+
+    def rewrite_header(self, **changes):
+        with open(self.path, 'r+b') as f:
+            fields = dict(zip(
+                ('magic', 'version', 'count', 'dim', 'generation'),
+                struct.unpack_from(HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT))),
+            ))
+            fields.update(changes)
+            f.seek(0)
+            f.write(struct.pack(HEADER_FORMAT, *fields.values()))
+
+    def test_version_mismatch_is_ignored(self):
+        write_gallery_file(self.gallery, self.path)
+        self.rewrite_header(version=GALLERY_FILE_VERSION - 1)
+        self.assertIsNone(read_header(self.path))
+        self.assertIsNone(open_gallery_file(self.path))
+
+    def test_unexpected_dimension_is_ignored(self):
+        write_gallery_file(self.gallery, self.path)
+        self.rewrite_header(dim=64)
+        self.assertIsNone(read_header(self.path))
+        self.assertIsNone(open_gallery_file(self.path))
+
+    def test_replaced_file_does_not_mix_generations(self):
+        write_gallery_file(self.gallery, self.path)
+        opened = open_gallery_file(self.path)
+        newer = FaceGallery(random_encodings(1, seed=2), [9])
+        newer.generation = 6
+        self.assertTrue(write_gallery_file(newer, self.path))
+        # The open gallery still reads the file it mapped
+        self.assertEqual(opened.generation, 5)
+        np.testing.assert_array_equal(opened.ids, [1, 1, 2])
+        np.testing.assert_array_equal(opened.encodings, self.encodings)
+        self.assertEqual(open_gallery_file(self.path).ids.tolist(), [9])
+
+    def test_truncated_file_is_ignored(self):
+        write_gallery_file(self.gallery, self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 8)
+        self.assertIsNone(open_gallery_file(self.path))
+
+    def test_missing_file(self):
+        self.assertIsNone(read_header(self.path))
+        self.assertIsNone(open_gallery_file(self.path))
+
+
+class FrameGateTests(SimpleTestCase):
+    """Unchanged-scene, max-FPS and cache TTL rules of the recognition frame gate."""
+
+    def setUp(self):
+        patcher = mock.patch('core.frame_gate.time')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock.monotonic.return_value = 1000.0
+        self.gate = FrameGate(diff_threshold=4.0, result_ttl=3.0)
+        self.response = HttpResponse(b'{"faces": []}', content_type='application/json')
+
+    def advance(self, seconds):
+        self.clock.monotonic.return_value += seconds
+
+    @staticmethod
+    def frame(level):
+        return np.full((48, 64, 3), level, dtype=np.uint8)
+
+    def process(self, frame, max_fps=None, key='camera-1'):
+        cached, reason = self.gate.check(key, frame, max_fps)
+        if reason is None:
+            self.gate.remember(key, self.response)
+        return cached, reason
+
+    def test_unchanged_scene_replays_cached_response(self):
+        self.assertEqual(self.process(self.frame(100)), (None, None))
+        self.advance(1)
+        self.assertEqual(self.process(self.frame(103)), ((200, b'{"faces": []}'), 'unchanged'))
+        self.assertEqual(self.process(self.frame(105)), (None, None))
+
+    def test_cached_response_expires(self):
+        self.process(self.frame(100))
+        self.advance(3.5)
+        self.assertEqual(self.process(self.frame(100)), (None, None))
+
+    def test_rate_limit(self):
+        self.process(self.frame(100), max_fps=2)
+        self.advance(0.1)
+        # The scene changed (e.g. a new person): the last answer must not be replayed
+        self.assertEqual(self.process(self.frame(200), max_fps=2), (None, 'rate_limited'))
+        self.assertEqual(self.process(self.frame(100), max_fps=2), ((200, b'{"faces": []}'), 'unchanged'))
+        self.advance(0.5)
+        self.assertEqual(self.process(self.frame(200), max_fps=2), (None, None))
+
+    def test_gated_http_response(self):
+        replayed = gated_http_response((200, b'{"faces": []}'), 'unchanged')
+        self.assertEqual((replayed.status_code, replayed.content, replayed['X-Frame-Gate']), (200, b'{"faces": []}', 'unchanged'))
+        skipped = gated_http_response(None, 'rate_limited')
+        self.assertEqual((skipped.status_code, json.loads(skipped.content)['status']), (429, 'busy'))
+        self.assertEqual(skipped['X-Frame-Gate'], 'rate_limited')
+
+    def test_error_responses_are_not_cached(self):
+        self.gate.check('camera-1', self.frame(100))
+        self.gate.remember('camera-1', HttpResponse(status=503))
+        self.assertEqual(self.gate.check('camera-1', self.frame(100)), (None, None))
+
+    def test_streams_are_independent(self):
+        self.process(self.frame(100), key='camera-1')
+        self.assertEqual(self.process(self.frame(100), key='camera-2'), (None, None))
+        self.gate.forget('camera-1')
+        self.assertEqual(self.process(self.frame(100), key='camera-1'), (None, None))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RecentCheckInsTests(SimpleTestCase):
+    """TTL and cross-worker invalidation of the kiosk check-in cache."""
+
+    def setUp(self):
+        caches['checkins'].clear()
+        patcher = mock.patch('time.time')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock.return_value = 1000.0
+        self.cache = RecentCheckIns(ttl=300, alias='checkins')
+        # A second web worker sharing the same cache
+        self.other_worker = RecentCheckIns(ttl=300, alias='checkins')
+        self.today = datetime.date(2026, 10, 17)
+
+    def advance(self, seconds):
+        self.clock.return_value += seconds
+
+    def test_entries_expire_after_ttl(self):
+        self.cache.put(1, 2, 3, self.today, {'status': 'success'})
+        self.advance(299)
+        self.assertEqual(self.other_worker.get(1, 2, 3, self.today), {'status': 'success'})
+        self.advance(2)
+        self.assertIsNone(self.cache.get(1, 2, 3, self.today))
+
+    def test_keys_are_normalized(self):
+        self.cache.put('1', 2, '3', self.today, {'status': 'success'})
+        self.assertEqual(self.cache.get(1, '2', 3, self.today), {'status': 'success'})
+        self.assertIsNone(self.cache.get(1, 2, 3, self.today + datetime.timedelta(days=1)))
+
+    def test_payloads_are_copied(self):
+        payload = {'status': 'success'}
+        self.cache.put(1, 2, 3, self.today, payload)
+        payload['status'] = 'changed'
+        self.cache.get(1, 2, 3, self.today)['status'] = 'changed'
+        self.assertEqual(self.cache.get(1, 2, 3, self.today), {'status': 'success'})
+
+    def test_invalidation_reaches_other_workers(self):
+        yesterday = self.today - datetime.timedelta(days=1)
+        self.cache.put(1, 2, 3, self.today, {})
+        self.cache.put(5, 6, 3, yesterday, {})
+        self.cache.put(1, 2, 4, self.today, {})
+        self.other_worker.invalidate(3, date=yesterday)
+        self.assertIsNone(self.cache.get(5, 6, 3, yesterday))
+        self.assertIsNotNone(self.cache.get(1, 2, 3, self.today))
+        self.other_worker.invalidate(3)
+        self.assertIsNone(self.cache.get(1, 2, 3, self.today))
+        self.assertIsNotNone(self.cache.get(1, 2, 4, self.today))
+        # Entries written after the invalidation are found again
+        self.cache.put(1, 2, 3, self.today, {'status': 'success'})
+        self.assertEqual(self.other_worker.get(1, 2, 3, self.today), {'status': 'success'})
+
+    def test_async_access(self):
+        async_to_sync(self.cache.aput)(1, 2, 3, self.today, {'status': 'success'})
+        self.assertEqual(async_to_sync(self.other_worker.aget)(1, 2, 3, self.today), {'status': 'success'})
+        self.cache.invalidate(3, self.today)
+        self.assertIsNone(async_to_sync(self.other_worker.aget)(1, 2, 3, self.today))
+
+
+class FaceTrackerTests(SimpleTestCase):
+    """Detection-to-track association and identity reuse across frames."""
+
+    def setUp(self):
+        patcher = mock.patch('core.face_tracker.time')
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.clock.monotonic.return_value = 1000.0
+        self.tracker = FaceTracker(max_age=1.5, refresh_interval=3.0)
+
+    def advance(self, seconds):
+        self.clock.monotonic.return_value += seconds
+
+    def test_box_iou(self):
+        iou = box_iou_matrix([(0, 100, 100, 0)], [(0, 100, 100, 0), (0, 150, 100, 50), (200, 300, 300, 200)])
+        np.testing.assert_allclose(iou[0], [1.0, 1 / 3, 0.0], rtol=1e-5)
+
+    def test_associate_by_iou(self):
+        tracks = [(0, 100, 100, 0), (0, 400, 100, 300)]
+        # Detections in the opposite order, each shifted slightly
+        faces = [(5, 405, 105, 305), (5, 105, 105, 5)]
+        self.assertEqual(associate(faces, tracks), [1, 0])
+
+    def test_associate_falls_back_to_centroid(self):
+        tracks = [(0, 100, 100, 0)]
+        # Moved 40% of the box width: IoU below threshold, centroid close enough
+        self.assertEqual(associate([(0, 140, 100, 40)], tracks, iou_threshold=0.5), [0])
+        self.assertEqual(associate([(0, 170, 100, 70)], tracks, iou_threshold=0.5), [None])
+
+    def test_track_is_used_once(self):
+        tracks = [(0, 100, 100, 0)]
+        self.assertEqual(associate([(0, 100, 100, 0), (2, 102, 102, 2)], tracks), [0, None])
+        self.assertEqual(associate([], tracks), [])
+        self.assertEqual(associate([(0, 100, 100, 0)], []), [None])
+
+    def test_identity_is_reused_until_refresh(self):
+        box = (0, 100, 100, 0)
+        identity = (42, 0.3, True)
+        self.tracker.update('stream', {'locations': [box], 'track_ids': [None], 'matches': [identity], 'encoded': [0]})
+        tracks = self.tracker.snapshot('stream')
+        self.assertEqual(reuse_track_identities([(2, 102, 102, 2)], tracks), [(tracks[0]['track_id'], identity)])
+
+        for _ in range(4):
+            self.advance(0.8)
+            self.tracker.update('stream', {'locations': [box], 'track_ids': [tracks[0]['track_id']], 'matches': [identity], 'encoded': []})
+        # Still tracked, but the identity is older than the refresh interval
+        tracks = self.tracker.snapshot('stream')
+        self.assertEqual(len(tracks), 1)
+        self.assertIsNone(tracks[0]['identity'])
+
+    def test_unmatched_face_is_not_identified(self):
+        self.tracker.update('stream', {
+            'locations': [(0, 100, 100, 0)], 'track_ids': [None], 'matches': [(None, 0.8, False)], 'encoded': [0],
+        })
+        self.assertIsNone(self.tracker.snapshot('stream')[0]['identity'])
+
+    def test_tracks_expire(self):
+        self.tracker.update('stream', {'locations': [(0, 100, 100, 0)], 'track_ids': [None], 'matches': [(42, 0.3, True)], 'encoded': [0]})
+        self.advance(2)
+        self.assertEqual(self.tracker.snapshot('stream'), [])
+        self.assertEqual(reuse_track_identities([(0, 100, 100, 0)], []), [(None, None)])
+
+
+class IVFIndexTests(SimpleTestCase):
+    """The IVF index must find (nearly) the same nearest rows as a full scan."""
+
+    def setUp(self):
+        rng = np.random.default_rng(1)
+        self.rng = rng
+        self.centers = rng.standard_normal((40, 128)).astype(np.float32)
+        self.encodings = self.clustered(4000)
+        self.sq_norms = np.einsum('ij,ij->i', self.encodings, self.encodings)
+
+    def clustered(self, count):
+        labels = self.rng.integers(0, len(self.centers), count)
+        return (self.centers[labels] + 0.05 * self.rng.standard_normal((count, 128))).astype(np.float32)
+
+    def near(self, encodings):
+        return (encodings + 0.001 * self.rng.standard_normal(encodings.shape)).astype(np.float32)
+
+    @staticmethod
+    def brute_force(gallery, probes):
+        distances = gallery.distance_matrix(probes)
+        rows = np.argmin(distances, axis=1)
+        return rows, distances[np.arange(len(probes)), rows]
+
+    def test_recall_against_brute_force(self):
+        probes = self.near(self.encodings[self.rng.choice(len(self.encodings), 200, replace=False)])
+        expected_rows, expected_distances = self.brute_force(FaceGallery(self.encodings, np.arange(len(self.encodings))), probes)
+        index = IVFIndex.train(self.encodings, n_lists=64, n_probe=4)
+        rows, distances = index.search(probes, self.encodings, self.sq_norms)
+        self.assertGreaterEqual(np.mean(rows == expected_rows), 0.95)
+        found = rows == expected_rows
+        np.testing.assert_allclose(distances[found], expected_distances[found], atol=1e-2)
+
+    def test_probing_every_list_is_exact(self):
+        probes = self.near(self.encodings[:50])
+        gallery = FaceGallery(self.encodings, np.arange(len(self.encodings)))
+        index = IVFIndex.train(self.encodings, n_lists=16, n_probe=16)
+        rows, _ = index.search(probes, self.encodings, self.sq_norms)
+        np.testing.assert_array_equal(rows, self.brute_force(gallery, probes)[0])
+
+    def test_index_follows_gallery_updates(self):
+        with mock.patch('core.face_gallery.use_index', return_value=True):
+            gallery = FaceGallery(self.encodings, np.arange(len(self.encodings)))
+            gallery.match_many(self.encodings[:1])
+            index = gallery._index
+            self.assertIsNotNone(index)
+
+            for student_id in range(100):
+                gallery.remove(student_id)
+            added = self.clustered(50)
+            for i, encoding in enumerate(added):
+                gallery.upsert(5000 + i, encoding)
+            probes = self.near(np.concatenate([self.encodings[100:300], added]))
+
+            matches = gallery.match_many(probes)
+            self.assertIs(gallery._index, index)
+            expected_rows, _ = self.brute_force(gallery, probes)
+            expected_ids = gallery.ids[expected_rows]
+            matched_ids = np.array([student_id for student_id, _ in matches])
+            self.assertGreaterEqual(np.mean(matched_ids == expected_ids), 0.95)
+
+
+class FakeEngine:
+    """Stands in for RecognitionEngine: hands every submitted batch to the test to complete."""
+
+    def __init__(self, workers=1):
+        self.workers = workers
+        self.batches = queue.Queue()
+
+    def submit(self, fn, frames):
+        future = Future()
+        self.batches.put((frames, future))
+        return future
+
+    def shutdown(self):
+        pass
+
+
+class RecognitionSchedulerTests(SimpleTestCase):
+    """Fair ordering, dropping and batching of the per-camera recognition scheduler."""
+
+    def make_scheduler(self, workers=1, **options):
+        options = {'queue_size': 2, 'deadline': 5.0, 'batch_size': 1, 'batch_window': 0, **options}
+        self.engine = FakeEngine(workers)
+        self.scheduler = RecognitionScheduler(self.engine, **options)
+        return self.scheduler
+
+    def submit_all(self, frames):
+        """Queues (camera, frame, weight) entries before the dispatcher can take any of them."""
+        with self.scheduler._condition:
+            return [self.scheduler.submit(camera, (frame,), weight) for camera, frame, weight in frames]
+
+    def next_batch(self):
+        return self.engine.batches.get(timeout=5)
+
+    @staticmethod
+    def complete(batch):
+        frames, future = batch
+        future.set_result([{'frame': args[0]} for args in frames])
+        return [args[0] for args in frames]
+
+    def serve(self, count):
+        """Completes the next `count` batches in dispatch order; returns the frames they held."""
+        served = []
+        for _ in range(count):
+            served += self.complete(self.next_batch())
+        return served
+
+    def test_round_robin_between_cameras(self):
+        self.make_scheduler()
+        futures = self.submit_all([('A', 'a1', 1), ('A', 'a2', 1), ('B', 'b1', 1), ('B', 'b2', 1)])
+        self.assertEqual(self.serve(4), ['a1', 'b1', 'a2', 'b2'])
+        self.assertEqual([future.result(timeout=5)['frame'] for future in futures], ['a1', 'a2', 'b1', 'b2'])
+        self.assertEqual(self.scheduler.stats()['A']['served'], 2)
+
+    def test_weighted_round_robin(self):
+        self.make_scheduler(queue_size=3)
+        self.submit_all([
+            ('A', 'a1', 2), ('A', 'a2', 2), ('A', 'a3', 2),
+            ('B', 'b1', 1), ('B', 'b2', 1), ('B', 'b3', 1),
+        ])
+        self.assertEqual(self.serve(6), ['a1', 'a2', 'b1', 'a3', 'b2', 'b3'])
+
+    def test_full_queue_drops_oldest_frame(self):
+        self.make_scheduler()
+        futures = self.submit_all([('A', 'a1', 1), ('A', 'a2', 1), ('A', 'a3', 1)])
+        with self.assertRaises(EngineBusy):
+            futures[0].result(timeout=5)
+        self.assertEqual(self.serve(2), ['a2', 'a3'])
+        self.assertEqual(self.scheduler.stats()['A']['dropped'], 1)
+
+    def test_stale_and_cancelled_frames_are_skipped(self):
+        self.make_scheduler(deadline=0.05)
+        with self.scheduler._condition:
+            stale = self.scheduler.submit('A', ('a1',))
+            time.sleep(0.1)
+            cancelled = self.scheduler.submit('B', ('b1',))
+            cancelled.cancel()
+            fresh = self.scheduler.submit('C', ('c1',))
+        self.assertEqual(self.serve(1), ['c1'])
+        with self.assertRaises(EngineBusy):
+            stale.result(timeout=5)
+        self.assertEqual(fresh.result(timeout=5), {'frame': 'c1'})
+        stats = self.scheduler.stats()
+        self.assertEqual((stats['A']['stale'], stats['A']['served']), (1, 0))
+        self.assertEqual(stats['C']['served'], 1)
+
+    def test_batches_spread_over_free_workers(self):
+        self.make_scheduler(workers=2, batch_size=4)
+        self.submit_all([(camera, camera.lower(), 1) for camera in 'ABCD'])
+        # Four waiting frames over two idle workers: two batches of two, not one of four
+        first, second = self.next_batch(), self.next_batch()
+        self.assertEqual((self.complete(first), self.complete(second)), (['a', 'b'], ['c', 'd']))
+
+
+def photos_zip(names):
+    """A ZIP upload holding a (not necessarily decodable) photo per file name."""
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for name in names:
+            archive.writestr(name, b'not really a jpeg')
+    return SimpleUploadedFile('photos.zip', buffer.getvalue(), content_type='application/zip')
+
+
+class BulkImportJobTests(TestCase):
+    """The admin upload is stored, imported in the background and polled."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.admin = User.objects.create_user('admin', password='pw', is_admin=True)
+        self.client.force_login(self.admin)
+
+    def upload(self, roster):
+        with mock.patch('core.views.import_jobs.enqueue') as enqueue, self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('bulk_import_students'), {
+                'roster': SimpleUploadedFile('roster.csv', roster.encode()),
+                'photos': photos_zip(['s1.jpg']),
+                'default_password': 'secret',
+            })
+        return response, enqueue
+
+    def test_upload_is_imported_in_the_background(self):
+        response, enqueue = self.upload(
+            "username,name,roll_no,department,course,session,semester\n"
+            "s1,Student One,S1,Nowhere,None,2024,First\n"
+        )
+        job = StudentImport.objects.get()
+        self.assertRedirects(response, reverse('bulk_import_status', args=[job.pk]))
+        enqueue.assert_called_once_with(job.pk, 'secret')
+        status = self.client.get(reverse('bulk_import_status', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual((status['status'], status['finished']), ('queued', False))
+
+        roster_path = job.roster.path
+        run_import_job(job.pk, 'secret', engine=RecognitionEngine(workers=0))
+        self.assertIsNone(run_import_job(job.pk, 'secret'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, StudentImport.DONE)
+        self.assertEqual([(r['username'], r['status']) for r in job.results], [('s1', 'invalid')])
+        self.assertFalse(os.path.exists(roster_path))
+        status = self.client.get(reverse('bulk_import_status', args=[job.pk]), {'format': 'json'}).json()
+        self.assertEqual((status['finished'], status['summary']), (True, {'invalid': 1}))
+
+    def test_broken_zip_is_rejected_in_the_request(self):
+        with mock.patch('core.views.import_jobs.enqueue') as enqueue:
+            self.client.post(reverse('bulk_import_students'), {
+                'roster': SimpleUploadedFile('roster.csv', b'username'),
+                'photos': SimpleUploadedFile('photos.zip', b'not a zip'),
+            })
+        enqueue.assert_not_called()
+        self.assertFalse(StudentImport.objects.exists())
+
+
+class RecognitionEngineMapTests(SimpleTestCase):
+    """map() runs background batches in order, inline when the pool is disabled."""
+
+    def test_inline_map(self):
+        engine = RecognitionEngine(workers=0)
+        self.assertEqual(engine.map(divmod, [7, 9], [2, 4]), [(3, 1), (2, 1)])
+
+
+class LatestFrameBufferTests(SimpleTestCase):
+    """The recognizer always gets the newest frame, and each frame only once."""
+
+    def test_keeps_only_the_newest_frame(self):
+        buffer = LatestFrameBuffer(size=2)
+        for frame in ('a', 'b', 'c'):
+            buffer.put(frame)
+        _, frame = buffer.get_latest(timeout=0)
+        self.assertEqual(frame, 'c')
+        self.assertEqual((buffer.received, buffer.dropped), (3, 2))
+        # Nothing is delivered twice
+        self.assertIsNone(buffer.get_latest(timeout=0.01))
+
+        buffer.put('d')
+        self.assertEqual(buffer.get_latest(timeout=0)[1], 'd')
+        self.assertEqual(buffer.dropped, 2)
+
+    def test_waits_for_a_frame(self):
+        buffer = LatestFrameBuffer()
+        threading.Timer(0.05, buffer.put, args=('late',)).start()
+        self.assertEqual(buffer.get_latest(timeout=5)[1], 'late')
+
+
+class FakeCapture:
+    """cv2.VideoCapture stand-in delivering a fixed list of frames, then failing."""
+
+    def __init__(self, frames, on_read=None):
+        self.frames = list(frames)
+        self.on_read = on_read
+        self.released = False
+
+    def read(self):
+        if self.on_read is not None:
+            self.on_read()
+        if not self.frames:
+            return False, None
+        return True, self.frames.pop(0)
+
+    def release(self):
+        self.released = True
+
+
+class CameraReaderTests(TransactionTestCase):
+    """The reader fills the buffer and reports the open camera through its heartbeat."""
+
+    def test_heartbeat_while_reading(self):
+        camera = Camera.objects.create(name='Entrance', location='Main gate', camera_type='usb')
+        stop = threading.Event()
+        seen = []
+
+        def on_read():
+            seen.append(Camera.objects.get(pk=camera.pk).ingest_heartbeat_at)
+            if len(seen) > 3:
+                stop.set()
+
+        capture = FakeCapture(['f1', 'f2', 'f3'], on_read)
+        buffer = LatestFrameBuffer(size=2)
+        reader = CameraReader(camera, buffer, stop, reconnect_delay=0)
+        with mock.patch('core.camera_ingest.open_capture', return_value=capture):
+            reader.run()
+
+        # No heartbeat before the first frame, then one while frames arrive
+        self.assertIsNone(seen[0])
+        self.assertIsNotNone(seen[1])
+        self.assertEqual(buffer.received, 3)
+        self.assertEqual(buffer.get_latest(timeout=0)[1], 'f3')
+        # The camera was released and the heartbeat cleared once frames stopped
+        self.assertTrue(capture.released)
+        self.assertFalse(reader.connected)
+        self.assertIsNone(Camera.objects.get(pk=camera.pk).ingest_heartbeat_at)
+
+
+class CameraHealthTests(SimpleTestCase):
+    """Web processes only probe on request; the schedule belongs to probe_cameras --watch."""
+
+    def test_requests_probe_once_and_stop(self):
+        prober = CameraHealthProber()
+        with mock.patch('core.camera_health.run_probes', return_value=[]) as run_probes:
+            prober.request(5)
+            prober.request(5)
+            thread = prober._thread
+            if thread is not None:
+                thread.join(5)
+        probed = set().union(*(call.args[0] for call in run_probes.call_args_list))
+        self.assertEqual(probed, {5})
+        self.assertIsNone(prober._thread)
+
+
+def jpeg_frame(width=64, height=48):
+    """JPEG bytes of a small blank camera frame."""
+    ok, data = cv2.imencode('.jpg', np.zeros((height, width, 3), dtype=np.uint8))
+    return data.tobytes()
+
+
+class SaveProbeResultsTests(TestCase):
+    """Probe results are stored on every camera; only active/offline cameras change status."""
+
+    reachable = {'ok': True, 'latency_ms': 120.0, 'fps': 25.0, 'error': ''}
+    unreachable = {'ok': False, 'latency_ms': None, 'fps': None, 'error': 'Camera could not be opened.'}
+
+    def make_camera(self, name, status):
+        return Camera.objects.create(name=name, location='Hall', camera_type='usb', status=status)
+
+    def save(self, cameras, results):
+        save_probe_results(cameras, {camera.id: result for camera, result in zip(cameras, results)})
+        return [Camera.objects.get(pk=camera.pk) for camera in cameras]
+
+    def test_status_follows_reachability(self):
+        offline, active = self.make_camera('A', 'offline'), self.make_camera('B', 'active')
+        offline, active = self.save([offline, active], [self.reachable, self.unreachable])
+        self.assertEqual((offline.status, active.status), ('active', 'offline'))
+        self.assertEqual((offline.probe_latency_ms, offline.probe_fps, offline.probe_error), (120.0, 25.0, ''))
+        self.assertEqual(active.probe_error, 'Camera could not be opened.')
+        self.assertIsNotNone(active.last_probe_at)
+
+    def test_admin_statuses_are_left_alone(self):
+        inactive, maintenance = self.make_camera('A', 'inactive'), self.make_camera('B', 'maintenance')
+        inactive, maintenance = self.save([inactive, maintenance], [self.reachable, self.unreachable])
+        self.assertEqual((inactive.status, maintenance.status), ('inactive', 'maintenance'))
+        # Probe results are still recorded
+        self.assertEqual(inactive.probe_fps, 25.0)
+        self.assertEqual(maintenance.probe_error, 'Camera could not be opened.')
+
+    def test_concurrent_admin_change_wins(self):
+        camera = self.make_camera('A', 'active')
+        # The admin puts the camera into maintenance while the probe runs
+        Camera.objects.filter(pk=camera.pk).update(status='maintenance')
+        saved, = self.save([camera], [self.unreachable])
+        self.assertEqual(saved.status, 'maintenance')
+        self.assertEqual(saved.probe_error, 'Camera could not be opened.')
+        # The caller's copy reports the status actually stored
+        self.assertEqual(camera.status, 'maintenance')
+
+    def test_unprobed_cameras_are_not_touched(self):
+        camera = self.make_camera('A', 'active')
+        save_probe_results([camera], {})
+        self.assertIsNone(Camera.objects.get(pk=camera.pk).last_probe_at)
+
+
+class DetectFacesTests(SimpleTestCase):
+    """Boxes found on the downscaled frame come back in full-resolution coordinates."""
+
+    def detect(self, frame_shape, detection_width, small_locations):
+        frame = np.zeros(frame_shape, dtype=np.uint8)
+        with mock.patch('core.face_pipeline.locate_faces', return_value=small_locations) as locate:
+            locations = detect_faces(frame, detection_width)
+        return locations, locate.call_args.args[0].shape
+
+    def test_boxes_are_rescaled(self):
+        locations, searched = self.detect((720, 1280, 3), 640, [(10, 100, 60, 40), (100, 300, 200, 250)])
+        self.assertEqual(searched, (360, 640, 3))
+        self.assertEqual(locations, [(20, 200, 120, 80), (200, 600, 400, 500)])
+
+    def test_uneven_scale_is_rounded(self):
+        locations, searched = self.detect((750, 1000, 3), 640, [(33, 101, 77, 51)])
+        self.assertEqual(searched, (480, 640, 3))
+        # 1000/640 = 750/480 = 1.5625
+        self.assertEqual(locations, [(52, 158, 120, 80)])
+
+    def test_boxes_are_clipped_to_the_frame(self):
+        locations, _ = self.detect((720, 1280, 3), 640, [(-2, 645, 365, -3)])
+        self.assertEqual(locations, [(0, 1280, 720, 0)])
+
+    def test_small_frames_are_not_scaled(self):
+        for frame_shape, detection_width in (((240, 320, 3), 640), ((720, 1280, 3), 0)):
+            locations, searched = self.detect(frame_shape, detection_width, [(1, 2, 3, 4)])
+            self.assertEqual(searched, frame_shape)
+            self.assertEqual(locations, [(1, 2, 3, 4)])
+
+
+class ReadFrameRequestTests(SimpleTestCase):
+    """Kiosk frames arrive as raw image bodies, multipart uploads or legacy base64 JSON."""
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.url = '/dashboard/recognize-face/'
+
+    def read(self, request):
+        return read_frame_request(request)
+
+    def test_raw_image_body(self):
+        request = self.factory.post(self.url + '?camera_id=3&multi_face=1', jpeg_frame(), content_type='image/jpeg')
+        frame, options, error = self.read(request)
+        self.assertIsNone(error)
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertEqual((options['camera_id'], options['multi_face']), ('3', '1'))
+
+    def test_multipart_upload(self):
+        upload = SimpleUploadedFile('frame.jpg', jpeg_frame(), content_type='image/jpeg')
+        frame, options, error = self.read(self.factory.post(self.url, {'image': upload, 'camera_id': '3'}))
+        self.assertIsNone(error)
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertEqual(options['camera_id'], '3')
+
+    def test_legacy_base64_json(self):
+        image_data = 'data:image/jpeg;base64,' + base64.b64encode(jpeg_frame()).decode()
+        request = self.factory.post(
+            self.url, json.dumps({'image_data': image_data, 'camera_id': 3}), content_type='application/json'
+        )
+        frame, options, error = self.read(request)
+        self.assertIsNone(error)
+        self.assertEqual(frame.shape, (48, 64, 3))
+        self.assertEqual(options['camera_id'], 3)
+
+    def test_malformed_bodies_are_rejected(self):
+        requests = [
+            self.factory.post(self.url, b'{not json', content_type='application/json'),
+            self.factory.post(self.url, json.dumps({'image_data': 'no comma'}), content_type='application/json'),
+            self.factory.post(self.url, json.dumps({'image_data': 'data:image/jpeg;base64,@@'}), content_type='application/json'),
+            self.factory.post(self.url, b'not an image', content_type='image/jpeg'),
+            self.factory.post(self.url, b'', content_type='image/jpeg'),
+            self.factory.post(self.url, {'camera_id': '3'}),
+        ]
+        for request in requests:
+            with self.subTest(body=request.body[:30]):
+                frame, _, error = self.read(request)
+                self.assertIsNone(frame)
+                self.assertEqual(error.status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AttendanceTestCase(TestCase):
+    """An attendance session (course and semester) with students, checked in at 09:00."""
+
+    def setUp(self):
+        caches['checkins'].clear()
+        department = Department.objects.create(name='Computer Science')
+        self.course = Course.objects.create(name='B.Tech', department=department)
+        self.other_course = Course.objects.create(name='M.Tech', department=department)
+        self.semester = Semester.objects.create(name='First')
+        self.session = Session.objects.create(year='2024-2025')
+        AttendanceSettings.get_instance()
+        self.now = timezone.make_aware(datetime.datetime(2026, 1, 5, 9, 0))
+        patcher = mock.patch('core.attendance.timezone.localtime', return_value=self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_student(self, username, course=None):
+        return User.objects.create_user(
+            username, password='pw', name=username.title(), roll_no=username.upper(),
+            is_student=True, authorized=True, department=self.course.department,
+            course=course or self.course, semester=self.semester, session=self.session,
+        )
+
+    def recognition_result(self, *student_ids):
+        """Engine result with one face per id (None for an unknown face)."""
+        return {
+            'locations': [(10, 60 + 60 * i, 50, 20 + 60 * i) for i in range(len(student_ids))],
+            'matches': [(student_id, 0.3 if student_id else None, True) for student_id in student_ids],
+            'track_ids': [None] * len(student_ids),
+            'encoded': list(range(len(student_ids))),
+            'encodings': random_encodings(len(student_ids)),
+            'gallery_size': 10,
+        }
+
+    def recognize_all(self, *student_ids):
+        result = self.recognition_result(*student_ids)
+        return recognize_all_faces(result['locations'], result['matches'], self.course.id, self.semester.id)
+
+
+class RecognizeAllFacesTests(AttendanceTestCase):
+    """Multi-face check-in marks every recognized student of a frame once."""
+
+    def test_two_known_faces(self):
+        alice, bob = self.make_student('alice'), self.make_student('bob')
+        payload = self.recognize_all(alice.id, bob.id)
+        self.assertEqual(payload['recognized_count'], 2)
+        self.assertEqual([face['user_id'] for face in payload['faces']], [alice.id, bob.id])
+        self.assertEqual({face['attendance_status'] for face in payload['faces']}, {'Marked Present'})
+        self.assertEqual(
+            set(AttendanceRecord.objects.values_list('student_id', 'status')),
+            {(alice.id, 'present'), (bob.id, 'present')},
+        )
+
+    def test_unknown_face_among_known(self):
+        alice = self.make_student('alice')
+        payload = self.recognize_all(None, alice.id)
+        self.assertEqual([face['status'] for face in payload['faces']], ['not_recognized', 'success'])
+        self.assertEqual(payload['faces'][0]['box'], {'top': 10, 'right': 60, 'bottom': 50, 'left': 20})
+        # Top-level fields mirror the recognized face for single-face clients
+        self.assertEqual((payload['status'], payload['user_id']), ('success', alice.id))
+        self.assertEqual(payload['recognized_count'], 1)
+
+    def test_same_student_twice_is_marked_once(self):
+        alice = self.make_student('alice')
+        payload = self.recognize_all(alice.id, alice.id)
+        self.assertEqual([face['status'] for face in payload['faces']], ['success', 'success'])
+        self.assertEqual(AttendanceRecord.objects.filter(student=alice).count(), 1)
+        # A later frame is answered from the check-in cache
+        with CaptureQueriesContext(connection) as queries:
+            again = self.recognize_all(alice.id)
+        self.assertFalse([query for query in queries if 'core_' in query['sql']])
+        self.assertEqual(again['attendance_status'], 'Already marked Present')
+
+    def test_student_of_another_course(self):
+        carol = self.make_student('carol', course=self.other_course)
+        payload = self.recognize_all(carol.id)
+        self.assertEqual(payload['status'], 'session_mismatch')
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+    def test_multi_face_response_from_the_kiosk_endpoint(self):
+        alice, bob = self.make_student('alice'), self.make_student('bob')
+        admin = User.objects.create_user('admin', password='pw', is_admin=True)
+        self.client.force_login(admin)
+        self.client.get(reverse('face_attendance'), {'course_id': self.course.id, 'semester_id': self.semester.id})
+
+        with mock.patch('core.views.get_scheduler') as get_scheduler:
+            get_scheduler.return_value.recognize.return_value = self.recognition_result(alice.id, None, bob.id)
+            response = self.client.post(
+                reverse('recognize_face') + '?multi_face=1', jpeg_frame(), content_type='image/jpeg'
+            )
+        self.assertEqual(response.status_code, 200)
+        payload = response.json()
+        self.assertEqual(payload['recognized_count'], 2)
+        self.assertEqual(len(payload['faces']), 3)
+        self.assertEqual(set(payload['faces'][1]), {'box', 'distance', 'status', 'message'})
+        self.assertEqual(
+            set(payload['faces'][0]), {'box', 'distance', 'status', 'name', 'user_id', 'attendance_status'}
+        )
+        self.assertEqual((payload['status'], payload['user_id']), ('success', alice.id))
+
+
+class GalleryTestCase(TestCase):
+    """Runs against a private, empty process gallery (the shared gallery file is not written)."""
+
+    def setUp(self):
+        self.gallery = FaceGallery()
+        for name, value in (('_gallery', self.gallery), ('_gallery_loaded', True), ('_last_sync', time.monotonic())):
+            patcher = mock.patch.object(face_gallery, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('core.face_gallery._write_shared_gallery', side_effect=lambda gallery: gallery)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.encodings = random_encodings(4, seed=3)
+
+    def make_student(self, username, encoding, **fields):
+        fields = {'is_student': True, 'authorized': True, **fields}
+        return User.objects.create_user(username, password='pw', face_encoding=pack_encoding(encoding), **fields)
+
+    def changes(self, student):
+        return FaceGalleryChange.objects.filter(student_id=student.id).count()
+
+
+class GallerySignalTests(GalleryTestCase):
+    """User and FaceEncoding saves update the gallery and the change log only when rows change."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student = self.make_student('alice', self.encodings[0])
+
+    def test_new_student_is_published(self):
+        self.assertIn(self.student.id, self.gallery)
+        self.assertEqual(self.changes(self.student), 1)
+
+    def test_saves_that_keep_the_row_publish_nothing(self):
+        self.student.contact = '555-0100'
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.student.save(update_fields=['contact'])
+            self.student.save()
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.changes(self.student), 1)
+
+    def test_save_of_a_gallery_field_replaces_the_row(self):
+        self.student.set_encoding(self.encodings[1])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.save(update_fields=['face_encoding'])
+        rows, _, _ = self.gallery.get_rows(self.student.id)
+        np.testing.assert_array_equal(rows[0], self.encodings[1])
+        self.assertEqual(self.changes(self.student), 2)
+
+    def test_published_only_on_commit(self):
+        self.student.authorized = False
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.student.save()
+                    raise RuntimeError("rolled back")
+            except RuntimeError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertIn(self.student.id, self.gallery)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.student.save()
+        self.assertIn(self.student.id, self.gallery)
+        self.assertEqual(self.changes(self.student), 1)
+        for callback in callbacks:
+            callback()
+        self.assertNotIn(self.student.id, self.gallery)
+        self.assertEqual(self.changes(self.student), 2)
+
+    def test_deactivating_removes_all_rows(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            FaceEncoding.add(self.student, self.encodings[1])
+        self.assertEqual(len(self.gallery), 2)
+
+        self.student.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student.save()
+        self.assertNotIn(self.student.id, self.gallery)
+        self.assertEqual(len(self.gallery), 0)
+        self.assertEqual(self.changes(self.student), 3)
+
+
+class FaceEncodingCapTests(GalleryTestCase):
+    """FaceEncoding.add keeps at most max_per_student extra encodings per student."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student = self.make_student('alice', self.encodings[0])
+        self.samples = random_encodings(8, seed=11)
+
+    def add(self, index, source):
+        with self.captureOnCommitCallbacks(execute=True):
+            return FaceEncoding.add(self.student, self.samples[index], source=source, max_per_student=3)
+
+    def stored(self):
+        return list(FaceEncoding.objects.filter(student=self.student).values_list('source', 'id'))
+
+    def test_oldest_samples_are_evicted(self):
+        first, second, kiosk = self.add(0, 'enrollment'), self.add(1, 'enrollment'), self.add(2, 'kiosk')
+        changes = self.changes(self.student)
+
+        # Kiosk captures make room first, enrollment photos only for enrollment photos
+        newer_kiosk = self.add(3, 'kiosk')
+        self.assertEqual(self.stored(), [('enrollment', first.id), ('enrollment', second.id), ('kiosk', newer_kiosk.id)])
+        third = self.add(4, 'enrollment')
+        self.assertEqual(self.stored(), [('enrollment', first.id), ('enrollment', second.id), ('enrollment', third.id)])
+        fourth = self.add(5, 'enrollment')
+        self.assertEqual(self.stored(), [('enrollment', second.id), ('enrollment', third.id), ('enrollment', fourth.id)])
+        # A kiosk capture never displaces enrollment photos
+        self.assertIsNone(self.add(6, 'kiosk'))
+        self.assertEqual(len(self.stored()), 3)
+        self.assertFalse(FaceEncoding.objects.filter(pk=kiosk.pk).exists())
+
+        # One logged change per stored and per evicted encoding
+        self.assertEqual(self.changes(self.student), changes + 2 + 2 + 2 + 2)
+        rows, _, _ = self.gallery.get_rows(self.student.id)
+        self.assertEqual(set(rows), {0, second.id, third.id, fourth.id})
+
+
+class GalleryEnrichmentTests(GalleryTestCase):
+    """Confident kiosk faces become extra encodings only when they add something."""
+
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.student = self.make_student('alice', self.encodings[0])
+        self.samples = random_encodings(4, seed=21)
+
+    def store(self, encoding, **options):
+        with self.captureOnCommitCallbacks(execute=True):
+            return store_sample(self.student.id, encoding, **options)
+
+    def kiosk_samples(self):
+        return list(FaceEncoding.objects.filter(student=self.student, source='kiosk').values_list('id', flat=True))
+
+    def test_is_diverse(self):
+        self.assertTrue(is_diverse(self.samples[0], []))
+        self.assertFalse(is_diverse(self.samples[0] + 0.005, self.samples[:2], min_distance=0.15))
+        self.assertTrue(is_diverse(self.samples[3], self.samples[:2], min_distance=0.15))
+
+    def test_near_duplicate_is_rejected(self):
+        self.assertEqual(self.store(self.encodings[0] + 0.005), 'similar')
+        self.assertEqual(self.kiosk_samples(), [])
+
+    def test_distinct_sample_is_stored(self):
+        self.assertEqual(self.store(self.samples[0]), 'stored')
+        self.assertEqual(len(self.kiosk_samples()), 1)
+        self.assertEqual(len(self.gallery.get_rows(self.student.id)[0]), 2)
+
+    def test_rolling_window_replaces_the_oldest_sample(self):
+        for sample in self.samples[:2]:
+            self.assertEqual(self.store(sample, max_samples=2), 'stored')
+        oldest, newer = self.kiosk_samples()
+        self.assertEqual(self.store(self.samples[2], max_samples=2), 'stored')
+        kept = self.kiosk_samples()
+        self.assertEqual(len(kept), 2)
+        self.assertNotIn(oldest, kept)
+        self.assertIn(newer, kept)
+
+    def test_offers_while_disabled_do_nothing(self):
+        result = {
+            'matches': [(self.student.id, 0.1, True)], 'encoded': [0], 'encodings': self.samples[:1],
+        }
+        with mock.patch('core.gallery_enrichment.threading.Thread') as thread:
+            self.assertEqual(GalleryEnricher(enabled=False).offer(result), 0)
+            thread.assert_not_called()
+
+            enricher = GalleryEnricher(enabled=True, interval=3600)
+            self.assertEqual(enricher.offer(result), 1)
+            # Sampled at most once per interval
+            self.assertEqual(enricher.offer(result), 0)
+            self.assertEqual(thread.call_count, 1)
+
+
+class EncodingJobTests(TransactionTestCase):
+    """Queued re-encodes run on the background engine and write the result back."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.enterContext(mock.patch.object(face_gallery, '_gallery', FaceGallery()))
+        self.enterContext(mock.patch.object(face_gallery, '_gallery_loaded', True))
+        self.enterContext(mock.patch('core.face_gallery._write_shared_gallery', side_effect=lambda gallery: gallery))
+        self.engine = RecognitionEngine(workers=0)
+        self.enterContext(mock.patch('core.encoding_jobs.get_background_engine', return_value=self.engine))
+
+    def test_dispatcher_writes_encoding_and_hash(self):
+        from .face_pipeline import photo_hash
+
+        photo = jpeg_frame()
+        student = User.objects.create_user(
+            'alice', password='pw', is_student=True, authorized=True,
+            profile_image=SimpleUploadedFile('alice.jpg', photo, content_type='image/jpeg'),
+        )
+        encoding = random_encodings(1)[0]
+        jobs = EncodingJobQueue(retry_delay=0)
+        with mock.patch('core.encoding_cache.encode_photo_cached', return_value=(None, encoding, (1, 2, 3, 4))) as encode:
+            jobs.enqueue(student.id)
+            jobs.enqueue(student.id)
+            jobs.join()
+
+        encode.assert_called_once_with(photo, use_cnn=True)
+        student.refresh_from_db()
+        np.testing.assert_array_equal(student.get_encoding(), encoding)
+        self.assertEqual(student.face_image_hash, photo_hash(photo))
+        self.assertIn(student.id, face_gallery._gallery)
+
+    def test_busy_engine_is_retried(self):
+        jobs = EncodingJobQueue(retry_delay=0)
+        with mock.patch.object(self.engine, 'run', side_effect=[EngineBusy("full"), 'missing']) as run:
+            jobs.enqueue(12345)
+            jobs.join()
+        self.assertEqual(run.call_count, 2)
+
+
+class GallerySyncTests(GalleryTestCase):
+    """sync_gallery replays changes logged by other worker processes."""
+
+    def test_changes_from_another_process_are_replayed(self):
+        # Saved and logged elsewhere: this process's on_commit callbacks never run
+        alice = self.make_student('alice', self.encodings[0])
+        bob = self.make_student('bob', self.encodings[1])
+        pending = self.make_student('carol', self.encodings[2], authorized=False)
+        for student in (alice, bob, pending):
+            FaceGalleryChange.record(student.id)
+
+        gallery = sync_gallery(force=True)
+        self.assertEqual(set(gallery.ids), {alice.id, bob.id})
+        self.assertEqual(gallery.generation, FaceGalleryChange.latest_generation())
+
+        User.objects.filter(pk=bob.pk).update(authorized=False)
+        FaceGalleryChange.record(bob.id)
+        self.assertEqual(set(sync_gallery(force=True).ids), {alice.id})
+        # Nothing new to replay
+        with self.assertNumQueries(1):
+            sync_gallery(force=True)
+
+
+class BulkImportCheckTests(GalleryTestCase):
+    """Duplicate faces and roster problems are reported per row before anyone is created."""
+
+    def make_roster_lookups(self):
+        department = Department.objects.create(name='CS')
+        Course.objects.create(name='B.Tech', department=department)
+        Session.objects.create(year='2024')
+        Semester.objects.create(name='First')
+
+    def test_duplicate_of_an_enrolled_student(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            alice = self.make_student('alice', self.encodings[0])
+        conflicts = find_duplicate_faces(self.encodings[[1, 0]] + 0.001, tolerance=0.4)
+        self.assertIsNone(conflicts[0])
+        self.assertEqual(conflicts[1][:2], ('enrolled', alice.id))
+
+    def test_duplicate_of_a_pending_student(self):
+        pending = self.make_student('bob', self.encodings[2], authorized=False)
+        self.assertNotIn(pending.id, self.gallery)
+        conflicts = find_duplicate_faces(self.encodings[[2]], tolerance=0.4)
+        self.assertEqual(conflicts[0][:2], ('enrolled', pending.id))
+        self.assertAlmostEqual(conflicts[0][2], 0.0, places=3)
+
+    def test_duplicates_within_the_batch(self):
+        batch = self.encodings[[0, 1, 0, 3]]
+        conflicts = find_duplicate_faces(batch, tolerance=0.4)
+        # The later row is the duplicate; no face is flagged against itself
+        self.assertEqual([conflict and conflict[:2] for conflict in conflicts], [None, None, ('batch', 0), None])
+        self.assertEqual(find_duplicate_faces(self.encodings[:1], tolerance=0.4), [None])
+        self.assertEqual(find_duplicate_faces(np.empty((0, 128), dtype=np.float32), tolerance=0.4), [])
+
+    def test_roster_roll_number_problems(self):
+        self.make_roster_lookups()
+        self.make_student('taken', self.encodings[3], roll_no='R9')
+        roster = (
+            "username,name,roll_no,department,course,session,semester\n"
+            "s1,One,R1,CS,B.Tech,2024,First\n"
+            "s2,Two,,CS,B.Tech,2024,First\n"
+            "s3,Three,R1,CS,B.Tech,2024,First\n"
+            "s4,Four,R9,CS,B.Tech,2024,First\n"
+        )
+        prepared = (self.encodings[0], None, 'password-hash', 'photo-hash')
+        with mock.patch('core.bulk_import.prepare_student', return_value=prepared) as prepare:
+            results = import_students(
+                io.BytesIO(roster.encode()), 'roster.csv', photos_zip(['r1.jpg', 'r2.jpg', 's3.jpg', 'r9.jpg']),
+                default_password='pw', dry_run=True, workers=1,
+            )
+        self.assertEqual(prepare.call_count, 1)
+        self.assertEqual([(r['row'], r['status']) for r in results], [(2, WOULD_CREATE), (3, INVALID), (4, INVALID), (5, INVALID)])
+        self.assertEqual(results[1]['message'], 'Missing roll_no.')
+        self.assertIn('Roll Number already exists', results[2]['message'])
+        self.assertIn('Roll Number already exists', results[3]['message'])
+
+    def test_same_face_twice_in_a_roster(self):
+        self.make_roster_lookups()
+        roster = (
+            "username,name,roll_no,department,course,session,semester\n"
+            "s1,One,R1,CS,B.Tech,2024,First\n"
+            "s2,Two,R2,CS,B.Tech,2024,First\n"
+        )
+        prepared = (self.encodings[0], None, 'password-hash', 'photo-hash')
+        with mock.patch('core.bulk_import.prepare_student', return_value=prepared):
+            results = import_students(
+                io.BytesIO(roster.encode()), 'roster.csv', photos_zip(['r1.jpg', 'r2.jpg']),
+                default_password='pw', dry_run=True, workers=1,
+            )
+        self.assertEqual([r['status'] for r in results], [WOULD_CREATE, DUPLICATE])
+        self.assertIn('roster line 2', results[1]['message'])
+
+
+class AsyncRecognitionApiTests(AttendanceTestCase):
+    """The ASGI kiosk endpoints check students in and out like the sync ones."""
+
+    def setUp(self):
+        super().setUp()
+        self.alice = self.make_student('alice')
+        self.admin = User.objects.create_user('admin', password='pw', is_admin=True)
+        self.async_client.force_login(self.admin)
+        session = self.async_client.session
+        session['selected_course_id'] = self.course.id
+        session['selected_semester_id'] = self.semester.id
+        session.save()
+
+        scheduler = mock.patch('core.views.get_scheduler')
+        self.scheduler = scheduler.start().return_value
+        self.addCleanup(scheduler.stop)
+        self.scheduler.arecognize = mock.AsyncMock(return_value=self.recognition_result(self.alice.id))
+        # Every test frame is processed (no frame rate limit or unchanged-scene replay)
+        gate = mock.patch('core.views.frame_gate')
+        gate.start().check.return_value = (None, None)
+        self.addCleanup(gate.stop)
+
+    async def post_frame(self, url_name, client=None):
+        client = client or self.async_client
+        response = await client.post(reverse(url_name), jpeg_frame(), content_type='image/jpeg')
+        return response.status_code, response.json() if response.status_code == 200 else None
+
+    async def test_check_in_is_idempotent(self):
+        status, payload = await self.post_frame('recognize_face_async')
+        self.assertEqual(status, 200)
+        self.assertEqual((payload['status'], payload['attendance_status']), ('success', 'Marked Present'))
+
+        # Answered from the check-in cache
+        _, payload = await self.post_frame('recognize_face_async')
+        self.assertEqual(payload['attendance_status'], 'Already marked Present')
+        # And through aget_or_create once the cache is empty
+        await caches['checkins'].aclear()
+        _, payload = await self.post_frame('recognize_face_async')
+        self.assertEqual(payload['attendance_status'], 'Already marked Present')
+
+        self.assertEqual(await AttendanceRecord.objects.filter(student_id=self.alice.id).acount(), 1)
+        record = await AttendanceRecord.objects.aget(student_id=self.alice.id)
+        self.assertEqual((record.status, record.check_in_time), ('present', self.now.time()))
+
+    async def test_check_out(self):
+        status, payload = await self.post_frame('checkout_student_async')
+        self.assertEqual(payload['message'], 'No check-in record found for today.')
+
+        await self.post_frame('recognize_face_async')
+        status, payload = await self.post_frame('checkout_student_async')
+        self.assertEqual((status, payload['status']), (200, 'success'))
+        record = await AttendanceRecord.objects.aget(student_id=self.alice.id)
+        self.assertEqual(record.check_out_time, self.now.time())
+
+        _, payload = await self.post_frame('checkout_student_async')
+        self.assertEqual(payload['status'], 'already_checked_out')
+
+    async def test_only_admins_get_in(self):
+        anonymous = AsyncClient()
+        self.assertEqual((await self.post_frame('recognize_face_async', anonymous))[0], 302)
+
+        student_client = AsyncClient()
+        await sync_to_async(student_client.force_login)(self.alice)
+        for url_name in ('recognize_face_async', 'checkout_student_async'):
+            self.assertEqual((await self.post_frame(url_name, student_client))[0], 302)
+
+        response = await self.async_client.get(reverse('recognize_face_async'))
+        self.assertEqual(response.status_code, 405)
+        self.scheduler.arecognize.assert_not_called()
+        self.assertFalse(await AttendanceRecord.objects.aexists())
+
+
+@unittest.skipUnless(HAS_FACE_RECOGNITION, "face_recognition is not installed")
+class EncodeFacesBatchTests(SimpleTestCase):
+    """The batched encoder must produce the same vectors as the per-frame one."""
+
+    def test_batched_encodings_match_unbatched(self):
+        from .face_pipeline import encode_faces, encode_faces_batch
+
+        rng = np.random.default_rng(0)
+        frames = [
+            (rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), [(40, 200, 180, 60)]),
+            (rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), []),
+            (rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), [(20, 150, 140, 30), (60, 300, 200, 170)]),
+        ]
+        batched = encode_faces_batch(frames)
+        self.assertEqual([len(encodings) for encodings in batched], [1, 0, 2])
+        for (rgb_frame, face_locations), batch_encodings in zip(frames, batched):
+            for single, batch in zip(encode_faces(rgb_frame, face_locations), batch_encodings):
+                np.testing.assert_allclose(batch, single, atol=1e-6)
@@ -17,6 +17,8 @@ urlpatterns = [
 
     # Student Management
     path('dashboard/register/', views.register_student, name='register_student'),
+    path('dashboard/students/import/', views.bulk_import_students_view, name='bulk_import_students'),
+    path('dashboard/students/import/<int:job_id>/', views.bulk_import_status_view, name='bulk_import_status'),
     path('dashboard/students/', views.manage_students_view, name='manage_students'),
     path('dashboard/students/edit/<int:user_id>/', views.edit_student_view, name='edit_student'),
     path('dashboard/authorize-student/<int:user_id>/', views.authorize_student, name='authorize_student'),
@@ -53,6 +55,9 @@ urlpatterns = [
     path('dashboard/face-attendance/', views.face_attendance_view, name='face_attendance'), 
     path('dashboard/recognize-face/', views.recognize_face_view, name='recognize_face'), # API endpoint
     path('dashboard/checkout-student/', views.checkout_student_view, name='checkout_student'), # Checkout API endpoint
+    path('dashboard/recognize-face/async/', views.recognize_face_async_view, name='recognize_face_async'), # ASGI endpoint
+    path('dashboard/checkout-student/async/', views.checkout_student_async_view, name='checkout_student_async'), # ASGI endpoint
+    path('dashboard/recognition-stats/', views.recognition_stats_view, name='recognition_stats'), # Per-camera queue stats (JSON)
 
     # Other Management
     path('dashboard/cameras/', views.manage_cameras_view, name='manage_cameras'),
@@ -3,27 +3,47 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth import authenticate, login, logout
 from django.core.mail import send_mail
 from django.conf import settings
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse # Added JsonResponse
+from django.http import HttpResponse, HttpResponseNotAllowed, HttpResponseRedirect, JsonResponse # Added JsonResponse
+from django.contrib.auth.views import redirect_to_login
+from asgiref.sync import sync_to_async
 from django.urls import reverse
 from django.utils import timezone
 from django.contrib import messages # Import messages framework
+from django.db import transaction
 from django.db.models import Q, Case, When, IntegerField # Add Case and When for ordering
 from django.db.models.functions import Substr, Cast, Right
 # Make sure all necessary models are imported
 from .models import (
     User, AttendanceRecord, Camera, Department, Course, 
-    Session, Semester, LeaveRequest, AttendanceSettings
+    Session, Semester, LeaveRequest, AttendanceSettings, StudentImport
 )
 from datetime import datetime
 import os # For potential file handling if needed later
 # --- Imports for Face Recognition ---
-import face_recognition
 import cv2 # OpenCV for image processing
 import numpy as np
 import base64
+import functools
 import json
+import zipfile
 from django.views.decorators.csrf import csrf_exempt # Temporarily for testing API, consider proper CSRF later
 from django.views.decorators.http import require_POST
+from .face_pipeline import get_detection_width, get_recognition_fps, photo_hash
+from .frame_gate import frame_gate, gated_http_response
+from .checkin_cache import recent_checkins
+from .attendance import (
+    amark_check_in, aremember_check_in, is_in_selected_session, mark_check_in,
+    recognize_all_faces, remember_check_in, session_mismatch_payload
+)
+from .face_tracker import face_tracker
+from .face_gallery import duplicate_candidates
+from .bulk_import import import_jobs, summarize
+from .encoding_cache import cached_photo_encoding, encode_photo_cached
+from .recognition_engine import EngineBusy
+from .recognition_scheduler import camera_schedule, get_scheduler
+from .encoding_jobs import encoding_jobs
+from .gallery_enrichment import gallery_enricher
+from .camera_health import camera_prober
 # --- End Face Recognition Imports ---
 
 
@@ -49,6 +69,20 @@ def get_student_form_context(request):
         "semesters": Semester.objects.all().order_by('name'),
     }
 
+def duplicate_face_message(duplicates):
+    """Admin-facing error listing the enrolled students a new face photo matches, nearest first."""
+    students = User.objects.in_bulk([student_id for student_id, _ in duplicates])
+    described = [
+        f"'{students[student_id].name}' (Roll No: {students[student_id].roll_no}, distance {distance:.2f})"
+        for student_id, distance in duplicates if student_id in students
+    ]
+    if not described:
+        return "This face image matches an already registered student. Please use a different image."
+    message = f"This face image is already registered to student {described[0]}. Please use a different image."
+    if len(described) > 1:
+        message += " Other close matches: " + ", ".join(described[1:]) + "."
+    return message
+
 # -----------------------
 # General views
 # -----------------------
@@ -254,71 +288,24 @@ def register_student(request):
 
             # Check for duplicate faces before saving
             try:
-                import face_recognition
-                import numpy as np
-                from PIL import Image, ImageOps
-
-                # Load and process the image for face detection
-                pil_image = Image.open(user.profile_image.path)
-                pil_image = ImageOps.exif_transpose(pil_image)
-
-                if pil_image.mode != 'RGB':
-                    pil_image = pil_image.convert("RGB")
-
-                # Convert to numpy array for face_recognition
-                image_array = np.array(pil_image)
-
-                # --- Image Preprocessing for Better Face Recognition ---
-                # Convert to grayscale for preprocessing
-                gray = cv2.cvtColor(image_array, cv2.COLOR_RGB2GRAY)
-
-                # Apply histogram equalization to improve contrast
-                gray = cv2.equalizeHist(gray)
-
-                # Apply Gaussian blur to reduce noise
-                gray = cv2.GaussianBlur(gray, (3, 3), 0)
-
-                # Convert back to RGB
-                image_array = cv2.cvtColor(gray, cv2.COLOR_GRAY2RGB)
-
-                # Detect faces
-                face_locations = face_recognition.face_locations(image_array, model="hog")
-                if not face_locations:
-                    # Try CNN model if HOG fails
-                    face_locations = face_recognition.face_locations(image_array, model="cnn")
-
-                if face_locations:
-                    # Generate encoding for the new image
-                    new_encodings = face_recognition.face_encodings(image_array, face_locations)
-                    if new_encodings:
-                        new_encoding = new_encodings[0]
-
-                        # Compare with existing student encodings
-                        existing_students = User.objects.filter(
-                            is_student=True,
-                            face_encoding__isnull=False
-                        ).exclude(face_encoding='')
-
-                        duplicate_found = False
-                        for existing_student in existing_students:
-                            existing_encoding = existing_student.get_encoding()
-                            if existing_encoding is not None:
-                                # Compare faces with tolerance
-                                matches = face_recognition.compare_faces([existing_encoding], new_encoding, tolerance=0.4)
-                                if matches[0]:
-                                    duplicate_found = True
-                                    messages.error(request, f"This face image is already registered to student '{existing_student.name}' (Roll No: {existing_student.roll_no}). Please use a different image.")
-                                    # Delete the created user since registration failed
-                                    user.delete()
-                                    return render(request, "core/add_edit_student.html", form_context)
-
-                        if not duplicate_found:
-                            # Save the encoding for the new student
-                            user.set_encoding(new_encoding)
-                    else:
-                        messages.error(request, "Could not generate face encoding from the uploaded image. Please ensure the image shows a clear face.")
+                # Encode the photo the same way generate_encodings does; a photo
+                # that was encoded before comes straight from the encoding cache
+                user.profile_image.seek(0)
+                image_data = user.profile_image.read()
+                _, new_encoding, _ = encode_photo_cached(image_data, use_cnn=True)
+
+                if new_encoding is not None:
+                    # Compare with every enrolled face in one vectorized distance query
+                    duplicates = duplicate_candidates(new_encoding, exclude_ids=[user.id])
+                    if duplicates:
+                        messages.error(request, duplicate_face_message(duplicates))
+                        # Delete the created user since registration failed
                         user.delete()
                         return render(request, "core/add_edit_student.html", form_context)
+
+                    # Save the encoding for the new student
+                    user.set_encoding(new_encoding)
+                    user.face_image_hash = photo_hash(image_data)
                 else:
                     messages.error(request, "No face detected in the uploaded image. Please upload a clear photo of your face.")
                     user.delete()
@@ -348,6 +335,76 @@ def register_student(request):
     return render(request, "core/add_edit_student.html", form_context)
 
 
+@login_required
+@user_passes_test(is_admin)
+def bulk_import_students_view(request):
+    """
+    Admin registers many students at once from a roster file and a ZIP of photos.
+    The upload is imported in the background; the status page shows the results.
+    """
+    context = {}
+
+    if request.method == "POST":
+        roster = request.FILES.get("roster")
+        photos = request.FILES.get("photos")
+        default_password = request.POST.get("default_password") or None
+        context['posted_data'] = request.POST
+
+        if not roster or not photos:
+            messages.error(request, "Please upload both the roster (CSV/XLSX) and the photos ZIP.")
+            return render(request, "core/bulk_import_students.html", context)
+        if not roster.name.lower().endswith(('.csv', '.xlsx', '.xlsm')):
+            messages.error(request, "The roster must be a CSV or XLSX file.")
+            return render(request, "core/bulk_import_students.html", context)
+        if not zipfile.is_zipfile(photos):
+            messages.error(request, "The photos file is not a valid ZIP archive.")
+            return render(request, "core/bulk_import_students.html", context)
+        photos.seek(0)
+
+        job = StudentImport.objects.create(
+            created_by=request.user,
+            roster=roster,
+            photos=photos,
+            authorize=request.POST.get("authorize") == 'on',
+            dry_run=request.POST.get("dry_run") == 'on',
+        )
+        transaction.on_commit(lambda: import_jobs.enqueue(job.pk, default_password))
+        return redirect('bulk_import_status', job_id=job.pk)
+
+    return render(request, "core/bulk_import_students.html", context)
+
+
+@login_required
+@user_passes_test(is_admin)
+def bulk_import_status_view(request, job_id):
+    """Progress and results of a background student import; ?format=json is polled by the page."""
+    job = get_object_or_404(StudentImport, pk=job_id)
+    summary = summarize(job.results)
+
+    if request.GET.get('format') == 'json':
+        return JsonResponse({
+            'status': job.status,
+            'finished': job.finished,
+            'message': job.message,
+            'summary': summary,
+        })
+
+    context = {
+        'job': job,
+        'results': job.results,
+        'summary': summary,
+        'dry_run': job.dry_run,
+    }
+    if job.status == StudentImport.FAILED:
+        messages.error(request, job.message)
+    elif job.status == StudentImport.DONE:
+        if job.dry_run:
+            messages.info(request, f"Dry run: {summary.get('would_create', 0)} of {len(job.results)} students ready to import.")
+        else:
+            messages.success(request, f"Imported {summary.get('created', 0)} of {len(job.results)} students.")
+    return render(request, "core/bulk_import_students.html", context)
+
+
 @login_required
 @user_passes_test(is_admin)
 def manage_students_view(request):
@@ -488,6 +545,21 @@ def edit_student_view(request, user_id):
             student.profile_image.save(filename, ContentFile(decoded_image), save=True)
         elif profile_image:
             student.profile_image = profile_image
+
+        # A new photo that was encoded before gets its encoding from the cache right away
+        image_changed = bool(profile_image or (profile_image_data and profile_image_data.startswith('data:image')))
+        encoding_updated = False
+        if image_changed:
+            try:
+                student.profile_image.seek(0)
+                image_data = student.profile_image.read()
+                cached = cached_photo_encoding(image_data, use_cnn=True)
+                if cached is not None and cached[1] is not None:
+                    student.set_encoding(cached[1])
+                    student.face_image_hash = photo_hash(image_data)
+                    encoding_updated = True
+            except Exception as e:
+                print(f"[Encoding Cache] Could not check cache for {student.username}: {e}")
         
         # Handle password change only if provided
         if password:
@@ -501,7 +573,18 @@ def edit_student_view(request, user_id):
              student.semester = get_object_or_404(Semester, pk=request.POST.get("semester"))
              
              student.save()
-             messages.success(request, f"Student '{student.name}' updated successfully. Remember to re-run encoding command if image changed.")
+             # Extra photos under other lighting/angles become additional FaceEncodings
+             extra_photos = [f.read() for f in request.FILES.getlist('additional_images')]
+             for data in extra_photos:
+                 transaction.on_commit(lambda data=data: encoding_jobs.enqueue_photo(student.id, data))
+             if image_changed and not encoding_updated:
+                 # New photo: encode it in the background instead of blocking this request on dlib
+                 transaction.on_commit(lambda: encoding_jobs.enqueue(student.id))
+                 messages.success(request, f"Student '{student.name}' updated successfully. The face encoding is being updated in the background.")
+             elif extra_photos:
+                 messages.success(request, f"Student '{student.name}' updated successfully. {len(extra_photos)} additional photo(s) are being encoded in the background.")
+             else:
+                 messages.success(request, f"Student '{student.name}' updated successfully.")
              return redirect('manage_students')
         except Exception as e:
             messages.error(request, f"An error occurred during update: {e}")
@@ -1151,6 +1234,7 @@ Administration Team"""
 @user_passes_test(is_admin)
 def manage_cameras_view(request):
     """Displays list of cameras with enhanced management features."""
+    # Status and probe columns come from `probe_cameras --watch`
     cameras = Camera.objects.all().order_by('name')
 
     # Get filter parameters
@@ -1192,6 +1276,9 @@ def add_camera_view(request):
         resolution_width = request.POST.get('resolution_width', '640')
         resolution_height = request.POST.get('resolution_height', '480')
         fps = request.POST.get('fps', '30')
+        detection_width = request.POST.get('detection_width', '320')
+        recognition_fps = request.POST.get('recognition_fps', '2')
+        recognition_weight = request.POST.get('recognition_weight', '1')
 
         # Validation
         if not name or not location:
@@ -1211,6 +1298,9 @@ def add_camera_view(request):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1231,6 +1321,9 @@ def add_camera_view(request):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1253,6 +1346,9 @@ def add_camera_view(request):
                         'resolution_width': resolution_width,
                         'resolution_height': resolution_height,
                         'fps': fps,
+                        'detection_width': detection_width,
+                        'recognition_fps': recognition_fps,
+                        'recognition_weight': recognition_weight,
                     }
                 })
             if not stream_url:
@@ -1272,6 +1368,9 @@ def add_camera_view(request):
                         'resolution_width': resolution_width,
                         'resolution_height': resolution_height,
                         'fps': fps,
+                        'detection_width': detection_width,
+                        'recognition_fps': recognition_fps,
+                        'recognition_weight': recognition_weight,
                     }
                 })
 
@@ -1283,6 +1382,9 @@ def add_camera_view(request):
             resolution_width = int(resolution_width)
             resolution_height = int(resolution_height)
             fps = int(fps)
+            detection_width = int(detection_width)
+            recognition_fps = float(recognition_fps)
+            recognition_weight = max(1, int(recognition_weight))
 
             camera = Camera.objects.create(
                 name=name,
@@ -1297,6 +1399,9 @@ def add_camera_view(request):
                 resolution_width=resolution_width,
                 resolution_height=resolution_height,
                 fps=fps,
+                detection_width=detection_width,
+                recognition_fps=recognition_fps,
+                recognition_weight=recognition_weight,
             )
 
             messages.success(request, f"Camera '{name}' added successfully.")
@@ -1319,6 +1424,9 @@ def add_camera_view(request):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
         except Exception as e:
@@ -1338,6 +1446,9 @@ def add_camera_view(request):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1363,6 +1474,9 @@ def edit_camera_view(request, camera_id):
         resolution_width = request.POST.get('resolution_width', str(camera.resolution_width))
         resolution_height = request.POST.get('resolution_height', str(camera.resolution_height))
         fps = request.POST.get('fps', str(camera.fps))
+        detection_width = request.POST.get('detection_width', str(camera.detection_width))
+        recognition_fps = request.POST.get('recognition_fps', str(camera.recognition_fps))
+        recognition_weight = request.POST.get('recognition_weight', str(camera.recognition_weight))
 
         # Validation
         if not name or not location:
@@ -1383,6 +1497,9 @@ def edit_camera_view(request, camera_id):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1405,6 +1522,9 @@ def edit_camera_view(request, camera_id):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1428,6 +1548,9 @@ def edit_camera_view(request, camera_id):
                         'resolution_width': resolution_width,
                         'resolution_height': resolution_height,
                         'fps': fps,
+                        'detection_width': detection_width,
+                        'recognition_fps': recognition_fps,
+                        'recognition_weight': recognition_weight,
                     }
                 })
             if not stream_url:
@@ -1448,6 +1571,9 @@ def edit_camera_view(request, camera_id):
                         'resolution_width': resolution_width,
                         'resolution_height': resolution_height,
                         'fps': fps,
+                        'detection_width': detection_width,
+                        'recognition_fps': recognition_fps,
+                        'recognition_weight': recognition_weight,
                     }
                 })
 
@@ -1459,6 +1585,9 @@ def edit_camera_view(request, camera_id):
             resolution_width = int(resolution_width)
             resolution_height = int(resolution_height)
             fps = int(fps)
+            detection_width = int(detection_width)
+            recognition_fps = float(recognition_fps)
+            recognition_weight = max(1, int(recognition_weight))
 
             # Update camera
             camera.name = name
@@ -1473,6 +1602,9 @@ def edit_camera_view(request, camera_id):
             camera.resolution_width = resolution_width
             camera.resolution_height = resolution_height
             camera.fps = fps
+            camera.detection_width = detection_width
+            camera.recognition_fps = recognition_fps
+            camera.recognition_weight = recognition_weight
             camera.save()
 
             messages.success(request, f"Camera '{name}' updated successfully.")
@@ -1496,6 +1628,9 @@ def edit_camera_view(request, camera_id):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
         except Exception as e:
@@ -1516,6 +1651,9 @@ def edit_camera_view(request, camera_id):
                     'resolution_width': resolution_width,
                     'resolution_height': resolution_height,
                     'fps': fps,
+                    'detection_width': detection_width,
+                    'recognition_fps': recognition_fps,
+                    'recognition_weight': recognition_weight,
                 }
             })
 
@@ -1554,35 +1692,19 @@ def set_default_camera(request, camera_id):
 @login_required
 @user_passes_test(is_admin)
 def test_camera_connection(request, camera_id):
-    """Test camera connection and update status."""
+    """Reports the camera's last health probe and schedules a fresh one in the background."""
     camera = get_object_or_404(Camera, pk=camera_id)
-
-    try:
-        # For now, we'll just simulate a connection test
-        # In a real implementation, you'd test the actual camera connection
-        if camera.camera_type == 'usb':
-            # Test USB camera availability
-            import cv2
-            cap = cv2.VideoCapture(camera.device_index)
-            if cap.isOpened():
-                camera.status = 'active'
-                messages.success(request, f"Camera '{camera.name}' connection test successful.")
-                cap.release()
-            else:
-                camera.status = 'offline'
-                messages.error(request, f"Camera '{camera.name}' not accessible.")
-        else:
-            # For IP cameras, we'd test the stream URL
-            # This is a placeholder - real implementation would test the RTSP/HTTP stream
-            camera.status = 'active'
-            messages.success(request, f"Camera '{camera.name}' connection test simulated.")
-
-        camera.save()
-
-    except Exception as e:
-        camera.status = 'offline'
-        camera.save()
-        messages.error(request, f"Error testing camera '{camera.name}': {e}")
+    camera_prober.request(camera.id)
+
+    if camera.last_probe_at is None:
+        messages.info(request, f"Camera '{camera.name}' is being tested. Refresh this page in a few seconds for the result.")
+    elif camera.probe_error:
+        messages.error(request, f"Camera '{camera.name}' not accessible at the last check ({timezone.localtime(camera.last_probe_at):%H:%M:%S}): {camera.probe_error} A new test is running.")
+    elif camera.probe_latency_ms is None:
+        messages.success(request, f"Camera '{camera.name}' was in use by camera ingestion at the last check ({timezone.localtime(camera.last_probe_at):%H:%M:%S}). A new test is running.")
+    else:
+        fps = f", {camera.probe_fps:.1f} fps" if camera.probe_fps else ""
+        messages.success(request, f"Camera '{camera.name}' reachable at the last check ({timezone.localtime(camera.last_probe_at):%H:%M:%S}): opened in {camera.probe_latency_ms:.0f} ms{fps}. A new test is running.")
 
     return redirect('manage_cameras')
 
@@ -1928,6 +2050,8 @@ def face_attendance_view(request):
         "selected_semester": selected_semester,
         "courses": courses,
         "semesters": semesters,
+        # Kiosk posts frames to the async endpoints when served over ASGI
+        "async_recognition_api": getattr(settings, 'ASYNC_RECOGNITION_API', False),
         # Initialize form values for manual marking
         "selected_student": None,
         "selected_date": "",
@@ -1961,6 +2085,8 @@ def face_attendance_view(request):
                         date=date,
                         defaults=defaults
                     )
+                    # Kiosk answers cached for this student are now stale
+                    recent_checkins.invalidate(student.id, date)
                     if created:
                         messages.success(request, f"Attendance manually marked for {student.name} on {date} as {status}.")
                     else:
@@ -1979,172 +2105,201 @@ def face_attendance_view(request):
     return render(request, 'core/face_attendance.html', context)
 
 
-# --- UPDATED: load_known_faces to use stored encodings ---
-known_face_encodings_global = []
-known_face_ids_global = []
+# --- Known faces live in a contiguous gallery (see core/face_gallery.py) ---
+# NOTE: The gallery is loaded lazily on the first recognition request rather
+# than at import time to prevent issues during migrations/checks.
 
-def load_known_faces():
+def read_frame_request(request):
     """
-    Loads face encodings and corresponding User IDs from the database.
-    This is more efficient than loading images. Run generate_encodings command first.
+    Decodes the camera frame and request options from a recognition request.
+    Accepts, in order of preference:
+      - a raw image/jpeg (or other image/*) body, options in the query string
+      - a multipart upload with the frame in an 'image' file field
+      - the legacy JSON body with a base64 'image_data' data URI
+    Returns (frame, options, error_response); error_response is None on success.
     """
-    global known_face_encodings_global, known_face_ids_global
-    
-    known_face_encodings_global = []
-    known_face_ids_global = []
-    
-    # Base query for students with encodings
-    students_with_encodings = User.objects.filter(
-        is_student=True, 
-        authorized=True, 
-        face_encoding__isnull=False
-    ).exclude(face_encoding='')
-    
-    print(f"[Face Load] Loading encodings for {students_with_encodings.count()} students from DB...") 
-    
-    for student in students_with_encodings:
-        encoding = student.get_encoding() # Use the method from the User model
-        if encoding is not None:
-            known_face_encodings_global.append(encoding)
-            known_face_ids_global.append(student.id)
-        else:
-            # This case indicates an error during decoding in get_encoding()
-             print(f"[Face Load Warning] Could not decode encoding for {student.username}")
-            
-    print(f"[Face Load] Loaded {len(known_face_encodings_global)} known encodings from DB.")
-
-# --- Load faces on server start ---
-# NOTE: Removed the call from here to prevent issues during migrations/checks
-# We will load it lazily in the recognize_face_view if it's empty
-# load_known_faces() 
-
-# --- VIEW FOR CHECKOUT API ---
-@csrf_exempt
-@require_POST
-@login_required
-@user_passes_test(is_admin)
-def checkout_student_view(request):
-    """Handle student check-out."""
-    
-    # Get selected course and semester from session
-    selected_course_id = request.session.get('selected_course_id')
-    selected_semester_id = request.session.get('selected_semester_id')
-    
-    if not selected_course_id or not selected_semester_id:
-        return JsonResponse({
-            'status': 'error', 
-            'message': 'No course and semester selected for attendance session.'
-        }, status=400)
-    
-    try:
-        data = json.loads(request.body)
-        image_data_uri = data.get('image_data')
-
+    content_type = request.content_type or ''
+
+    if content_type.startswith('image/'):
+        # Raw bytes go straight to the decoder: no base64 or JSON copies
+        image_bytes = request.body
+        options = request.GET
+    elif content_type.startswith('multipart/form-data'):
+        upload = request.FILES.get('image')
+        if upload is None:
+            return None, {}, JsonResponse({'status': 'error', 'message': 'No image file uploaded.'}, status=400)
+        image_bytes = upload.read()
+        options = request.POST
+    else:
+        try:
+            options = json.loads(request.body)
+        except json.JSONDecodeError:
+            return None, {}, JsonResponse({'status': 'error', 'message': 'Invalid JSON data received.'}, status=400)
+        image_data_uri = options.get('image_data')
         if not image_data_uri or ',' not in image_data_uri:
-            return JsonResponse({'status': 'error', 'message': 'Invalid image data format.'}, status=400)
-
-        # Decode and process the image
+            return None, options, JsonResponse({'status': 'error', 'message': 'Invalid image data format.'}, status=400)
         try:
             header, encoded = image_data_uri.split(',', 1)
-            image_data = base64.b64decode(encoded)
+            image_bytes = base64.b64decode(encoded)
         except (ValueError, TypeError) as e:
-            return JsonResponse({'status': 'error', 'message': f'Error decoding base64 image: {e}'}, status=400)
+            return None, options, JsonResponse({'status': 'error', 'message': f'Error decoding base64 image: {e}'}, status=400)
 
-        # Convert to OpenCV format
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if not image_bytes:
+        return None, options, JsonResponse({'status': 'error', 'message': 'Empty image data.'}, status=400)
 
-        if frame is None:
-            return JsonResponse({'status': 'error', 'message': 'Could not decode image data.'}, status=400)
+    # Convert to OpenCV format (numpy array)
+    frame = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        return None, options, JsonResponse({'status': 'error', 'message': 'Could not decode image data into frame.'}, status=400)
+    return frame, options, None
 
-        # Convert BGR to RGB
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Find faces in the image
-        face_locations = face_recognition.face_locations(rgb_frame, model="hog")
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+def option_enabled(options, name):
+    """Reads a boolean option sent either as JSON or as a query/form string."""
+    value = options.get(name)
+    if isinstance(value, str):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return bool(value)
 
-        if not face_encodings:
-            return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
+def busy_response(error):
+    """Explicit 'busy' answer when the recognition engine cannot take the frame."""
+    print(f"[Recognition Engine] {error}")
+    return JsonResponse({'status': 'busy', 'message': 'Recognition server is busy, please hold still.'}, status=503)
 
-        # Compare with known faces
-        if not known_face_encodings_global:
-            load_known_faces()
 
-        matches = face_recognition.compare_faces(known_face_encodings_global, face_encodings[0], tolerance=0.45)
-        face_distances = face_recognition.face_distance(known_face_encodings_global, face_encodings[0])
 
-        if len(face_distances) > 0:
-            best_match_index = np.argmin(face_distances)
-            best_distance = face_distances[best_match_index]
-            
-            # Debug logging for checkout
-            print(f"[Checkout Debug] Best match index: {best_match_index}")
-            print(f"[Checkout Debug] Best distance: {best_distance:.4f}")
-            print(f"[Checkout Debug] Tolerance check: {best_distance <= 0.45}")
-            
-            if matches[best_match_index]:
-                student_id = known_face_ids_global[best_match_index]
-                try:
-                    student = User.objects.get(id=student_id)
-                    
-                    # VALIDATE: Check if student belongs to the selected course and semester
-                    if str(student.course_id) != str(selected_course_id) or str(student.semester_id) != str(selected_semester_id):
-                        return JsonResponse({
-                            'status': 'session_mismatch',
-                            'name': student.name,
-                            'message': f'Choose correct session – student not in selected course/semester. Student is in {student.course.name} - {student.semester.name}.',
-                            'student_course': student.course.name if student.course else 'N/A',
-                            'student_semester': student.semester.name if student.semester else 'N/A'
-                        })
-                    
-                    current_datetime = timezone.localtime()
-                    today = current_datetime.date()
-                    now_time = current_datetime.time()
-
-                    # Try to find an existing attendance record for today
-                    try:
-                        record = AttendanceRecord.objects.get(
-                            student=student,
-                            date=today,
-                            check_in_time__isnull=False  # Must have checked in
-                        )
-                        
-                        if record.check_out_time:
-                            return JsonResponse({
-                                'status': 'already_checked_out',
-                                'name': student.name,
-                                'message': 'Already checked out today.'
-                            })
+def checkout_frame(frame, data, selected_course_id, selected_semester_id, stream_key=None):
+    """Recognizes the student in a decoded frame and records their check-out."""
+    # Convert BGR to RGB
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    # Detection, encoding and matching (selected course/semester first,
+    # whole school as fallback) run in the recognition engine's workers,
+    # scheduled fairly between cameras.
+    # Faces already tracked on this stream reuse their identity unencoded
+    try:
+        camera_key, weight = camera_schedule(data.get('camera_id'))
+        result = get_scheduler().recognize(
+            camera_key, rgb_frame, get_detection_width(data.get('camera_id')),
+            selected_course_id, selected_semester_id, tolerance=0.45,
+            tracks=face_tracker.snapshot(stream_key), weight=weight
+        )
+    except EngineBusy as e:
+        return busy_response(e)
+    face_tracker.update(stream_key, result)
+
+    if not result['matches']:
+        return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
+
+    student_id, best_distance, in_scope = result['matches'][0]
+
+    if best_distance is not None:
+        # Debug logging for checkout
+        print(f"[Checkout Debug] Best match student ID: {student_id}")
+        print(f"[Checkout Debug] Best distance: {best_distance:.4f}")
+        print(f"[Checkout Debug] Tolerance check: {best_distance <= 0.45}")
+
+        if student_id is not None:
+            try:
+                student = User.objects.get(id=student_id)
+
+                # VALIDATE: Check if student belongs to the selected course and semester
+                if not is_in_selected_session(student, selected_course_id, selected_semester_id):
+                    return JsonResponse(session_mismatch_payload(student))
 
-                        # Record check-out time
-                        record.check_out_time = now_time
-                        record.save()
+                current_datetime = timezone.localtime()
+                today = current_datetime.date()
+                now_time = current_datetime.time()
 
+                # Try to find an existing attendance record for today
+                try:
+                    record = AttendanceRecord.objects.get(
+                        student=student,
+                        date=today,
+                        check_in_time__isnull=False  # Must have checked in
+                    )
+
+                    if record.check_out_time:
                         return JsonResponse({
-                            'status': 'success',
+                            'status': 'already_checked_out',
                             'name': student.name,
-                            'message': f'Successfully checked out at {now_time.strftime("%I:%M %p")}'
+                            'message': 'Already checked out today.'
                         })
 
-                    except AttendanceRecord.DoesNotExist:
-                        return JsonResponse({
-                            'status': 'error',
-                            'message': 'No check-in record found for today.'
-                        })
+                    # Record check-out time
+                    record.check_out_time = now_time
+                    record.save()
 
-                except User.DoesNotExist:
+                    return JsonResponse({
+                        'status': 'success',
+                        'name': student.name,
+                        'message': f'Successfully checked out at {now_time.strftime("%I:%M %p")}'
+                    })
+
+                except AttendanceRecord.DoesNotExist:
                     return JsonResponse({
                         'status': 'error',
-                        'message': 'Student not found in database.'
+                        'message': 'No check-in record found for today.'
                     })
-            else:
-                print(f"[Checkout Debug] No match found. Best distance {best_distance:.4f} > tolerance 0.45")
 
+            except User.DoesNotExist:
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Student not found in database.'
+                })
+        else:
+            print(f"[Checkout Debug] No match found. Best distance {best_distance:.4f} > tolerance 0.45")
+
+    return JsonResponse({
+        'status': 'not_recognized',
+        'message': 'Face detected but not recognized.'
+    })
+
+@login_required
+@user_passes_test(is_admin)
+def recognition_stats_view(request):
+    """Per-camera recognition queue depth and latency of this web process, as JSON."""
+    scheduler = get_scheduler()
+    return JsonResponse({
+        'workers': scheduler.engine.workers,
+        'in_flight_limit': scheduler.slots,
+        'deadline': scheduler.deadline,
+        'cameras': scheduler.stats(),
+    })
+
+# --- VIEW FOR CHECKOUT API ---
+@csrf_exempt
+@require_POST
+@login_required
+@user_passes_test(is_admin)
+def checkout_student_view(request):
+    """Handle student check-out."""
+    
+    # Get selected course and semester from session
+    selected_course_id = request.session.get('selected_course_id')
+    selected_semester_id = request.session.get('selected_semester_id')
+    
+    if not selected_course_id or not selected_semester_id:
         return JsonResponse({
-            'status': 'not_recognized',
-            'message': 'Face detected but not recognized.'
-        })
+            'status': 'error', 
+            'message': 'No course and semester selected for attendance session.'
+        }, status=400)
+    
+    try:
+        # Raw image body, multipart upload or legacy base64 JSON
+        frame, data, error_response = read_frame_request(request)
+        if error_response is not None:
+            return error_response
+
+        # Skip frames that arrive too fast for this camera or show an unchanged scene
+        camera_id = data.get('camera_id')
+        gate_key = ('checkout', str(camera_id), str(selected_course_id), str(selected_semester_id))
+        cached, reason = frame_gate.check(gate_key, frame, get_recognition_fps(camera_id))
+        if reason is not None:
+            return gated_http_response(cached, reason)
+
+        response = checkout_frame(frame, data, selected_course_id, selected_semester_id, gate_key)
+        frame_gate.remember(gate_key, response)
+        return response
 
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON data received.'}, status=400)
@@ -2155,6 +2310,126 @@ def checkout_student_view(request):
         print("-----------------------------------------------------")
         return JsonResponse({'status': 'error', 'message': 'An internal server error occurred.'}, status=500)
 
+
+def recognize_frame(frame, data, selected_course_id, selected_semester_id, stream_key=None):
+    """Recognizes faces in a decoded frame and marks attendance."""
+    # Convert image from BGR (OpenCV default) to RGB (face_recognition default)
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    TOLERANCE = 0.45  # Stricter tolerance for better accuracy
+
+    # Find, encode and match faces in the recognition engine's worker pool.
+    # Detection ("hog" on CPU) runs on a copy downscaled to the camera's
+    # detection width; boxes are rescaled and encoded at full resolution.
+    # Matching tries the selected course/semester first; the full gallery is
+    # only searched as a fallback so session_mismatch can still be reported.
+    # Faces tracked from earlier frames of this stream keep their identity
+    # and skip encoding until the tracker's refresh interval. Frames wait in
+    # a per-camera queue so a busy camera cannot starve the others
+    try:
+        camera_key, weight = camera_schedule(data.get('camera_id'))
+        result = get_scheduler().recognize(
+            camera_key, rgb_frame, get_detection_width(data.get('camera_id')),
+            selected_course_id, selected_semester_id, tolerance=TOLERANCE,
+            tracks=face_tracker.snapshot(stream_key), weight=weight
+        )
+    except EngineBusy as e:
+        return busy_response(e)
+    face_tracker.update(stream_key, result)
+    # Very confident matches may be kept as extra encodings (off by default)
+    gallery_enricher.offer(result)
+
+    if not result['gallery_size']:
+        print("[Recognition View Error] Failed to load known faces.")
+        return JsonResponse({'status': 'error', 'message': 'Known face encodings not loaded on server.'}, status=500)
+
+    face_locations = result['locations']
+    matches = result['matches']
+
+    if not matches:
+         return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
+
+    # --- Multi-face mode: every face in the frame was matched at once ---
+    if option_enabled(data, 'multi_face'):
+        return JsonResponse(recognize_all_faces(
+            face_locations, matches, selected_course_id, selected_semester_id
+        ))
+
+    recognized_student_id = None
+    recognized_student_name = "Unknown"
+
+    # --- Face Matching Logic ---
+    # Use the match for the first detected face
+    matched_id, best_distance, in_scope = matches[0]
+
+    if best_distance is not None: 
+        # Debug logging for face matching
+        print(f"[Face Match Debug] Best match student ID: {matched_id} (in session: {in_scope})")
+        print(f"[Face Match Debug] Best distance: {best_distance:.4f}")
+        print(f"[Face Match Debug] Tolerance check: {best_distance <= TOLERANCE}")
+
+        if matched_id is not None:
+            # Already answered for this student today: reply without touching the DB
+            cached_payload = recent_checkins.get(selected_course_id, selected_semester_id, matched_id, timezone.localdate())
+            if cached_payload is not None:
+                return JsonResponse(cached_payload)
+
+            recognized_student_id = matched_id
+            try:
+                student = User.objects.get(id=recognized_student_id)
+                recognized_student_name = student.name
+                print(f"[Face Match Debug] Matched student: {student.name} (ID: {student.id})")
+            except User.DoesNotExist:
+                 recognized_student_id = None
+                 recognized_student_name = "ID Error"
+                 print(f"[Face Match Error] Recognized student ID {recognized_student_id} not found.")
+        else:
+            print(f"[Face Match Debug] No match found. Best distance {best_distance:.4f} > tolerance {TOLERANCE}")
+    else:
+         print("[Recognition Warning] Face gallery was empty.")
+
+
+
+    # --- Attendance Marking Logic ---
+    if recognized_student_id:
+        today = timezone.localdate()
+        now_time = timezone.localtime().time()
+
+        try:
+            student = User.objects.get(id=recognized_student_id)
+
+            # VALIDATE: Check if student belongs to the selected course and semester
+            if not is_in_selected_session(student, selected_course_id, selected_semester_id):
+                payload = session_mismatch_payload(student)
+                remember_check_in(selected_course_id, selected_semester_id, today, payload)
+                return JsonResponse(payload)
+
+            # Get current time in the correct timezone
+            current_datetime = timezone.localtime()
+            today = current_datetime.date()
+            now_time = current_datetime.time()
+
+            # Get cutoff times from settings and mark check-in
+            time_settings = AttendanceSettings.get_instance()
+            attendance_status, record_status = mark_check_in(student, today, now_time, time_settings)
+
+            payload = {
+                'status': 'success',
+                'name': recognized_student_name,
+                'user_id': recognized_student_id,
+                'attendance_status': attendance_status
+            }
+            remember_check_in(selected_course_id, selected_semester_id, today, payload, record_status)
+            return JsonResponse(payload)
+        except User.DoesNotExist:
+             return JsonResponse({'status': 'error', 'message': 'Recognized student ID not found.'}, status=500)
+        except Exception as e:
+             print(f"[Attendance Marking Error] {e}")
+             return JsonResponse({'status': 'error', 'message': 'Error marking attendance.'}, status=500)
+    else:
+        # Face detected but not matched
+        return JsonResponse({'status': 'not_recognized', 'message': 'Face detected, but not recognized.'})
+
 # --- VIEW FOR FACE RECOGNITION API ---
 @csrf_exempt 
 @require_POST 
@@ -2173,158 +2448,22 @@ def recognize_face_view(request):
             'message': 'No course and semester selected for attendance session.'
         }, status=400)
 
-    # --- Load known faces lazily or ensure they are loaded ---
-    # Load if empty, or periodically refresh if needed
-    if not known_face_encodings_global:
-         print("[Recognition View] known_face_encodings_global is empty. Attempting to load...")
-         load_known_faces()
-         if not known_face_encodings_global:
-              print("[Recognition View Error] Failed to load known faces.")
-              return JsonResponse({'status': 'error', 'message': 'Known face encodings not loaded on server.'}, status=500)
-
-
     try:
-        data = json.loads(request.body)
-        image_data_uri = data.get('image_data')
-
-        if not image_data_uri or ',' not in image_data_uri:
-            return JsonResponse({'status': 'error', 'message': 'Invalid image data format.'}, status=400)
-
-        # Decode base64 image data
-        try:
-            header, encoded = image_data_uri.split(',', 1)
-            image_data = base64.b64decode(encoded)
-        except (ValueError, TypeError) as e:
-             return JsonResponse({'status': 'error', 'message': f'Error decoding base64 image: {e}'}, status=400)
-        
-        # Convert to OpenCV format (numpy array)
-        nparr = np.frombuffer(image_data, np.uint8)
-        frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-
-        if frame is None:
-             return JsonResponse({'status': 'error', 'message': 'Could not decode image data into frame.'}, status=400)
-
-        # Convert image from BGR (OpenCV default) to RGB (face_recognition default)
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        
-        # Find face locations and encodings in the current frame
-        # Use "hog" for CPU (faster), "cnn" for GPU (more accurate)
-        face_locations = face_recognition.face_locations(rgb_frame, model="hog") 
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-
-
-        if not face_encodings:
-             return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
-
-        recognized_student_id = None
-        recognized_student_name = "Unknown"
-        
-        # --- Face Matching Logic ---
-        # Compare the first detected face against known faces
-        TOLERANCE = 0.45  # Stricter tolerance for better accuracy
-        matches = face_recognition.compare_faces(known_face_encodings_global, face_encodings[0], tolerance=TOLERANCE)
-        face_distances = face_recognition.face_distance(known_face_encodings_global, face_encodings[0])
-        
-        if len(face_distances) > 0: 
-            best_match_index = np.argmin(face_distances)
-            best_distance = face_distances[best_match_index]
-            
-            # Debug logging for face matching
-            print(f"[Face Match Debug] Best match index: {best_match_index}")
-            print(f"[Face Match Debug] Best distance: {best_distance:.4f}")
-            print(f"[Face Match Debug] Tolerance check: {best_distance <= TOLERANCE}")
-            print(f"[Face Match Debug] All distances: {[f'{d:.4f}' for d in face_distances[:5]]}")  # Show first 5
-            
-            if matches[best_match_index]:
-                recognized_student_id = known_face_ids_global[best_match_index]
-                try:
-                    student = User.objects.get(id=recognized_student_id)
-                    recognized_student_name = student.name
-                    print(f"[Face Match Debug] Matched student: {student.name} (ID: {student.id})")
-                except User.DoesNotExist:
-                     recognized_student_id = None
-                     recognized_student_name = "ID Error"
-                     print(f"[Face Match Error] Recognized student ID {recognized_student_id} not found.")
-            else:
-                print(f"[Face Match Debug] No match found. Best distance {best_distance:.4f} > tolerance {TOLERANCE}")
-        else:
-             print("[Recognition Warning] face_distances array was empty.")
-        
-
-
-        # --- Attendance Marking Logic ---
-        if recognized_student_id:
-            today = timezone.localdate()
-            now_time = timezone.localtime().time()
-            
-            try:
-                student = User.objects.get(id=recognized_student_id)
-                
-                # VALIDATE: Check if student belongs to the selected course and semester
-                if str(student.course_id) != str(selected_course_id) or str(student.semester_id) != str(selected_semester_id):
-                    return JsonResponse({
-                        'status': 'session_mismatch',
-                        'name': student.name,
-                        'message': f'Choose correct session – student not in selected course/semester. Student is in {student.course.name} - {student.semester.name}.',
-                        'student_course': student.course.name if student.course else 'N/A',
-                        'student_semester': student.semester.name if student.semester else 'N/A'
-                    })
-                
-                # Get current time in the correct timezone
-                current_datetime = timezone.localtime()
-                today = current_datetime.date()
-                now_time = current_datetime.time()
-
-                # Get cutoff times from settings
-                time_settings = AttendanceSettings.get_instance()
-                present_cutoff_time = time_settings.present_cutoff
-                late_cutoff_time = time_settings.late_cutoff
-                
-                # Determine attendance status based on time
-                if now_time <= present_cutoff_time:
-                    status = 'present'
-                elif now_time <= late_cutoff_time:
-                    status = 'late'
-                else:
-                    status = 'absent'
-                
-                # Use get_or_create: marks attendance only on the *first* recognition of the day
-                record, created = AttendanceRecord.objects.get_or_create(
-                    student=student,
-                    date=today,
-                    defaults={
-                        'status': status,
-                        'check_in_time': now_time,
-                        'manually_marked': False
-                    }
-                )
-
-                # If record exists but no check-in time, update it
-                if not created and not record.check_in_time:
-                    record.check_in_time = now_time
-                    record.status = status
-                    record.save()
-
-                if created:
-                    attendance_status = f"Marked {status.title()}"
-                else:
-                    # If already marked, don't change the status
-                    attendance_status = f"Already marked {record.status.title()}"
-
-                return JsonResponse({
-                    'status': 'success',
-                    'name': recognized_student_name,
-                    'user_id': recognized_student_id,
-                    'attendance_status': attendance_status
-                })
-            except User.DoesNotExist:
-                 return JsonResponse({'status': 'error', 'message': 'Recognized student ID not found.'}, status=500)
-            except Exception as e:
-                 print(f"[Attendance Marking Error] {e}")
-                 return JsonResponse({'status': 'error', 'message': 'Error marking attendance.'}, status=500)
-        else:
-            # Face detected but not matched
-            return JsonResponse({'status': 'not_recognized', 'message': 'Face detected, but not recognized.'})
+        # Raw image body, multipart upload or legacy base64 JSON
+        frame, data, error_response = read_frame_request(request)
+        if error_response is not None:
+            return error_response
+
+        # Skip frames that arrive too fast for this camera or show an unchanged scene
+        camera_id = data.get('camera_id')
+        gate_key = ('recognize', str(camera_id), str(selected_course_id), str(selected_semester_id))
+        cached, reason = frame_gate.check(gate_key, frame, get_recognition_fps(camera_id))
+        if reason is not None:
+            return gated_http_response(cached, reason)
+
+        response = recognize_frame(frame, data, selected_course_id, selected_semester_id, gate_key)
+        frame_gate.remember(gate_key, response)
+        return response
 
     except json.JSONDecodeError:
         return JsonResponse({'status': 'error', 'message': 'Invalid JSON data received.'}, status=400)
@@ -2335,6 +2474,188 @@ def recognize_face_view(request):
         print("-----------------------------------------------------")
         return JsonResponse({'status': 'error', 'message': f'An internal server error occurred.'}, status=500)
 
+# --- ASYNC RECOGNITION API (ASGI) ---
+# Same contract as recognize_face_view / checkout_student_view, but the request
+# awaits the recognition scheduler instead of holding a thread for the whole
+# dlib call, so one ASGI process can serve many kiosks at once. Single-face
+# check-in and check-out use the async ORM; multi-face check-in marks everyone
+# in one transaction and therefore runs recognize_all_faces in a thread.
+
+def async_admin_api(view):
+    """
+    @csrf_exempt + @require_POST + admin login check for async JSON views
+    (the stock decorators only wrap sync views in Django 4.2).
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        # request.user is loaded lazily from the session, which is a sync DB access
+        user_is_admin = await sync_to_async(lambda: is_admin(request.user))()
+        if not user_is_admin:
+            return redirect_to_login(request.get_full_path())
+        return await view(request, *args, **kwargs)
+    wrapper.csrf_exempt = True
+    return wrapper
+
+async def selected_attendance_session(request):
+    """(selected_course_id, selected_semester_id) stored in the session by face_attendance_view."""
+    return await sync_to_async(lambda: (
+        request.session.get('selected_course_id'),
+        request.session.get('selected_semester_id'),
+    ))()
+
+async def arecognize_in_frame(frame, data, selected_course_id, selected_semester_id, stream_key):
+    """Runs a decoded frame through the scheduler; returns the engine result or a busy JsonResponse."""
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    camera_id = data.get('camera_id')
+    detection_width, (camera_key, weight) = await sync_to_async(
+        lambda: (get_detection_width(camera_id), camera_schedule(camera_id))
+    )()
+    try:
+        result = await get_scheduler().arecognize(
+            camera_key, rgb_frame, detection_width,
+            selected_course_id, selected_semester_id, tolerance=0.45,
+            tracks=face_tracker.snapshot(stream_key), weight=weight
+        )
+    except EngineBusy as e:
+        return busy_response(e)
+    face_tracker.update(stream_key, result)
+    return result
+
+async def arecognize_frame(frame, data, selected_course_id, selected_semester_id, stream_key):
+    """Async recognize_frame: recognizes faces in a decoded frame and marks attendance."""
+    result = await arecognize_in_frame(frame, data, selected_course_id, selected_semester_id, stream_key)
+    if isinstance(result, HttpResponse):
+        return result
+    gallery_enricher.offer(result)
+
+    if not result['gallery_size']:
+        print("[Recognition View Error] Failed to load known faces.")
+        return JsonResponse({'status': 'error', 'message': 'Known face encodings not loaded on server.'}, status=500)
+    matches = result['matches']
+    if not matches:
+        return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
+
+    if option_enabled(data, 'multi_face'):
+        payload = await sync_to_async(recognize_all_faces)(
+            result['locations'], matches, selected_course_id, selected_semester_id
+        )
+        return JsonResponse(payload)
+
+    matched_id, best_distance, in_scope = matches[0]
+    if matched_id is None:
+        return JsonResponse({'status': 'not_recognized', 'message': 'Face detected, but not recognized.'})
+
+    current_datetime = timezone.localtime()
+    today = current_datetime.date()
+    now_time = current_datetime.time()
+
+    # Already answered for this student today: reply without touching the DB
+    cached_payload = await recent_checkins.aget(selected_course_id, selected_semester_id, matched_id, today)
+    if cached_payload is not None:
+        return JsonResponse(cached_payload)
+
+    student = await User.objects.select_related('course', 'semester').filter(id=matched_id).afirst()
+    if student is None:
+        return JsonResponse({'status': 'error', 'message': 'Recognized student ID not found.'}, status=500)
+
+    if not is_in_selected_session(student, selected_course_id, selected_semester_id):
+        payload = session_mismatch_payload(student)
+        await aremember_check_in(selected_course_id, selected_semester_id, today, payload)
+        return JsonResponse(payload)
+
+    time_settings = await sync_to_async(AttendanceSettings.get_instance)()
+    attendance_status, record_status = await amark_check_in(student, today, now_time, time_settings)
+    payload = {
+        'status': 'success',
+        'name': student.name,
+        'user_id': student.id,
+        'attendance_status': attendance_status
+    }
+    await aremember_check_in(selected_course_id, selected_semester_id, today, payload, record_status)
+    return JsonResponse(payload)
+
+async def acheckout_frame(frame, data, selected_course_id, selected_semester_id, stream_key):
+    """Async checkout_frame: recognizes the student in a decoded frame and records their check-out."""
+    result = await arecognize_in_frame(frame, data, selected_course_id, selected_semester_id, stream_key)
+    if isinstance(result, HttpResponse):
+        return result
+    if not result['matches']:
+        return JsonResponse({'status': 'no_face', 'message': 'No face detected.'})
+
+    student_id, best_distance, in_scope = result['matches'][0]
+    if student_id is None:
+        return JsonResponse({'status': 'not_recognized', 'message': 'Face detected but not recognized.'})
+
+    student = await User.objects.select_related('course', 'semester').filter(id=student_id).afirst()
+    if student is None:
+        return JsonResponse({'status': 'error', 'message': 'Student not found in database.'})
+    if not is_in_selected_session(student, selected_course_id, selected_semester_id):
+        return JsonResponse(session_mismatch_payload(student))
+
+    current_datetime = timezone.localtime()
+    today = current_datetime.date()
+    now_time = current_datetime.time()
+
+    record = await AttendanceRecord.objects.filter(
+        student=student, date=today, check_in_time__isnull=False
+    ).afirst()
+    if record is None:
+        return JsonResponse({'status': 'error', 'message': 'No check-in record found for today.'})
+    if record.check_out_time:
+        return JsonResponse({'status': 'already_checked_out', 'name': student.name, 'message': 'Already checked out today.'})
+
+    await AttendanceRecord.objects.filter(pk=record.pk).aupdate(check_out_time=now_time)
+    return JsonResponse({
+        'status': 'success',
+        'name': student.name,
+        'message': f'Successfully checked out at {now_time.strftime("%I:%M %p")}'
+    })
+
+async def handle_async_frame_request(request, endpoint, process):
+    """Shared body of the async kiosk endpoints: session check, decoding, frame gate, processing."""
+    selected_course_id, selected_semester_id = await selected_attendance_session(request)
+    if not selected_course_id or not selected_semester_id:
+        return JsonResponse({
+            'status': 'error',
+            'message': 'No course and semester selected for attendance session.'
+        }, status=400)
+
+    try:
+        frame, data, error_response = read_frame_request(request)
+        if error_response is not None:
+            return error_response
+
+        camera_id = data.get('camera_id')
+        gate_key = (endpoint, str(camera_id), str(selected_course_id), str(selected_semester_id))
+        max_fps = await sync_to_async(get_recognition_fps)(camera_id)
+        cached, reason = frame_gate.check(gate_key, frame, max_fps)
+        if reason is not None:
+            return gated_http_response(cached, reason)
+
+        response = await process(frame, data, selected_course_id, selected_semester_id, gate_key)
+        frame_gate.remember(gate_key, response)
+        return response
+
+    except Exception:
+        import traceback
+        print(f"------ UNEXPECTED ERROR in async {endpoint} view ------")
+        traceback.print_exc()
+        print("-----------------------------------------------------")
+        return JsonResponse({'status': 'error', 'message': 'An internal server error occurred.'}, status=500)
+
+@async_admin_api
+async def recognize_face_async_view(request):
+    """Async recognize_face_view for ASGI deployments."""
+    # Shares frame gate state with the sync endpoint, so switching is seamless
+    return await handle_async_frame_request(request, 'recognize', arecognize_frame)
+
+@async_admin_api
+async def checkout_student_async_view(request):
+    """Async checkout_student_view for ASGI deployments."""
+    return await handle_async_frame_request(request, 'checkout', acheckout_frame)
+
 # -----------------------
 # Student Views
 # -----------------------